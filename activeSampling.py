@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""
+Active sampling of the parameter space. Runs a first wave of realisations
+spread over the parameter ranges (a Latin hypercube), fits a surrogate of
+the probability of eradication to them (see pheromone/surrogate.py) and
+runs each following wave where the surrogate is least sure which side of
+the eradication boundary a point is on, refitting in between. Stops after
+--nwaves waves or when little of the space is still uncertain.
+
+The ranges are those of PheromoneParams unless given with --range. The
+results are saved after every wave as columns (see pheromone/analytics.py)
+with the wave and the point in the unit cube of each realisation, and
+--resume carries on from them. With --cache the realisations already run
+(same parameters, inputs, seed and code) come from that cache (see
+pheromone/cache.py).
+"""
+
+import os
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from pheromone import calculation
+from pheromone import analytics
+from pheromone import surrogate
+from pheromone import cache
+from pheromone import params
+
+def runOne(job):
+    """
+    Run a single realisation. job is (pars, seed, cacheDir, cacheBytes),
+    cacheDir None for no cache.
+    """
+    pars, seed, cacheDir, cacheBytes = job
+    if cacheDir is None:
+        np.random.seed(seed)
+        calculation.seedKernelRandom(seed)
+        return calculation.runModel(pars, save=False)
+    resultCache = cache.ResultCache(cacheDir, cacheBytes)
+    result = cache.runCached(resultCache, pars, seed)
+    resultCache.close()
+    return result
+
+def runWave(pars, box, unit, firstSeed, nCpus, cacheDir=None,
+            cacheBytes=cache.DEFAULT_MAX_BYTES):
+    """
+    Run a realisation at each point of unit. Returns the tuples from runModel.
+    """
+    values = surrogate.fromUnit(box, unit)
+    jobs = [(surrogate.setParameterPoint(pars, box, values[i]), firstSeed + i,
+                cacheDir, cacheBytes) for i in range(unit.shape[0])]
+    pool = multiprocessing.Pool(nCpus)
+    results = pool.map(runOne, jobs)
+    pool.close()
+    pool.join()
+    return results
+
+def addResults(columns, results, box, unit, wave):
+    """
+    Append the results of a wave to columns
+    """
+    for i, (name, dtype) in enumerate(analytics.RESULT_FIELDS):
+        columns[name] = np.append(columns[name], np.array([result[i]
+                    for result in results], dtype=dtype))
+    columns['wave'] = np.append(columns['wave'], np.full(len(results), wave))
+    for i, name in enumerate(box.names):
+        columns['unit_' + name] = np.append(columns['unit_' + name], unit[:, i])
+
+def makeColumns(box):
+    columns = {name : np.empty(0, dtype=dtype) for name, dtype in analytics.RESULT_FIELDS}
+    columns['wave'] = np.empty(0, dtype=np.int64)
+    for name in box.names:
+        columns['unit_' + name] = np.empty(0)
+    return columns
+
+def getUnitPoints(columns, box):
+    return np.column_stack([columns['unit_' + name] for name in box.names])
+
+def makePars(cmdargs):
+    pars = params.PheromoneParams()
+    pars.setExtentMask(cmdargs.mask)
+    pars.setTrapsFile(cmdargs.traps)
+    for name, low, high in cmdargs.range:
+        if name not in [name for name, isInteger in surrogate.SURROGATE_PARAMETERS]:
+            raise SystemExit('Can only set the range of ' + ', '.join([name
+                    for name, isInteger in surrogate.SURROGATE_PARAMETERS]))
+        setattr(pars, name, [float(low), float(high)])
+    return pars
+
+def getCmdargs():
+    inputDataPath = os.path.join(os.getenv('PROJDIR', default='.'), 'pheromoneWork', 'Data')
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--mask', default=os.path.join(inputDataPath, 'ressy.img'),
+        help='Extent mask (default=%(default)s)')
+    p.add_argument('--traps', default=os.path.join(inputDataPath,
+        'ressyalldatatraploc5.csv'), help='Traps file (default=%(default)s)')
+    p.add_argument('--range', nargs=3, action='append', default=[],
+        metavar=('NAME', 'LOW', 'HIGH'),
+        help='Range of a parameter of PheromoneParams to sample (can be repeated)')
+    p.add_argument('-o', '--output', default='activeResults.npz',
+        help='Columns of the results so far (default=%(default)s)')
+    p.add_argument('--resume', default=False, action='store_true',
+        help='Carry on from the results in --output')
+    p.add_argument('--initial', type=int, default=64,
+        help='Realisations in the first wave (default=%(default)s)')
+    p.add_argument('--wave', type=int, default=32,
+        help='Realisations in each later wave (default=%(default)s)')
+    p.add_argument('--nwaves', type=int, default=10,
+        help='Most waves to run, including the first (default=%(default)s)')
+    p.add_argument('--tolerance', type=float, default=0.02,
+        help='Stop when less than this fraction of the space is uncertain ' +
+            '(default=%(default)s)')
+    p.add_argument('--candidates', type=int, default=5000,
+        help='Random points each wave is picked from (default=%(default)s)')
+    p.add_argument('--mindistance', type=float, default=surrogate.DEFAULT_MIN_DISTANCE,
+        help='Least distance between points of a wave in the unit cube ' +
+            '(default=%(default)s)')
+    p.add_argument('--beta', type=float, default=surrogate.DEFAULT_BETA,
+        help='Standard deviations of the logit counted as uncertain (default=%(default)s)')
+    p.add_argument('--penalty', type=float, default=surrogate.DEFAULT_PENALTY,
+        help='Ridge penalty of the surrogate (default=%(default)s)')
+    p.add_argument('--seed', type=int, default=0,
+        help='Seed for picking the points (default=%(default)s)')
+    p.add_argument('--ncpus', type=int, default=multiprocessing.cpu_count(),
+        help='Number of worker processes (default=%(default)s)')
+    p.add_argument('--cache',
+        help='Directory of a cache of results to reuse and add to')
+    p.add_argument('--cachegb', type=float, default=cache.DEFAULT_MAX_BYTES / 1024 ** 3,
+        help='Most GB the cache can take (default=%(default)s)')
+    p.add_argument('-x', '--xname', default='decoySpacing',
+        help='Parameter to show the surrogate over at the end (default=%(default)s)')
+    p.add_argument('-y', '--yname',
+        help='Second parameter to show the surrogate over')
+    p.add_argument('--bins', type=int, default=analytics.DEFAULT_BINS,
+        help='Bins of each parameter shown (default=%(default)s)')
+    return p.parse_args()
+
+def main():
+    cmdargs = getCmdargs()
+    pars = makePars(cmdargs)
+    box = surrogate.getParameterBox(pars)
+    if len(box.names) == 0:
+        raise SystemExit('No parameter has a range to sample')
+    for name in (cmdargs.xname, cmdargs.yname):
+        if name is not None and name not in box.names:
+            raise SystemExit('{} is not one of the parameters sampled'.format(name))
+    print('Sampling', ', '.join(['{} {:g}-{:g}'.format(name, lower, upper) for
+            name, lower, upper in zip(box.names, box.lower, box.upper)]))
+
+    if cmdargs.resume and os.path.exists(cmdargs.output):
+        columns = analytics.loadColumns(cmdargs.output)
+        wave = int(columns['wave'].max()) + 1
+    else:
+        columns = makeColumns(box)
+        wave = 0
+
+    while wave < cmdargs.nwaves:
+        # different points each wave, but the same ones if resumed
+        rng = np.random.RandomState([cmdargs.seed, wave])
+        unit = getUnitPoints(columns, box)
+        candidates = rng.uniform(size=(cmdargs.candidates, len(box.names)))
+        if unit.shape[0] == 0:
+            newUnit = surrogate.latinHypercube(cmdargs.initial, len(box.names), rng)
+        else:
+            model = surrogate.fitSurrogate(unit, columns['eradicated'], cmdargs.penalty)
+            uncertain = surrogate.getUncertainFraction(model, candidates, cmdargs.beta)
+            print('Wave {} {:.1%} of the space uncertain'.format(wave, uncertain))
+            if uncertain < cmdargs.tolerance:
+                break
+            newUnit = surrogate.selectWave(model, candidates, cmdargs.wave,
+                    cmdargs.mindistance, cmdargs.beta)
+        newUnit = surrogate.snapUnit(box, newUnit)
+
+        start = time.time()
+        results = runWave(pars, box, newUnit, unit.shape[0], cmdargs.ncpus,
+                cmdargs.cache, int(cmdargs.cachegb * 1024 ** 3))
+        addResults(columns, results, box, newUnit, wave)
+        analytics.saveColumns(columns, cmdargs.output)
+        print('Wave {} ran {} realisations in {:.1f}s, {} eradicated'.format(wave,
+                len(results), time.time() - start, sum([result[0] for result in results])))
+        wave += 1
+
+    unit = getUnitPoints(columns, box)
+    model = surrogate.fitSurrogate(unit, columns['eradicated'], cmdargs.penalty)
+    print('Realisations', unit.shape[0])
+    surface = surrogate.getSurrogateSurface(model, box, unit, columns['eradicated'],
+            cmdargs.xname, cmdargs.yname, cmdargs.bins, beta=cmdargs.beta,
+            rng=np.random.RandomState(cmdargs.seed))
+    print(analytics.formatSurface(surface))
+
+if __name__ == '__main__':
+    main()
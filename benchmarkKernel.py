@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+"""
+Benchmark suite for the model using synthetic islands and trap grids, so it
+runs without ressy.img or GDAL. Times makePheromoneArray, runRealisation and
+the whole of runModel while varying the island, decoy spacing, population
+size and season length one at a time around a baseline, and writes the
+results to a JSON file so versions can be compared.
+"""
+
+import os
+import json
+import time
+import socket
+import platform
+import datetime
+import argparse
+import subprocess
+import numpy as np
+import numba
+from pheromone import calculation
+from pheromone import params
+from pheromone import synthetic
+
+# name, nCols, nRows, land fraction, coastline complexity
+ISLANDS = {'small' : (300, 200, 0.6, 2),
+           'medium' : (700, 500, 0.5, 4),
+           'large' : (1400, 1000, 0.45, 8),
+           'ragged' : (700, 500, 0.35, 16)}
+BASELINE = {'island' : 'medium', 'decoySpacing' : 1000, 'nAdd' : 6,
+            'seasonDays' : 90}
+SWEEPS = {'island' : ['small', 'medium', 'large', 'ragged'],
+          'decoySpacing' : [500, 1000, 2000],
+          'nAdd' : [2, 6, 20],
+          'seasonDays' : [60, 90, 180]}
+TRAP_SPACING = 200
+# days each case is run for before it is timed
+WARM_UP_DAYS = 2
+
+
+def getCases(quick):
+    """
+    The baseline case and each factor swept while the others stay at
+    the baseline. Returns a list of dictionaries.
+    """
+    cases = [dict(BASELINE)]
+    if quick:
+        return cases
+    for factor, values in SWEEPS.items():
+        for value in values:
+            if value == BASELINE[factor]:
+                continue
+            case = dict(BASELINE)
+            case[factor] = value
+            cases.append(case)
+    return cases
+
+
+def getCaseName(case):
+    return '{}_s{}_n{}_d{}'.format(case['island'], case['decoySpacing'],
+            case['nAdd'], case['seasonDays'])
+
+
+def makeParams(case):
+    pars = params.PheromoneParams()
+    pars.decoySpacing = [case['decoySpacing'], case['decoySpacing'] + 1]
+    pars.meanNAdd = [case['nAdd'], case['nAdd'] + 1]
+    pars.endDate = pars.startDate + datetime.timedelta(days=case['seasonDays'])
+    return pars
+
+
+def seedAll(seed):
+    np.random.seed(seed)
+    calculation.seedKernelRandom(seed)
+
+
+def warmUp(pars, maskData, trapsArray):
+    """
+    Compile the kernel variant for pars (see calculation.getKernelVariant) 
+    on the first days of its season so compilation isn't timed. A shorter
+    season might have no release or trapping days and compile another one.
+    """
+    seedAll(0)
+    inputs = calculation.prepareRealisation(pars, save=False, maskData=maskData,
+            trapsArray=trapsArray)
+    calculation.callRealisation(pars, inputs, stopDay=WARM_UP_DAYS)
+
+
+def timeCase(case, maskData, trapsArray, nRepeats, seed):
+    """
+    Time one case. Returns a dictionary of results.
+    """
+    pars = makeParams(case)
+    (mask, transform, tlx, tly, brx, bry, pixSize) = maskData
+    warmUp(pars, maskData, trapsArray)
+
+    start = time.perf_counter()
+    for i in range(nRepeats):
+        pheromoneArray = calculation.makePheromoneArray(mask, tlx, tly, brx, bry,
+                pixSize, case['decoySpacing'], transform)
+    pheromoneTime = (time.perf_counter() - start) / nRepeats
+
+    kernelTime = 0.0
+    stoatHours = 0
+    for i in range(nRepeats):
+        seedAll(seed + i)
+        inputs = calculation.prepareRealisation(pars, save=False, maskData=maskData,
+                trapsArray=trapsArray)
+        start = time.perf_counter()
+        calculation.callRealisation(pars, inputs)
+        kernelTime += time.perf_counter() - start
+        stoatHours += int(inputs.kernelState[0]['stoatHours'])
+
+    start = time.perf_counter()
+    for i in range(nRepeats):
+        seedAll(seed + i)
+        calculation.runModel(pars, save=False, maskData=maskData, trapsArray=trapsArray)
+    runModelTime = (time.perf_counter() - start) / nRepeats
+
+    result = dict(case)
+    result['name'] = getCaseName(case)
+    result['nDecoys'] = int(pheromoneArray.shape[0])
+    result['nTraps'] = int(trapsArray.shape[0])
+    result['landPixels'] = int((mask > 0).sum())
+    result['makePheromoneArraySecs'] = pheromoneTime
+    result['runRealisationSecs'] = kernelTime / nRepeats
+    result['runModelSecs'] = runModelTime
+    result['stoatHours'] = stoatHours / nRepeats
+    if kernelTime > 0:
+        result['stoatHoursPerSec'] = stoatHours / kernelTime
+    else:
+        result['stoatHoursPerSec'] = 0.0
+    return result
+
+
+def getGitCommit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return commit
+
+
+def getMetadata():
+    return {'date' : datetime.datetime.now().isoformat(),
+            'host' : socket.gethostname(),
+            'platform' : platform.platform(),
+            'python' : platform.python_version(),
+            'numpy' : np.__version__,
+            'numba' : numba.__version__,
+            'numbaThreads' : numba.config.NUMBA_NUM_THREADS,
+            'gitCommit' : getGitCommit()}
+
+
+def compareResults(results, oldFile):
+    """
+    Print the change in throughput against a previous results file
+    """
+    old = json.load(open(oldFile))
+    oldByName = {r['name'] : r for r in old['results']}
+    print('Change in stoat-hours per second against', oldFile)
+    for r in results:
+        if r['name'] in oldByName and oldByName[r['name']]['stoatHoursPerSec'] > 0:
+            ratio = r['stoatHoursPerSec'] / oldByName[r['name']]['stoatHoursPerSec']
+            print('{:30s} {:8.2f}x'.format(r['name'], ratio))
+
+
+def getCmdargs():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('-o', '--output', default='benchmark.json',
+        help='JSON file to write results to (default=%(default)s)')
+    p.add_argument('--repeats', type=int, default=3,
+        help='Realisations timed for each case (default=%(default)s)')
+    p.add_argument('--seed', type=int, default=1,
+        help='First seed (default=%(default)s)')
+    p.add_argument('--quick', action='store_true', default=False,
+        help='Only run the baseline case')
+    p.add_argument('--compare',
+        help='Previous results file to compare throughput with')
+    return p.parse_args()
+
+
+def main():
+    cmdargs = getCmdargs()
+
+    islands = {}
+    for name, (nCols, nRows, landFraction, complexity) in ISLANDS.items():
+        maskData = synthetic.makeIslandMask(nCols, nRows, landFraction, complexity)
+        trapsArray = synthetic.makeTrapGrid(maskData, TRAP_SPACING)
+        islands[name] = (maskData, trapsArray)
+
+    results = []
+    for case in getCases(cmdargs.quick):
+        maskData, trapsArray = islands[case['island']]
+        result = timeCase(case, maskData, trapsArray, cmdargs.repeats, cmdargs.seed)
+        print('{:30s} decoys {:6d} kernel {:8.2f}s runModel {:8.2f}s {:10.0f} stoat-hours/s'.format(
+            result['name'], result['nDecoys'], result['runRealisationSecs'],
+            result['runModelSecs'], result['stoatHoursPerSec']))
+        results.append(result)
+
+    output = {'metadata' : getMetadata(), 'results' : results}
+    json.dump(output, open(cmdargs.output, 'w'), indent=2)
+    print('Results written to', cmdargs.output)
+
+    if cmdargs.compare is not None:
+        compareResults(results, cmdargs.compare)
+
+if __name__ == '__main__':
+    main()
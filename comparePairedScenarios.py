@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Compares the probability of eradication of two scenarios with common random
+numbers (params.commonRandomSeed). Realisation i of each scenario is run with
+seed i so the two only differ where the scenarios do, and the difference is
+estimated from the pairs. Scenario A has decoys at --spacinga and scenario B
+at --spacingb, or no decoys at all with --nodecoys.
+"""
+
+import os
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from pheromone import calculation
+from pheromone import analytics
+from pheromone import params
+
+def runOne(job):
+    """
+    Run a single realisation. job is (pars, seed)
+    """
+    pars, seed = job
+    pars.commonRandomSeed = seed
+    result = calculation.runModel(pars, save=False)
+    return result[0]
+
+def runScenario(pars, nIterations, nCpus):
+    """
+    Returns the eradication results for each seed and the time taken
+    """
+    jobs = [(pars, seed) for seed in range(nIterations)]
+    start = time.time()
+    pool = multiprocessing.Pool(nCpus)
+    eradicated = pool.map(runOne, jobs)
+    pool.close()
+    pool.join()
+    return np.array(eradicated, dtype=bool), time.time() - start
+
+def makeScenario(cmdargs, spacing, decoys=True):
+    pars = params.PheromoneParams()
+    pars.setExtentMask(cmdargs.mask)
+    pars.setTrapsFile(cmdargs.traps)
+    ## a range of one metre so every realisation has this spacing
+    pars.decoySpacing = [spacing, spacing + 1]
+    if not decoys:
+        pars.pheromoneReleaseDayMonths = []
+    return pars
+
+def getCmdargs():
+    inputDataPath = os.path.join(os.getenv('PROJDIR', default='.'), 'pheromoneWork', 'Data')
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--mask', default=os.path.join(inputDataPath, 'ressy.img'),
+        help='Extent mask (default=%(default)s)')
+    p.add_argument('--traps', default=os.path.join(inputDataPath,
+        'ressyalldatatraploc5.csv'), help='Traps file (default=%(default)s)')
+    p.add_argument('--spacinga', type=float, default=500,
+        help='Decoy spacing of scenario A (default=%(default)s)')
+    p.add_argument('--spacingb', type=float, default=1000,
+        help='Decoy spacing of scenario B (default=%(default)s)')
+    p.add_argument('--nodecoys', default=False, action='store_true',
+        help='Scenario B has no decoys')
+    p.add_argument('--niterations', type=int, default=200,
+        help='Realisations (pairs) for each scenario (default=%(default)s)')
+    p.add_argument('--ncpus', type=int, default=multiprocessing.cpu_count(),
+        help='Number of worker processes (default=%(default)s)')
+    p.add_argument('--confidence', type=float, default=analytics.DEFAULT_CONFIDENCE,
+        help='Confidence of the interval on the difference (default=%(default)s)')
+    return p.parse_args()
+
+def main():
+    cmdargs = getCmdargs()
+    parsA = makeScenario(cmdargs, cmdargs.spacinga)
+    parsB = makeScenario(cmdargs, cmdargs.spacingb, not cmdargs.nodecoys)
+
+    n = cmdargs.niterations
+    eradicatedA, timeA = runScenario(parsA, n, cmdargs.ncpus)
+    eradicatedB, timeB = runScenario(parsB, n, cmdargs.ncpus)
+
+    if cmdargs.nodecoys:
+        print('A: decoys at {:.0f}m ({:.1f}s), B: no decoys ({:.1f}s)'.format(
+                cmdargs.spacinga, timeA, timeB))
+    else:
+        print('A: decoys at {:.0f}m ({:.1f}s), B: decoys at {:.0f}m ({:.1f}s)'.format(
+                cmdargs.spacinga, timeA, cmdargs.spacingb, timeB))
+    paired = analytics.getPairedDifference(eradicatedA, eradicatedB, cmdargs.confidence)
+    print(analytics.formatPairedDifference(paired))
+    print('{} of {} pairs had the same outcome'.format((eradicatedA == eradicatedB).sum(), n))
+
+if __name__ == '__main__':
+    main()
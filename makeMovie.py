@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+Make a movie (or a sequence of PNG images) of a run saved by
+runModel(save=True). The frames are read from stoats.npz a chunk at a time
+and rendered in parallel by a pool of processes, then written out in order
+as they arrive, so the whole run is never held in memory.
+A video needs ffmpeg on the PATH.
+"""
+
+import os
+import time
+import pickle
+import shutil
+import argparse
+import datetime
+import subprocess
+import collections
+import multiprocessing
+import numpy as np
+from matplotlib import image
+from pheromone import movie
+from pheromone import params
+
+# outputs with these extensions are encoded as a video, otherwise
+# the output is a directory of PNG files
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv')
+# largest mask drawn, relative to the size of the image
+MAX_MASK_SCALE = 2
+
+# the renderer for this worker process
+workerRenderer = None
+
+
+def initWorker(traps, pheromones, extent, mask, width, height, decayTemporal):
+    global workerRenderer
+    workerRenderer = movie.FrameRenderer(traps, pheromones, extent, mask, width,
+                height, decayTemporal=decayTemporal)
+
+def renderJob(job):
+    """
+    Render the frames of a job. job is (frames, outputDir) where frames is
+    a list of (index, live, title, trapping, daysSincePheromone). Writes
+    them to outputDir if it is given, otherwise returns them as bytes.
+    """
+    frames, outputDir = job
+    images = []
+    for index, live, title, trapping, daysSincePheromone in frames:
+        rgba = workerRenderer.draw(live, title, trapping, daysSincePheromone)
+        if outputDir is not None:
+            image.imsave(os.path.join(outputDir, 'frame{:07d}.png'.format(index)), rgba)
+        else:
+            images.append(rgba.tobytes())
+    return len(frames), images
+
+
+def loadParams(paramsFile):
+    """
+    The params pickled by runModel next to stoats.npz, or the defaults
+    """
+    if paramsFile is not None and os.path.exists(paramsFile):
+        fileobj = open(paramsFile, 'rb')
+        pars = pickle.load(fileobj)
+        fileobj.close()
+    else:
+        print('No', paramsFile, 'using default parameters for the dates')
+        pars = params.PheromoneParams()
+    return pars
+
+def loadDisplayMask(maskFile, width, height):
+    """
+    maskData for the extent mask with the mask cut down to about the
+    size of the image, or None if there is no mask
+    """
+    if maskFile is None:
+        return None
+    # only needed (along with GDAL) if drawing the mask
+    from pheromone import calculation
+    (mask, transform, tlx, tly, brx, bry, pixSize) = calculation.readMask(maskFile)
+    step = max(1, min(mask.shape[0] // (height * MAX_MASK_SCALE),
+                mask.shape[1] // (width * MAX_MASK_SCALE)))
+    return mask[::step, ::step], transform, tlx, tly, brx, bry, pixSize
+
+def getTitle(pars, index):
+    day, hour = divmod(index, pars.hoursPerDay)
+    date = pars.startDate + datetime.timedelta(days=day)
+    return '{} day {} hour {}'.format(date.isoformat(), day, hour)
+
+def makeJobs(reader, cmdargs, pars, trappingDays, daysSincePheromone, outputDir):
+    """
+    Yields the jobs for renderJob, reading the frames as it goes
+    """
+    trappingDays = set() if trappingDays is None else set(trappingDays)
+    end = reader.nFrames if cmdargs.end is None else min(cmdargs.end, reader.nFrames)
+    reader.skip(cmdargs.start)
+    frames = []
+    for first, chunk in reader.iterChunks(cmdargs.chunk):
+        for i in range(chunk.shape[0]):
+            index = first + i
+            if index >= end or not movie.isRecordedFrame(chunk[i]):
+                # past the end of what we want or of the run
+                if len(frames) > 0:
+                    yield frames, outputDir
+                return
+            if (index - cmdargs.start) % cmdargs.step != 0:
+                continue
+            day = index // pars.hoursPerDay
+            frames.append((index, movie.getLiveStoats(chunk[i]), getTitle(pars, index),
+                        day in trappingDays, int(daysSincePheromone[index])))
+            if len(frames) == cmdargs.chunk:
+                yield frames, outputDir
+                frames = []
+    if len(frames) > 0:
+        yield frames, outputDir
+
+def startEncoder(cmdargs):
+    if shutil.which('ffmpeg') is None:
+        raise SystemExit('ffmpeg is needed to write ' + cmdargs.output)
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+            '-s', '{}x{}'.format(cmdargs.width, cmdargs.height),
+            '-r', str(cmdargs.fps), '-i', '-', '-pix_fmt', 'yuv420p', cmdargs.output]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+
+def collectJob(result, encoder):
+    """
+    Wait for a job and send its frames to the encoder if making a video.
+    Returns the number of frames.
+    """
+    nDone, images = result.get()
+    if encoder is not None:
+        for rgba in images:
+            encoder.stdin.write(rgba)
+    return nDone
+
+
+def getCmdargs():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('-i', '--input', default='stoats.npz',
+        help='stoats.npz written by runModel (default=%(default)s)')
+    p.add_argument('-p', '--params',
+        help='Params pickled by runModel (default=stoatsparams.pkl next to --input)')
+    p.add_argument('-o', '--output', default='movie.mp4',
+        help='Video file ({}) or directory for PNG frames (default=%(default)s)'.format(
+            ', '.join(VIDEO_EXTENSIONS)))
+    p.add_argument('--mask',
+        help='Extent mask to draw under the stoats (needs GDAL)')
+    p.add_argument('--start', type=int, default=0,
+        help='First frame (hour of the run) to draw (default=%(default)s)')
+    p.add_argument('--end', type=int,
+        help='Stop before this frame (default=end of the run)')
+    p.add_argument('--step', type=int, default=1,
+        help='Draw every step-th frame (default=%(default)s)')
+    p.add_argument('--chunk', type=int, default=48,
+        help='Frames read and rendered at a time by each process (default=%(default)s)')
+    p.add_argument('--ncpus', type=int, default=multiprocessing.cpu_count(),
+        help='Processes rendering (default=%(default)s)')
+    p.add_argument('--fps', type=int, default=16,
+        help='Frames per second of the video (default=%(default)s)')
+    p.add_argument('--width', type=int, default=800,
+        help='Width of the frames in pixels, even for video (default=%(default)s)')
+    p.add_argument('--height', type=int, default=800,
+        help='Height of the frames in pixels, even for video (default=%(default)s)')
+    cmdargs = p.parse_args()
+    if cmdargs.params is None:
+        cmdargs.params = os.path.join(os.path.dirname(cmdargs.input), 'stoatsparams.pkl')
+    return cmdargs
+
+
+def main():
+    cmdargs = getCmdargs()
+    pars = loadParams(cmdargs.params)
+
+    # the small arrays are read in full (trappingDays may be None)
+    data = np.load(cmdargs.input, allow_pickle=True)
+    traps = data['traps']
+    pheromones = data['pheromones']
+    trappingDays = data['trappingDays']
+    if trappingDays.ndim == 0:
+        trappingDays = None
+    daysSincePheromone = data['daysSincePheromone']
+    data.close()
+
+    maskData = loadDisplayMask(cmdargs.mask, cmdargs.width, cmdargs.height)
+    extent = movie.getExtent(traps, pheromones, maskData)
+    mask = None if maskData is None else maskData[0]
+    decayTemporal = getattr(pars, 'COA_decay_temporal', None)
+
+    isVideo = os.path.splitext(cmdargs.output)[1].lower() in VIDEO_EXTENSIONS
+    encoder = None
+    outputDir = None
+    if isVideo:
+        encoder = startEncoder(cmdargs)
+    else:
+        outputDir = cmdargs.output
+        os.makedirs(outputDir, exist_ok=True)
+
+    reader = movie.FrameReader(cmdargs.input)
+    start = time.time()
+    pool = multiprocessing.Pool(cmdargs.ncpus, initWorker, (traps, pheromones, extent,
+                mask, cmdargs.width, cmdargs.height, decayTemporal))
+    # keep a few jobs per process on the go so the reading keeps up
+    # without reading far ahead of the writing
+    pending = collections.deque()
+    nFrames = 0
+    jobs = makeJobs(reader, cmdargs, pars, trappingDays, daysSincePheromone, outputDir)
+    for job in jobs:
+        pending.append(pool.apply_async(renderJob, (job,)))
+        while len(pending) >= 2 * cmdargs.ncpus or (len(pending) > 0 and
+                pending[0].ready()):
+            nFrames += collectJob(pending.popleft(), encoder)
+    while len(pending) > 0:
+        nFrames += collectJob(pending.popleft(), encoder)
+    pool.close()
+    pool.join()
+    reader.close()
+
+    if encoder is not None:
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise SystemExit('ffmpeg failed')
+    secs = time.time() - start
+    print('{} frames written to {} in {:.1f}s ({:.1f} frames/s)'.format(nFrames,
+            cmdargs.output, secs, nFrames / max(secs, 1e-9)))
+
+if __name__ == '__main__':
+    main()
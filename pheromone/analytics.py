@@ -0,0 +1,433 @@
+"""
+Vectorised analysis of many realisations.
+
+The results are held as columns (one array per field of
+calcresults.PheromoneResults) rather than a list of objects, so binning
+millions of realisations is a few np.bincount calls:
+
+ - getEradicationSurface: probability of eradication binned over one or
+   two parameters (e.g. decoySpacing x habituationDays) with Wilson or
+   bootstrap intervals for each bin.
+ - getSensitivityIndices: first order variance based sensitivity index
+   Var(E[eradicated | parameter]) / Var(eradicated) of each parameter,
+   estimated by binning the parameter.
+ - getPairedDifference: difference in the probability of eradication
+   between two scenarios run in pairs on common random numbers (see
+   params.commonRandomSeed).
+ - getTelemetrySummary: where the time and memory of the realisations
+   went (see telemetry.py), the throughput and the slowest realisations.
+
+Run this module to print them for a results file:
+    python -m pheromone.analytics results.pkl -x decoySpacing -y habituationDays
+(--telemetry for the summary of the telemetry)
+"""
+
+import os
+import argparse
+from collections import namedtuple
+import numpy as np
+from pheromone import calcresults
+
+# the fields of calcresults.PheromoneResults and their types
+RESULT_FIELDS = [('eradicated', np.bool_), ('nAdd', np.int32),
+                 ('decoySpacing', np.float64), ('nDecoyDeplyment', np.int32),
+                 ('alphaK', np.float64), ('COA_decay_spatial', np.float64),
+                 ('COA_decay_temporal', np.float64), ('habituationDays', np.float64),
+                 ('pDaySurv', np.float64)]
+# the parameters that vary between realisations
+PARAMETER_FIELDS = [name for name, dtype in RESULT_FIELDS if name != 'eradicated']
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_BINS = 10
+DEFAULT_BOOTSTRAPS = 2000
+# values looked at to guess if a parameter only has a few values
+UNIQUE_SAMPLE_SIZE = 10000
+# slowest realisations listed by formatTelemetrySummary
+DEFAULT_SLOWEST = 10
+BYTES_PER_MB = 1024 * 1024
+
+# names is the parameters binned over, binLower and binUpper the range of
+# each bin of each (a bin of a parameter with few values is just one value),
+# the rest have a value for each bin (or pair of bins)
+EradicationSurface = namedtuple('EradicationSurface', ['names', 'binLower', 'binUpper',
+                'n', 'nEradicated', 'pEradication', 'lower', 'upper'])
+
+# difference is pA - pB. varianceRatio is how many times more realisations
+# the same standard error would need if the scenarios were run independently
+PairedDifference = namedtuple('PairedDifference', ['n', 'pA', 'pB', 'difference',
+                'standardError', 'lower', 'upper', 'unpairedStandardError',
+                'varianceRatio'])
+
+# wall and cpu are the total seconds of each phase (telemetry.PHASES), peakRSS
+# the largest peak of the workers and slowest is (wall seconds not compiling,
+# kernel wall seconds, dictionary of PARAMETER_FIELDS) of the slowest realisations
+TelemetrySummary = namedtuple('TelemetrySummary', ['n', 'nWorkers', 'wall', 'cpu',
+                'realisationsPerCoreHour', 'realisationsPerCpuHour', 'peakRSS',
+                'medianPeakRSS', 'slowest'])
+
+
+def resultsToColumns(results):
+    """
+    Dictionary of an array for each of RESULT_FIELDS from a list of
+    PheromoneResults
+    """
+    columns = {}
+    for name, dtype in RESULT_FIELDS:
+        columns[name] = np.fromiter((getattr(result, name) for result in results),
+                    dtype=dtype, count=len(results))
+    return columns
+
+def saveColumns(columns, fname):
+    """
+    Save columns to a .npz file, which loads much faster than the pickle
+    """
+    np.savez(fname, **columns)
+
+def loadColumns(fname):
+    """
+    Columns from a results.pkl written by startSimulation.py, a
+    .csv written by PheromoneResults.writeToFileFX or a .npz written
+    by saveColumns
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext == '.npz':
+        data = np.load(fname)
+        columns = {name : data[name] for name in data.files}
+        data.close()
+    elif ext == '.csv':
+        data = np.loadtxt(fname, delimiter=',', skiprows=1, dtype=str, ndmin=2)
+        columns = {}
+        # writeToFileFX has the same columns in the same order but renamed
+        for i, (name, dtype) in enumerate(RESULT_FIELDS):
+            if name == 'eradicated':
+                columns[name] = np.char.strip(data[:, i]) == 'True'
+            else:
+                columns[name] = data[:, i].astype(np.float64).astype(dtype)
+    else:
+        columns = resultsToColumns(calcresults.PheromoneResults.unpickleFromFile(fname))
+    return columns
+
+
+def getBins(values, nBins=DEFAULT_BINS):
+    """
+    Bin index of each value and the lower and upper limits of each bin.
+    A parameter with no more than nBins values gets a bin for each value,
+    otherwise the bins have about the same number of values in each.
+    """
+    # sorting millions of values is slow so guess from the first few and check
+    unique = np.unique(values[:UNIQUE_SAMPLE_SIZE])
+    if unique.shape[0] <= nBins:
+        index = np.minimum(np.searchsorted(unique, values), unique.shape[0] - 1)
+        if not np.array_equal(unique[index], values):
+            unique = np.unique(values)
+            index = np.searchsorted(unique, values)
+        if unique.shape[0] <= nBins:
+            return index, unique, unique
+    edges = np.unique(np.quantile(values, np.linspace(0.0, 1.0, nBins + 1)))
+    # the last bin includes its upper edge
+    index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0,
+                edges.shape[0] - 2)
+    return index, edges[:-1], edges[1:]
+
+def getNormalQuantile(confidence):
+    """
+    z of a two sided interval with this confidence. scipy is imported here
+    rather than at the top as it takes longer to import than loading
+    and summarising most results files.
+    """
+    from scipy.stats import norm
+    return norm.ppf(0.5 + confidence / 2.0)
+
+def getWilsonInterval(nEradicated, n, confidence=DEFAULT_CONFIDENCE):
+    """
+    Wilson score interval for the probabilities nEradicated / n.
+    Returns (lower, upper) arrays, nan where n is 0.
+    """
+    z = getNormalQuantile(confidence)
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = nEradicated / n
+        denominator = 1.0 + z * z / n
+        centre = (p + z * z / (2.0 * n)) / denominator
+        halfWidth = z * np.sqrt(p * (1.0 - p) / n + z * z / (4.0 * n * n)) / denominator
+    return centre - halfWidth, centre + halfWidth
+
+def getBootstrapInterval(nEradicated, n, confidence=DEFAULT_CONFIDENCE,
+            nBootstraps=DEFAULT_BOOTSTRAPS, seed=None):
+    """
+    Percentile bootstrap interval for the probabilities nEradicated / n.
+    Resampling the realisations of a bin and counting the eradications is
+    a binomial draw, so all the bins are done at once without resampling
+    the records. Returns (lower, upper) arrays, nan where n is 0.
+    """
+    rng = np.random.RandomState(seed)
+    n = np.asarray(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.where(n > 0, nEradicated / np.maximum(n, 1), 0.0)
+        draws = rng.binomial(n[..., np.newaxis], p[..., np.newaxis],
+                    size=n.shape + (nBootstraps,)) / n[..., np.newaxis]
+    alpha = (1.0 - confidence) / 2.0
+    lower, upper = np.quantile(draws, [alpha, 1.0 - alpha], axis=-1)
+    missing = n == 0
+    lower[missing] = np.nan
+    upper[missing] = np.nan
+    return lower, upper
+
+def getEradicationSurface(columns, xName, yName=None, xBins=DEFAULT_BINS,
+            yBins=DEFAULT_BINS, method='wilson', confidence=DEFAULT_CONFIDENCE,
+            nBootstraps=DEFAULT_BOOTSTRAPS, seed=None):
+    """
+    Probability of eradication binned over xName (and yName if given).
+    method is 'wilson' or 'bootstrap' for the intervals.
+    Returns an EradicationSurface.
+    """
+    eradicated = columns['eradicated'].astype(np.int64)
+    xIndex, xLower, xUpper = getBins(columns[xName], xBins)
+    if yName is None:
+        names = (xName,)
+        shape = (xLower.shape[0],)
+        index = xIndex
+        binLower = (xLower,)
+        binUpper = (xUpper,)
+    else:
+        yIndex, yLower, yUpper = getBins(columns[yName], yBins)
+        names = (xName, yName)
+        shape = (xLower.shape[0], yLower.shape[0])
+        index = xIndex * shape[1] + yIndex
+        binLower = (xLower, yLower)
+        binUpper = (xUpper, yUpper)
+
+    size = int(np.prod(shape))
+    n = np.bincount(index, minlength=size).reshape(shape)
+    nEradicated = np.bincount(index, weights=eradicated, minlength=size).reshape(shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pEradication = nEradicated / n
+    if method == 'wilson':
+        lower, upper = getWilsonInterval(nEradicated, n, confidence)
+    elif method == 'bootstrap':
+        lower, upper = getBootstrapInterval(nEradicated, n, confidence, nBootstraps, seed)
+    else:
+        raise ValueError("method must be 'wilson' or 'bootstrap'")
+    return EradicationSurface(names=names, binLower=binLower, binUpper=binUpper, n=n,
+                nEradicated=nEradicated.astype(np.int64), pEradication=pEradication,
+                lower=lower, upper=upper)
+
+def getSensitivityIndices(columns, names=None, nBins=DEFAULT_BINS * 2):
+    """
+    First order sensitivity index of eradication to each of names (default
+    all the parameters that vary). The variance of the mean of each bin
+    is corrected for the part expected from sampling alone.
+    Returns a dictionary of name to index (0 to 1).
+    """
+    if names is None:
+        names = [name for name in PARAMETER_FIELDS 
+                    if columns[name].min() < columns[name].max()]
+    eradicated = columns['eradicated'].astype(np.float64)
+    nTotal = eradicated.shape[0]
+    mean = eradicated.mean()
+    variance = eradicated.var()
+    indices = {}
+    for name in names:
+        index = getBins(columns[name], nBins)[0]
+        n = np.bincount(index)
+        sums = np.bincount(index, weights=eradicated)
+        used = n > 0
+        binMeans = sums[used] / n[used]
+        between = np.sum(n[used] * (binMeans - mean) ** 2) / nTotal
+        # under no effect the bin means still vary by about variance / n
+        between -= (used.sum() - 1) * variance / nTotal
+        if variance > 0:
+            indices[name] = max(between / variance, 0.0)
+        else:
+            indices[name] = 0.0
+    return indices
+
+
+def getPairedDifference(eradicatedA, eradicatedB, confidence=DEFAULT_CONFIDENCE):
+    """
+    Difference in the probability of eradication of scenarios A and B 
+    where eradicatedA[i] and eradicatedB[i] are from realisations run
+    with the same seed. Needs at least two pairs for the standard error.
+    Returns a PairedDifference.
+    """
+    a = np.asarray(eradicatedA, dtype=np.float64)
+    b = np.asarray(eradicatedB, dtype=np.float64)
+    if a.shape != b.shape:
+        raise ValueError('Need the same number of realisations of each scenario')
+    n = a.shape[0]
+    if n < 2:
+        raise ValueError('Need at least two realisations of each scenario')
+    z = getNormalQuantile(confidence)
+    difference = a.mean() - b.mean()
+    standardError = np.sqrt((a - b).var(ddof=1) / n)
+    unpairedStandardError = np.sqrt((a.var(ddof=1) + b.var(ddof=1)) / n)
+    if standardError > 0:
+        varianceRatio = (unpairedStandardError / standardError) ** 2
+    else:
+        varianceRatio = np.inf
+    return PairedDifference(n=n, pA=a.mean(), pB=b.mean(), difference=difference,
+                standardError=standardError, lower=difference - z * standardError,
+                upper=difference + z * standardError,
+                unpairedStandardError=unpairedStandardError, varianceRatio=varianceRatio)
+
+def formatPairedDifference(paired):
+    return ('P(eradication) A {:.4f} B {:.4f} difference {:.4f} ({:.4f} to {:.4f})\n'
+            'standard error {:.4f} paired, {:.4f} if independent: {:.1f} times fewer '
+            'realisations needed').format(paired.pA, paired.pB, paired.difference,
+            paired.lower, paired.upper, paired.standardError,
+            paired.unpairedStandardError, paired.varianceRatio)
+
+def getTelemetrySummary(results, nSlowest=DEFAULT_SLOWEST):
+    """
+    TelemetrySummary of the PheromoneResults in results that have telemetry.
+    A core-hour is an hour of a realisation's wall time, as each worker
+    takes a core. Peak RSS is of each worker, whichever realisations it ran.
+    The slowest are ranked without jitCompile, which only the first
+    realisations in each worker pay.
+    """
+    results = [result for result in results if result.wallTimes is not None]
+    n = len(results)
+    # the phases in order (without importing telemetry and so numba)
+    phases = list(results[0].wallTimes.keys()) if n > 0 else []
+    wall = {phase : sum([result.wallTimes[phase] for result in results])
+                for phase in phases}
+    cpu = {phase : sum([result.cpuTimes[phase] for result in results])
+                for phase in phases}
+    totalWall = sum(wall.values())
+    totalCpu = sum(cpu.values())
+    realisationsPerCoreHour = n * 3600.0 / totalWall if totalWall > 0 else 0.0
+    realisationsPerCpuHour = n * 3600.0 / totalCpu if totalCpu > 0 else 0.0
+
+    workerPeaks = {}
+    for result in results:
+        if result.peakRSS is not None:
+            workerPeaks[result.worker] = max(workerPeaks.get(result.worker, 0), 
+                    result.peakRSS)
+    if len(workerPeaks) > 0:
+        peaks = np.array(list(workerPeaks.values()))
+        peakRSS = peaks.max()
+        medianPeakRSS = np.median(peaks)
+    else:
+        peakRSS = None
+        medianPeakRSS = None
+
+    realisationWall = np.array([sum(result.wallTimes.values()) - 
+                result.wallTimes.get('jitCompile', 0.0) for result in results])
+    slowest = []
+    for i in np.argsort(-realisationWall, kind='stable')[:nSlowest]:
+        parameters = {name : getattr(results[i], name) for name in PARAMETER_FIELDS}
+        slowest.append((realisationWall[i], results[i].wallTimes['kernel'], parameters))
+
+    return TelemetrySummary(n=n, nWorkers=len(set([result.worker for result in results])),
+                wall=wall, cpu=cpu, realisationsPerCoreHour=realisationsPerCoreHour,
+                realisationsPerCpuHour=realisationsPerCpuHour, peakRSS=peakRSS,
+                medianPeakRSS=medianPeakRSS, slowest=slowest)
+
+def formatTelemetrySummary(summary):
+    """
+    The summary as lines of text
+    """
+    if summary.n == 0:
+        return 'No telemetry recorded'
+    lines = ['Telemetry of {} realisations on {} workers'.format(summary.n,
+                summary.nWorkers)]
+    totalWall = max(sum(summary.wall.values()), 1e-9)
+    lines.append('{:>12s} {:>12s} {:>12s} {:>10s} {:>6s}'.format('phase', 'wall (s)',
+            'cpu (s)', 'mean (s)', 'share'))
+    for phase in summary.wall:
+        lines.append('{:>12s} {:12.1f} {:12.1f} {:10.3f} {:6.1%}'.format(phase, 
+            summary.wall[phase], summary.cpu[phase], summary.wall[phase] / summary.n,
+            summary.wall[phase] / totalWall))
+    lines.append('Throughput {:.1f} realisations per core-hour, {:.1f} per CPU hour'.format(
+            summary.realisationsPerCoreHour, summary.realisationsPerCpuHour))
+    if summary.peakRSS is None:
+        lines.append('Peak RSS of the workers not recorded')
+    else:
+        lines.append('Peak RSS of the workers {:.1f} MB, median {:.1f} MB'.format(
+            summary.peakRSS / BYTES_PER_MB, summary.medianPeakRSS / BYTES_PER_MB))
+    lines.append('Slowest realisations')
+    lines.append('{:>10s} {:>10s} '.format('wall (s)', 'kernel (s)') + ' '.join(
+            ['{:>18s}'.format(name) for name in PARAMETER_FIELDS]))
+    for realisationWall, kernelWall, parameters in summary.slowest:
+        lines.append('{:10.1f} {:10.1f} '.format(realisationWall, kernelWall) + ' '.join(
+            ['{:18.6g}'.format(parameters[name]) for name in PARAMETER_FIELDS]))
+    return '\n'.join(lines)
+
+def formatSurface(surface):
+    """
+    The surface as lines of text
+    """
+    lines = []
+    if len(surface.names) == 1:
+        lines.append('{:>24s} {:>8s} {:>8s} {:>8s} {:>8s}'.format(surface.names[0],
+            'n', 'p', 'lower', 'upper'))
+        for i in range(surface.n.shape[0]):
+            lines.append('{:>24s} {:8d} {:8.3f} {:8.3f} {:8.3f}'.format(
+                formatBin(surface.binLower[0][i], surface.binUpper[0][i]),
+                surface.n[i], surface.pEradication[i], surface.lower[i],
+                surface.upper[i]))
+    else:
+        # p (lower-upper) in each cell, x down and y across
+        yLabels = [formatBin(lower, upper) for lower, upper in zip(surface.binLower[1],
+                    surface.binUpper[1])]
+        lines.append('{} down, {} across'.format(surface.names[0], surface.names[1]))
+        lines.append('{:>24s} '.format('') + ' '.join(['{:>19s}'.format(label)
+                    for label in yLabels]))
+        for i in range(surface.n.shape[0]):
+            cells = ['{:5.3f} ({:5.3f}-{:5.3f})'.format(surface.pEradication[i, j],
+                    surface.lower[i, j], surface.upper[i, j])
+                    for j in range(surface.n.shape[1])]
+            lines.append('{:>24s} '.format(formatBin(surface.binLower[0][i],
+                    surface.binUpper[0][i])) + ' '.join(cells))
+    return '\n'.join(lines)
+
+def formatBin(lower, upper):
+    if lower == upper:
+        return '{:g}'.format(lower)
+    return '{:.4g}-{:.4g}'.format(lower, upper)
+
+
+def getCmdargs():
+    p = argparse.ArgumentParser(description='Eradication surfaces and sensitivity ' +
+            'indices for a results file')
+    p.add_argument('results',
+        help='results.pkl, simulationResults.csv or a .npz of columns')
+    p.add_argument('-x', '--xname', default='decoySpacing', choices=PARAMETER_FIELDS,
+        help='Parameter to bin over (default=%(default)s)')
+    p.add_argument('-y', '--yname', choices=PARAMETER_FIELDS,
+        help='Second parameter to bin over')
+    p.add_argument('--bins', type=int, default=DEFAULT_BINS,
+        help='Bins for each parameter (default=%(default)s)')
+    p.add_argument('--method', default='wilson', choices=['wilson', 'bootstrap'],
+        help='Intervals (default=%(default)s)')
+    p.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE,
+        help='Confidence level of the intervals (default=%(default)s)')
+    p.add_argument('--savecolumns',
+        help='Also save the results as a .npz of columns for faster loading')
+    p.add_argument('--telemetry', default=False, action='store_true',
+        help='Also summarise the telemetry of the realisations (results.pkl only)')
+    p.add_argument('--slowest', type=int, default=DEFAULT_SLOWEST,
+        help='Slowest realisations listed with --telemetry (default=%(default)s)')
+    return p.parse_args()
+
+
+def main():
+    cmdargs = getCmdargs()
+    columns = loadColumns(cmdargs.results)
+    if cmdargs.savecolumns is not None:
+        saveColumns(columns, cmdargs.savecolumns)
+    print('Realisations', columns['eradicated'].shape[0], 'P(eradication)',
+            columns['eradicated'].mean())
+    surface = getEradicationSurface(columns, cmdargs.xname, cmdargs.yname, cmdargs.bins,
+            cmdargs.bins, cmdargs.method, cmdargs.confidence)
+    print(formatSurface(surface))
+    print('First order sensitivity indices')
+    for name, index in sorted(getSensitivityIndices(columns).items(),
+                key=lambda item: -item[1]):
+        print('{:>24s} {:8.4f}'.format(name, index))
+    if cmdargs.telemetry:
+        results = calcresults.PheromoneResults.unpickleFromFile(cmdargs.results)
+        print(formatTelemetrySummary(getTelemetrySummary(results, cmdargs.slowest)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+Cache of realisation results shared between campaigns.
+
+A realisation run with a seed is decided by its inputs, so its result is
+kept under a hash of them: the values of the PheromoneParams, digests of
+the contents of the mask and traps files (not their names), the seed and
+a digest of the source of the model (any change to the code is a new
+version). runCached returns the result from the cache if it is there and
+otherwise runs it and adds it.
+
+The cache is a directory holding an SQLite index with the pickled result
+of each realisation, the hash of its inputs without the seed (so a sweep
+can ask which seeds of a point are done with getSeeds) and when it was
+last used. Once the results take more than maxBytes the least recently
+used are dropped.
+
+Run this module to see what is in a cache:
+    python -m pheromone.cache cacheDir
+or to check the key of a mask and traps is the same in new processes:
+    python -m pheromone.cache --checkkey mask.img traps.csv
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import multiprocessing
+import numpy as np
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+# evict down to this fraction of maxBytes so it isn't done on every add
+EVICT_FRACTION = 0.9
+INDEX_NAME = 'index.sqlite'
+# seconds to wait for another process writing the index
+LOCK_TIMEOUT = 60.0
+DIGEST_BLOCK_SIZE = 2 ** 20
+# attributes of PheromoneParams that name files, replaced by their digests
+FILE_PARAMS = ['extentMask', 'trapsFile']
+# attributes that don't change the result
+IGNORED_PARAMS = ['resultsFile']
+
+# new processes getInputsKey is checked in
+KEY_CHECK_PROCESSES = 2
+
+# digest of the model's source, worked out once per process
+codeVersion = None
+
+
+def getFileDigest(filename):
+    """
+    sha256 of the contents of a file
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fileobj:
+        for block in iter(lambda: fileobj.read(DIGEST_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def getCodeVersion():
+    """
+    sha256 of the source files of the pheromone package
+    """
+    global codeVersion
+    if codeVersion is None:
+        packageDir = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(packageDir)):
+            if name.endswith('.py'):
+                digest.update(name.encode())
+                digest.update(getFileDigest(os.path.join(packageDir, name)).encode())
+        codeVersion = digest.hexdigest()
+    return codeVersion
+
+def toJSONValue(value):
+    """
+    value as something json can write, so the same parameter always
+    gives the same text whether it is a numpy or Python number
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [toJSONValue(item) for item in value]
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+def getParamsDict(params, fileDigests=None):
+    """
+    The values of params as a dictionary, with the files replaced by the
+    digests of their contents. fileDigests caches the digests by
+    (filename, size, modification time).
+    """
+    if fileDigests is None:
+        fileDigests = {}
+    values = {}
+    for name, value in vars(params).items():
+        if name in IGNORED_PARAMS:
+            continue
+        if name in FILE_PARAMS and value is not None:
+            stat = os.stat(value)
+            fileKey = (os.path.abspath(value), stat.st_size, stat.st_mtime)
+            if fileKey not in fileDigests:
+                fileDigests[fileKey] = getFileDigest(value)
+            value = fileDigests[fileKey]
+        values[name] = toJSONValue(value)
+    return values
+
+def getArrayDigest(*arrays):
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+def getInputsKey(params, maskData=None, trapsArray=None, fileDigests=None):
+    """
+    Hash of everything that decides the result of a realisation but the
+    seed. A mask (as from calculation.readMask) or traps array given
+    instead of the files is hashed itself.
+    """
+    values = getParamsDict(params, fileDigests)
+    if maskData is not None:
+        if not isinstance(maskData[0], np.ndarray):
+            raise ValueError('Can only cache runs given an unpacked mask')
+        # the transform and extent as floats (a tuple of them is an object
+        # array of pointers, which differ in every process)
+        values['extentMask'] = getArrayDigest(maskData[0],
+                    np.asarray(maskData[1], dtype=np.float64),
+                    np.asarray(maskData[2:], dtype=np.float64))
+    if trapsArray is not None:
+        values['trapsFile'] = getArrayDigest(trapsArray)
+    values['codeVersion'] = getCodeVersion()
+    text = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def getResultKey(inputsKey, seed):
+    return hashlib.sha256('{}:{}'.format(inputsKey, int(seed)).encode()).hexdigest()
+
+def getDefaultInputsKey(maskFile, trapsFile):
+    """
+    getInputsKey of the default PheromoneParams with the mask and traps
+    read from maskFile and trapsFile and given as arrays
+    """
+    from pheromone import calculation
+    from pheromone import params
+    pars = params.PheromoneParams()
+    pars.setExtentMask(maskFile)
+    pars.setTrapsFile(trapsFile)
+    return getInputsKey(pars, calculation.readMask(maskFile),
+                calculation.readTrapsFile(trapsFile))
+
+def checkInputsKey(maskFile, trapsFile, nProcesses=KEY_CHECK_PROCESSES):
+    """
+    getDefaultInputsKey here and in each of nProcesses new processes (not
+    forked, so they share nothing with this one). A key that changes
+    between processes would never find anything in the cache.
+    Returns the key here and the keys of the others.
+    """
+    key = getDefaultInputsKey(maskFile, trapsFile)
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(nProcesses, maxtasksperchild=1) as pool:
+        otherKeys = pool.starmap(getDefaultInputsKey, [(maskFile, trapsFile)] * nProcesses)
+    return key, otherKeys
+
+
+class ResultCache(object):
+    """
+    Results of realisations in directory, keyed by getResultKey
+    """
+    def __init__(self, directory, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.fileDigests = {}
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, INDEX_NAME),
+                    timeout=LOCK_TIMEOUT)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results (' +
+                    'key TEXT PRIMARY KEY, inputsKey TEXT, seed INTEGER, ' +
+                    'eradicated INTEGER, nBytes INTEGER, created REAL, ' +
+                    'lastUsed REAL, result BLOB)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS inputs ' +
+                    'ON results (inputsKey, seed)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS used ' +
+                    'ON results (lastUsed)')
+
+    def close(self):
+        self.connection.close()
+
+    def getInputsKey(self, params, maskData=None, trapsArray=None):
+        return getInputsKey(params, maskData, trapsArray, self.fileDigests)
+
+    def get(self, key):
+        """
+        The result stored under key, or None if it isn't there
+        """
+        row = self.connection.execute('SELECT result FROM results WHERE key = ?',
+                    (key,)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute('UPDATE results SET lastUsed = ? WHERE key = ?',
+                    (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, inputsKey, seed, result):
+        """
+        Store result (the tuple from runModel) under key, then evict if
+        the cache is over maxBytes
+        """
+        data = pickle.dumps(result, protocol=4)
+        now = time.time()
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES ' +
+                    '(?, ?, ?, ?, ?, ?, ?, ?)', (key, inputsKey, int(seed),
+                    int(bool(result[0])), len(data), now, now, data))
+        if self.getSize()[1] > self.maxBytes:
+            self.evict(int(self.maxBytes * EVICT_FRACTION))
+
+    def evict(self, maxBytes):
+        """
+        Drop the least recently used results until they take no more than
+        maxBytes. Returns how many were dropped.
+        """
+        nDropped = 0
+        with self.connection:
+            nBytes = self.getSize()[1]
+            rows = self.connection.execute('SELECT key, nBytes FROM results ' +
+                    'ORDER BY lastUsed').fetchall()
+            drop = []
+            for key, size in rows:
+                if nBytes <= maxBytes:
+                    break
+                drop.append((key,))
+                nBytes -= size
+            self.connection.executemany('DELETE FROM results WHERE key = ?', drop)
+            nDropped = len(drop)
+        return nDropped
+
+    def getSize(self):
+        """
+        Number of results and the bytes they take
+        """
+        nResults, nBytes = self.connection.execute('SELECT COUNT(*), ' +
+                    'COALESCE(SUM(nBytes), 0) FROM results').fetchone()
+        return nResults, nBytes
+
+    def getSeeds(self, inputsKey):
+        """
+        Seeds with results for inputsKey, in order
+        """
+        rows = self.connection.execute('SELECT seed FROM results WHERE ' +
+                    'inputsKey = ? ORDER BY seed', (inputsKey,)).fetchall()
+        return [row[0] for row in rows]
+
+    def getSummary(self):
+        """
+        (inputsKey, number of results, number eradicated, last used) for
+        each set of inputs, most recently used first
+        """
+        return self.connection.execute('SELECT inputsKey, COUNT(*), ' +
+                    'SUM(eradicated), MAX(lastUsed) FROM results GROUP BY inputsKey ' +
+                    'ORDER BY MAX(lastUsed) DESC').fetchall()
+
+
+def runCached(cache, params, seed, maskData=None, trapsArray=None):
+    """
+    runModel(params, save=False) with np.random and numba seeded with seed,
+    from cache if it has been run before. cache can be None to always run.
+    """
+    # only import the model when it has to be run
+    from pheromone import calculation
+    if cache is not None:
+        inputsKey = cache.getInputsKey(params, maskData, trapsArray)
+        key = getResultKey(inputsKey, seed)
+        result = cache.get(key)
+        if result is not None:
+            return result
+    np.random.seed(seed)
+    calculation.seedKernelRandom(seed)
+    result = calculation.runModel(params, save=False, maskData=maskData,
+                trapsArray=trapsArray)
+    if cache is not None:
+        cache.put(key, inputsKey, seed, result)
+    return result
+
+
+def getCmdargs():
+    p = argparse.ArgumentParser(description='What is in a cache of realisation results')
+    p.add_argument('cache', nargs='?', help='Directory of the cache')
+    p.add_argument('--maxgb', type=float,
+        help='Evict the least recently used results down to this many GB')
+    p.add_argument('--checkkey', nargs=2, metavar=('MASK', 'TRAPS'),
+        help='Check the inputs key of this mask and traps is the same in new processes')
+    cmdargs = p.parse_args()
+    if cmdargs.cache is None and cmdargs.checkkey is None:
+        p.error('Need the cache or --checkkey')
+    return cmdargs
+
+def main():
+    cmdargs = getCmdargs()
+    if cmdargs.checkkey is not None:
+        key, otherKeys = checkInputsKey(*cmdargs.checkkey)
+        print('Key here', key[:16])
+        for otherKey in otherKeys:
+            print('New process', otherKey[:16])
+        if any([otherKey != key for otherKey in otherKeys]):
+            sys.exit('The inputs key differs between processes')
+        if cmdargs.cache is None:
+            return
+    if not os.path.exists(os.path.join(cmdargs.cache, INDEX_NAME)):
+        sys.exit('No cache in {}'.format(cmdargs.cache))
+    cache = ResultCache(cmdargs.cache)
+    if cmdargs.maxgb is not None:
+        print('Dropped', cache.evict(int(cmdargs.maxgb * 1024 ** 3)), 'results')
+    nResults, nBytes = cache.getSize()
+    print('{} results, {:.1f} MB'.format(nResults, nBytes / 1024 ** 2))
+    print('{:>16s} {:>8s} {:>8s} {:>20s}'.format('inputs', 'n', 'p', 'last used'))
+    for inputsKey, n, nEradicated, lastUsed in cache.getSummary():
+        print('{:>16s} {:8d} {:8.3f} {:>20s}'.format(inputsKey[:16], n, nEradicated / n,
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(lastUsed))))
+    cache.close()
+
+if __name__ == '__main__':
+    main()
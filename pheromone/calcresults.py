@@ -21,6 +21,12 @@ class PheromoneResults(object):
     habituationDays = None
     pDaySurv = None
     iter = None
+    seed = None         # what np.random and numba were seeded with (campaign.py)
+    # from telemetry.RealisationTelemetry, None if not recorded
+    wallTimes = None    # dictionary of seconds for each of telemetry.PHASES
+    cpuTimes = None
+    peakRSS = None      # bytes, of the worker process so far
+    worker = None       # host:pid of the worker process
 
     def pickleSelf(self, fname):
         fileobj = open(fname, 'wb')
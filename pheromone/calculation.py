@@ -6,9 +6,18 @@ import tempfile
 import subprocess
 import pickle
 import shutil
-from numba import njit, objmode
+from collections import namedtuple
+from numba import njit, objmode, prange
 import numpy as np
-from osgeo import gdal
+from pheromone import movement
+from pheromone import streams
+from pheromone import landscape
+from pheromone import telemetry
+# only needed to read the mask from a file
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
 
 
 # the dtype we use for the stoat array
@@ -36,6 +45,56 @@ MATING_DTYPE = [('maleid', np.int32), # 'id' from stoatArray
                 ('ndays', np.int32)  # number of days until interaction no longer applies
                 ]
 
+# smaller versions of the above for params.compactState. Coordinates are float32
+# relative to the bottom left corner of the raster, and ids and days are int16
+COMPACT_STOAT_DTYPE = [('deleted', np.bool), ('male', np.bool), ('pregnant', np.bool), 
+                    ('x', np.float32), ('y', np.float32), ('home_x', np.float32),
+                    ('home_y', np.float32), ('id', np.int16), ('pregnant_day', np.int16),
+                    ('parentid', np.int16), ('bearingT_1', np.float32), 
+                    ('homerange', np.bool)]
+COMPACT_PHEROMONE_DTYPE = [('x', np.float32), ('y', np.float32)]
+COMPACT_PHEROMONE_INTERACTION_DTYPE = [('pheromoneid', np.int32), ('stoatid', np.int16),
+                    ('ndays', np.int16)]
+COMPACT_MATING_DTYPE = [('maleid', np.int16), ('femaleid', np.int16), ('ndays', np.int16)]
+# largest day and stoat id that can be stored in them
+COMPACT_MAX_VALUE = np.iinfo(np.int16).max
+
+# a uniform grid over the raster holding the live stoats in each cell (as
+# linked lists starting in cellHead) so the stoats near a point can be 
+# found without looking at all of them
+STOAT_HASH_DTYPE = [('cell', np.int32), # flat index into cellHead, -1 when not in a cell
+                    ('next', np.int32), # next stoat in the same cell or -1
+                    ('prev', np.int32) # previous stoat in the same cell or -1
+                    ]
+
+# what each stoat does in an hour when the stoats are done in parallel:
+# decided independently by planStoatHour then applied in order by applyStoatHour
+STOAT_PLAN_DTYPE = [('alive', np.bool), # stoat was alive at the start of the hour
+                    ('id', np.int32), # of the stoat planned for, as slots can be reused
+                    ('homerange', np.bool),
+                    ('mate', np.int32), # index of female in stoatArray to mate with or -1
+                    ('mateId', np.int32), # and her id
+                    ('givesBirth', np.bool),
+                    ('killed', np.bool),
+                    ('trapped', np.bool), # killed by a trap
+                    ('moved', np.bool),
+                    ('x', np.float64), ('y', np.float64), # new position if moved
+                    ('bearingT_1', np.float64)
+                    ]
+
+# the state of runRealisation that is carried from one day to the next,
+# so a realisation can be stopped on any day and continued later (see snapshot.py)
+KERNEL_STATE_DTYPE = [('day', np.int32), # next day to be simulated
+                ('nStoats', np.int32), # number of slots used in stoatArray
+                ('Current_Id', np.int32), # next id to be given to a stoat
+                ('inEstrous', np.bool),
+                ('daysSincePheromoneRelease', np.int32), # -1 before the first release
+                ('debugIndex', np.int32), # next frame of the debug arrays
+                ('eradicated', np.bool),
+                ('finished', np.bool), # True when there is nothing left to simulate
+                ('stoatHours', np.int64) # live stoat-hours stepped (not counting fast forwarded days)
+                ]
+
 def readTrapsFile(filename):
     """
     Read the traps file and return an array with the data
@@ -45,25 +104,126 @@ def readTrapsFile(filename):
     return data
 
 def makePheromoneArray(mask, tlx, tly, brx, bry, pixsize, spacing, transform):
-    tinverse = gdal.InvGeoTransform(transform)
-
-    xList = []
-    yList = []
-    for y in range(int(bry + spacing), int(tly), int(spacing)):
-        for x in range(int(tlx), int(brx), int(spacing)):
-            xPix, yPix = gdal.ApplyGeoTransform(tinverse, x, y)
-            xPix = int(xPix)
-            yPix = int(yPix)
-            if mask[yPix, xPix] > 0:
-                xList.append(x)
-                yList.append(y)
-
-    data = np.empty(len(xList), dtype=PHEROMONE_DTYPE)
-    data['x'] = xList
-    data['y'] = yList
+    # the mask is north up (as checkLocationIsOnIsland assumes) so
+    # no need for the full inverse transform
+    xs = np.arange(int(tlx), int(brx), int(spacing))
+    ys = np.arange(int(bry + spacing), int(tly), int(spacing))
+    # y in the outer loop, x in the inner
+    x, y = np.meshgrid(xs, ys)
+    x = x.flatten()
+    y = y.flatten()
+    xPix = ((x - transform[0]) / transform[1]).astype(np.int64)
+    yPix = ((y - transform[3]) / transform[5]).astype(np.int64)
+    onLand = landscape.isLandPixels(mask, yPix, xPix)
+
+    data = np.empty(onLand.sum(), dtype=PHEROMONE_DTYPE)
+    data['x'] = x[onLand]
+    data['y'] = y[onLand]
     
     return data
 
+def makeStoatHash(tlx, tly, brx, bry, cellSize):
+    """
+    Create an empty spatial hash over the raster. Returns cellHead, 
+    stoatHash and hashGeometry (tlx, tly, cellSize) as used by the
+    functions below.
+    """
+    nCols = max(int(np.ceil((brx - tlx) / cellSize)), 1)
+    nRows = max(int(np.ceil((tly - bry) / cellSize)), 1)
+    cellHead = np.full((nRows, nCols), -1, dtype=np.int32)
+    stoatHash = np.empty(INITIAL_STOAT_ARRAY_SIZE, dtype=STOAT_HASH_DTYPE)
+    stoatHash['cell'] = -1
+    stoatHash['next'] = -1
+    stoatHash['prev'] = -1
+    hashGeometry = np.array([tlx, tly, cellSize], dtype=np.float64)
+    return cellHead, stoatHash, hashGeometry
+
+@njit
+def getHashCell(x, y, cellHead, hashGeometry):
+    """
+    Row and column of the cell x, y is in (clamped to the grid)
+    """
+    col = int((x - hashGeometry[0]) / hashGeometry[2])
+    row = int((hashGeometry[1] - y) / hashGeometry[2])
+    col = min(max(col, 0), cellHead.shape[1] - 1)
+    row = min(max(row, 0), cellHead.shape[0] - 1)
+    return row, col
+
+@njit
+def addToStoatHash(stoat, x, y, cellHead, stoatHash, hashGeometry):
+    row, col = getHashCell(x, y, cellHead, hashGeometry)
+    head = cellHead[row, col]
+    stoatHash[stoat]['cell'] = row * cellHead.shape[1] + col
+    stoatHash[stoat]['prev'] = -1
+    stoatHash[stoat]['next'] = head
+    if head != -1:
+        stoatHash[head]['prev'] = stoat
+    cellHead[row, col] = stoat
+
+@njit
+def removeFromStoatHash(stoat, cellHead, stoatHash):
+    cell = stoatHash[stoat]['cell']
+    if cell == -1:
+        return
+    prev = stoatHash[stoat]['prev']
+    next = stoatHash[stoat]['next']
+    if prev != -1:
+        stoatHash[prev]['next'] = next
+    else:
+        cellHead[cell // cellHead.shape[1], cell % cellHead.shape[1]] = next
+    if next != -1:
+        stoatHash[next]['prev'] = prev
+    stoatHash[stoat]['cell'] = -1
+    stoatHash[stoat]['next'] = -1
+    stoatHash[stoat]['prev'] = -1
+
+@njit
+def moveInStoatHash(stoat, x, y, cellHead, stoatHash, hashGeometry):
+    """
+    Update the hash for a stoat that has moved to x, y
+    """
+    row, col = getHashCell(x, y, cellHead, hashGeometry)
+    if stoatHash[stoat]['cell'] != row * cellHead.shape[1] + col:
+        removeFromStoatHash(stoat, cellHead, stoatHash)
+        addToStoatHash(stoat, x, y, cellHead, stoatHash, hashGeometry)
+
+@njit
+def rebuildStoatHash(stoatArray, nStoats, cellHead, stoatHash, hashGeometry):
+    """
+    Put all the live stoats in the hash from scratch. Used after births,
+    dispersal and fast forwarding where many change at once.
+    """
+    cellHead[:] = -1
+    for i in range(stoatHash.shape[0]):
+        stoatHash[i]['cell'] = -1
+        stoatHash[i]['next'] = -1
+        stoatHash[i]['prev'] = -1
+    # add in reverse so each cell's list is in stoat order
+    for i in range(nStoats - 1, -1, -1):
+        if not stoatArray[i]['deleted']:
+            addToStoatHash(i, stoatArray[i]['x'], stoatArray[i]['y'], cellHead,
+                    stoatHash, hashGeometry)
+
+@njit
+def findStoatsNear(x, y, radius, cellHead, stoatHash, hashGeometry):
+    """
+    Indices of the stoats in all the cells within radius of x, y, sorted
+    so they come in the same order as looping through stoatArray.
+    Callers still need to check the distance.
+    """
+    rowMin, colMin = getHashCell(x - radius, y + radius, cellHead, hashGeometry)
+    rowMax, colMax = getHashCell(x + radius, y - radius, cellHead, hashGeometry)
+    nearStoats = np.empty(stoatHash.shape[0], dtype=np.int32)
+    nNear = 0
+    for row in range(rowMin, rowMax + 1):
+        for col in range(colMin, colMax + 1):
+            i = cellHead[row, col]
+            while i != -1:
+                nearStoats[nNear] = i
+                nNear += 1
+                i = stoatHash[i]['next']
+    return np.sort(nearStoats[:nNear])
+
 @njit
 def checkLocationIsOnIsland(mask, tlx, tly, brx, bry, pixsize, x, y):
     # inside the masked file?
@@ -72,11 +232,11 @@ def checkLocationIsOnIsland(mask, tlx, tly, brx, bry, pixsize, x, y):
         # now check the actual mask
         xPix = int(np.round((x - tlx) / pixsize))
         yPix = int(np.round((tly - y) / pixsize))
-        isInsideIsland = (mask[yPix, xPix] > 0)
+        isInsideIsland = landscape.isLandPixel(mask, yPix, xPix)
     return isInsideIsland
 
 @njit
-def createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixsize):
+def createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixsize, randomStreams, stream):
     xsize = brx - tlx
     ysize = tly - bry
 
@@ -85,8 +245,8 @@ def createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixsize):
     isInsideIsland = False
     while not isInsideIsland:
         # choose a spot at random.
-        x = tlx + np.random.random() * xsize
-        y = bry + np.random.random() * ysize
+        x = tlx + streams.drawRandom(randomStreams, stream) * xsize
+        y = bry + streams.drawRandom(randomStreams, stream) * ysize
         # inside the masked file?
         isInsideIsland = checkLocationIsOnIsland(mask, tlx, tly, 
                                 brx, bry, pixsize, x, y)
@@ -94,15 +254,17 @@ def createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixsize):
 
 @njit
 def createInitialStoats(stoatArray, nAdd, mask, tlx, tly, brx, bry, pixsize, 
-                            nDaysPregnantBeforeBirth):
+                            nDaysPregnantBeforeBirth, randomStreams):
     """
     Put down some initial stoats within the masked area.
     """
     Current_Id = 0
 
     for nStoats in range(nAdd):
-        x, y = createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixsize)
-        male = np.random.random() < 0.5
+        streams.keyStreams(randomStreams, streams.INITIAL_DAY, 0, Current_Id)
+        x, y = createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixsize, 
+                    randomStreams, streams.PLACEMENT_STREAM)
+        male = streams.drawRandom(randomStreams, streams.PLACEMENT_STREAM) < 0.5
         ## make first two a female and male
         if nStoats == 0:
             stoatArray[nStoats]['male'] = False     # female
@@ -133,11 +295,31 @@ def createInitialStoats(stoatArray, nAdd, mask, tlx, tly, brx, bry, pixsize,
 
     return nStoats, Current_Id
 
+@njit
+def lookupSpatialAttraction(spatialAttraction, attractionBinScale, dist2):
+    """
+    The spatial part of the attraction at squared distance dist2 (within
+    COA_radius) from the table of makeAttractionTables, interpolated linearly
+    in distance
+    """
+    position = np.sqrt(dist2) * attractionBinScale
+    i = int(position)
+    fraction = position - i
+    return spatialAttraction[i] + fraction * (spatialAttraction[i + 1] - spatialAttraction[i])
+
 @njit
 def checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, stoatArray, nStoats, stoatid, COA_radius, 
             COA_decay_spatial, COA_decay_temporal, minK, daysSincePheromoneRelease, pheromoneArray,
-            pheromoneInteractionArray, matingArray):
-
+            pheromoneInteractionArray, matingArray, spatialAttraction, temporalAttraction,
+            attractionBinScale, exactAttraction, cellHead,
+            stoatHash, hashGeometry, randomStreams):
+    """
+    Choose a new centre of attraction from the estrous stoats of the other
+    sex and the decoys within COA_radius. The weights come from the tables
+    made by makeAttractionTables unless exactAttraction is set.
+    Returns (x, y, Kappac) or None if nothing was found.
+    """
+    COA_radius2 = COA_radius * COA_radius
     arraySize = INITIAL_STOAT_ARRAY_SIZE + pheromoneArray.shape[0]
     Kappac = np.zeros(arraySize, dtype=np.float64)
     # temp arrays
@@ -146,14 +328,16 @@ def checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, stoatArray, nSto
 
     result = None
     nStoatsInTmp = 0
-    for i in range(nStoats):
+    # only need the stoats in the cells within COA_radius
+    nearStoats = findStoatsNear(x, y, COA_radius, cellHead, stoatHash, hashGeometry)
+    for i in nearStoats:
         if (not stoatArray[i]['deleted'] and stoatArray[i]['parentid'] == -1 
                     and stoatArray[i]['male'] == lookingForMale):
             # estrous other gender
             xdist = x - stoatArray[i]['x']
             ydist = y - stoatArray[i]['y']
-            dist = np.sqrt(xdist * xdist + ydist * ydist)
-            if dist < COA_radius:
+            dist2 = xdist * xdist + ydist * ydist
+            if dist2 < COA_radius2:
                 # check if already mated
                 alreadyMated = False
                 for m in range(matingArray.shape[0]):
@@ -171,19 +355,26 @@ def checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, stoatArray, nSto
                     xCoords[nStoatsInTmp] = stoatArray[i]['x']
                     yCoords[nStoatsInTmp] = stoatArray[i]['y']
                     # daysSincePheromoneRelease is 0 for an actual stoat so we can ignore
-                    Kappac[nStoatsInTmp] = ((1.0 / minK) * np.exp(-COA_decay_spatial * dist))
+                    if exactAttraction:
+                        Kappac[nStoatsInTmp] = ((1.0 / minK) * 
+                                np.exp(-COA_decay_spatial * np.sqrt(dist2)))
+                    else:
+                        Kappac[nStoatsInTmp] = lookupSpatialAttraction(spatialAttraction,
+                                attractionBinScale, dist2)
 
                     nStoatsInTmp += 1
                     if nStoatsInTmp > xCoords.shape[0]:
                         raise ValueError('Too many items for tmp array 1')
 
+    # the kernel passes no decoys on days they can't attract (see getDecoyDays)
     if daysSincePheromoneRelease != -1:
+        temporal = temporalAttraction[daysSincePheromoneRelease]
         # now search the pheromones
         for i in range(pheromoneArray.shape[0]):
             xdist = x - pheromoneArray[i]['x']
             ydist = y - pheromoneArray[i]['y']
-            dist = np.sqrt(xdist * xdist + ydist * ydist)
-            if dist < COA_radius:
+            dist2 = xdist * xdist + ydist * ydist
+            if dist2 < COA_radius2:
 
                 # not recently interacted with this pheromone.
                 alreadyInteracted = False
@@ -198,8 +389,13 @@ def checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, stoatArray, nSto
 
                     xCoords[nStoatsInTmp] = pheromoneArray[i]['x']
                     yCoords[nStoatsInTmp] = pheromoneArray[i]['y']
-                    Kappac[nStoatsInTmp] = ((1.0 / minK) * np.exp(-COA_decay_spatial * dist) * 
+                    if exactAttraction:
+                        Kappac[nStoatsInTmp] = ((1.0 / minK) * 
+                            np.exp(-COA_decay_spatial * np.sqrt(dist2)) * 
                             np.exp(-COA_decay_temporal * daysSincePheromoneRelease))
+                    else:
+                        Kappac[nStoatsInTmp] = (lookupSpatialAttraction(spatialAttraction,
+                            attractionBinScale, dist2) * temporal)
 
                     nStoatsInTmp += 1
                     if nStoatsInTmp > xCoords.shape[0]:
@@ -210,19 +406,22 @@ def checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, stoatArray, nSto
         Kappac = Kappac[:nStoatsInTmp]
         Psel = Kappac / Kappac.sum()
 
-        COAi = np.random.multinomial(1, Psel)
-        for i in range(nStoatsInTmp):
-            if COAi[i] > 0:
-                result = (xCoords[i], yCoords[i], Kappac[i])
-                break
+        i = streams.drawCategory(randomStreams, streams.ATTRACTION_STREAM, Psel)
+        if i != -1:
+            result = (xCoords[i], yCoords[i], Kappac[i])
         
     return result
 
 @njit
-def doMaleMating(x, y, stoatid, stoatArray, nStoats, encounterDistance, matingArray,
-                habituationDays, day, probPregnacy):
-    mated = False
-    for i in range(nStoats):
+def findFemaleToMate(x, y, stoatid, stoatArray, nStoats, encounterDistance, matingArray,
+            cellHead, stoatHash, hashGeometry):
+    """
+    Returns the index of the first mature female within encounterDistance 
+    this male hasn't recently mated with, or -1.
+    """
+    nearStoats = findStoatsNear(x, y, encounterDistance, cellHead, stoatHash, 
+                    hashGeometry)
+    for i in nearStoats:
         # males still look for pregnant females
         if (not stoatArray[i]['deleted'] and not stoatArray[i]['male'] 
                     and stoatArray[i]['parentid'] == -1): # must be mature
@@ -242,34 +441,54 @@ def doMaleMating(x, y, stoatid, stoatArray, nStoats, encounterDistance, matingAr
             ydist = y - stoatArray[i]['y']
             dist = np.sqrt(xdist * xdist + ydist * ydist)
             if dist < encounterDistance:
-                # females can mate multiple times - but only update the flag if not already pregnant
-                if not stoatArray[i]['pregnant']:
-                    if np.random.binomial(1, probPregnacy) == 1:
-                        stoatArray[i]['pregnant'] = True
-                        stoatArray[i]['pregnant_day'] = day
-
-                        # if pregnant, make all her non-adult female offspring also pregnant with probabil
-                        for n in range(nStoats):
-                            if (stoatArray[n]['parentid'] == stoatArray[i]['id'] and 
-                                    not stoatArray[n]['male'] and 
-                                    np.random.binomial(1, probPregnacy) == 1):
-                                stoatArray[n]['pregnant'] = True
-                                stoatArray[n]['pregnant_day'] = day
-
-                addedMating = False
-                for m in range(matingArray.shape[0]):
-                    if matingArray[m]['maleid'] == -1:
-                        # unused slot
-                        matingArray[m]['maleid'] = stoatid
-                        matingArray[m]['femaleid'] = stoatArray[i]['id']
-                        matingArray[m]['ndays'] = habituationDays 
-                        addedMating = True
-                        break
-                if not addedMating:
-                    raise ValueError('Unable to add mating')
+                return i
 
-                mated = True
-                break
+    return -1
+
+@njit
+def mateWithFemale(stoatid, i, stoatArray, nStoats, matingArray, habituationDays, 
+                day, probPregnacy, randomStreams):
+    """
+    Male stoatid mates with the female at index i of stoatArray
+    """
+    # females can mate multiple times - but only update the flag if not already pregnant
+    if not stoatArray[i]['pregnant']:
+        if streams.drawBernoulli(randomStreams, streams.REPRODUCTION_STREAM, probPregnacy):
+            stoatArray[i]['pregnant'] = True
+            stoatArray[i]['pregnant_day'] = day
+
+            # if pregnant, make all her non-adult female offspring also pregnant with probabil
+            for n in range(nStoats):
+                if (stoatArray[n]['parentid'] == stoatArray[i]['id'] and 
+                        not stoatArray[n]['male'] and 
+                        streams.drawBernoulli(randomStreams, streams.REPRODUCTION_STREAM, 
+                            probPregnacy)):
+                    stoatArray[n]['pregnant'] = True
+                    stoatArray[n]['pregnant_day'] = day
+
+    addedMating = False
+    for m in range(matingArray.shape[0]):
+        if matingArray[m]['maleid'] == -1:
+            # unused slot
+            matingArray[m]['maleid'] = stoatid
+            matingArray[m]['femaleid'] = stoatArray[i]['id']
+            matingArray[m]['ndays'] = habituationDays 
+            addedMating = True
+            break
+    if not addedMating:
+        raise ValueError('Unable to add mating')
+
+@njit
+def doMaleMating(x, y, stoatid, stoatArray, nStoats, encounterDistance, matingArray,
+                habituationDays, day, probPregnacy, cellHead, stoatHash, hashGeometry,
+                randomStreams):
+    mated = False
+    i = findFemaleToMate(x, y, stoatid, stoatArray, nStoats, encounterDistance, 
+                matingArray, cellHead, stoatHash, hashGeometry)
+    if i != -1:
+        mateWithFemale(stoatid, i, stoatArray, nStoats, matingArray, habituationDays,
+                day, probPregnacy, randomStreams)
+        mated = True
 
     return mated
 
@@ -309,7 +528,7 @@ def doPheromoneInteraction(x, y, stoatid, stoatArray, nStoats, pheromoneArray, e
             break
 
 @njit
-def doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id):
+def doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id, randomStreams):
     """
     Have the stoat give birth. Tries to re-use 'deleted' slots in stoatArray first,
     otherwise adds onto the end.
@@ -317,13 +536,13 @@ def doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id):
 
     x = stoatArray[stoat]['x']
     y = stoatArray[stoat]['y']
-    nKits = np.random.poisson(meanRecruits)
+    nKits = streams.drawPoisson(randomStreams, streams.REPRODUCTION_STREAM, meanRecruits)
 #    print('birth', nKits)
     i = 0
     while nKits > 0 and i < nStoats:
         # go through and find deleted slots for these baby stoats
         if stoatArray[i]['deleted']:
-            male = np.random.random() < 0.5
+            male = streams.drawRandom(randomStreams, streams.REPRODUCTION_STREAM) < 0.5
             stoatArray[i]['deleted'] = False
             stoatArray[i]['x'] = x
             stoatArray[i]['y'] = y
@@ -333,6 +552,8 @@ def doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id):
             stoatArray[i]['pregnant'] = False
             stoatArray[i]['pregnant_day'] = -1
             stoatArray[i]['id'] = Current_Id
+            if stoatArray[i]['id'] != Current_Id:
+                raise ValueError('Too many stoat ids for the compact stoat array')
             stoatArray[i]['homerange'] = False
             Current_Id += 1
             stoatArray[i]['parentid'] = stoatArray[stoat]['id']
@@ -341,7 +562,7 @@ def doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id):
 
     # ok add the rest onto the end
     while nKits > 0:
-        male = np.random.random() < 0.5
+        male = streams.drawRandom(randomStreams, streams.REPRODUCTION_STREAM) < 0.5
         stoatArray[nStoats]['deleted'] = False
         stoatArray[nStoats]['x'] = x
         stoatArray[nStoats]['y'] = y
@@ -351,6 +572,8 @@ def doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id):
         stoatArray[nStoats]['pregnant'] = False
         stoatArray[nStoats]['pregnant_day'] = -1
         stoatArray[nStoats]['id'] = Current_Id
+        if stoatArray[nStoats]['id'] != Current_Id:
+            raise ValueError('Too many stoat ids for the compact stoat array')
         stoatArray[nStoats]['homerange'] = False
         Current_Id += 1
         stoatArray[nStoats]['parentid'] = stoatArray[stoat]['id']
@@ -396,6 +619,480 @@ def checkStoatHasKitsInNest(stoatArray, nStoats, stoatid):
         
     return hasKits
 
+@njit
+def calcBearingToCOA(xdistToCOA, ydistToCOA, distToCOA):
+    """
+    Bearing (radians clockwise from north) towards the centre of attraction
+    from a distance (which must be > 0) in x and y.
+    """
+    # CALC THE ARCSIN
+    asinTH = np.arcsin(xdistToCOA / distToCOA)
+    bearing = 0.0
+    # CONDITIONS WITH ZERO CHANGE IN X DIRECTION
+    if xdistToCOA == 0:
+        bearing = np.arccos(ydistToCOA)
+    # CONDITION WITH CHANGES IN X DIRECTION
+    if ydistToCOA > 0.0:
+        bearing = asinTH
+    if xdistToCOA > 0.0 and ydistToCOA <= 0.0:
+        bearing = np.pi - asinTH
+    if xdistToCOA < 0.0 and ydistToCOA <= 0.0:
+        bearing = -np.pi - asinTH
+    return bearing
+
+@njit
+def killStoat(stoatArray, nStoats, stoat, matingArray, pheromoneInteractionArray,
+            cellHead, stoatHash):
+    """
+    Remove the stoat along with any kits still in its nest and clear
+    its entries in the mating and pheromone interaction registries
+    and the spatial hash.
+    """
+    stoatArray[stoat]['deleted'] = True
+    removeFromStoatHash(stoat, cellHead, stoatHash)
+    # now kill immature all children
+    for i in range(nStoats):
+        if stoatArray[i]['parentid'] == stoatArray[stoat]['id']:
+            stoatArray[i]['deleted'] = True
+            removeFromStoatHash(i, cellHead, stoatHash)
+
+    # and remove from matingArray
+    for i in range(matingArray.shape[0]):
+        if (matingArray[i]['maleid'] == stoatArray[stoat]['id'] or 
+                matingArray[i]['femaleid'] == stoatArray[stoat]['id']):
+            matingArray[i]['maleid'] = -1
+
+    # phermone array
+    for i in range(pheromoneInteractionArray.shape[0]):
+        if pheromoneInteractionArray[i]['stoatid'] == stoatArray[stoat]['id']:
+            pheromoneInteractionArray[i]['stoatid'] = -1
+
+@njit
+def decrementRegistries(pheromoneInteractionArray, matingArray, nDays):
+    """
+    Count down the pheromone interaction and mating registries by nDays,
+    freeing the entries that no longer apply.
+    """
+    # decrement pheromoneInteractionArray
+    for i in range(pheromoneInteractionArray.shape[0]):
+        if pheromoneInteractionArray[i]['stoatid'] != -1:
+            pheromoneInteractionArray[i]['ndays'] -= nDays
+            if pheromoneInteractionArray[i]['ndays'] <= 0:
+                pheromoneInteractionArray[i]['stoatid'] = -1
+
+    # decrement matingArray
+    for i in range(matingArray.shape[0]):
+        if matingArray[i]['maleid'] != -1:
+            matingArray[i]['ndays'] -= nDays
+            if matingArray[i]['ndays'] <= 0:
+                matingArray[i]['maleid'] = -1
+
+@njit
+def makeHomeRangeOffsets(stepScale, stepShape, alphaK, nOffsets, nBurnIn, thin,
+            randomStreams):
+    """
+    Walk a single stoat with home range behaviour (ignoring the coastline)
+    and return an (nOffsets, 2) array of its x and y offsets from the centre
+    of its home range. After the burn in these are draws from the
+    stationary distribution of home range movement.
+
+    The draws come from the movement stream keyed on HOME_RANGE_HOUR
+    (or np.random if randomStreams is empty), so the offsets only depend on
+    the realisation's seed.
+    """
+    offsets = np.empty((nOffsets, 2), dtype=np.float64)
+    x = 0.0
+    y = 0.0
+    nSteps = nBurnIn + nOffsets * thin
+    streams.keyStreams(randomStreams, streams.INITIAL_DAY, streams.HOME_RANGE_HOUR, 0)
+    for step in range(nSteps):
+        stepLength = stepScale * streams.drawWeibull(randomStreams,
+                        streams.MOVEMENT_STREAM, stepShape)
+        distToCOA = np.sqrt(x * x + y * y)
+        if distToCOA == 0:
+            bearing = 0.0
+        else:
+            bearing = calcBearingToCOA(-x, -y, distToCOA)
+        bearing = streams.drawVonMises(randomStreams, streams.MOVEMENT_STREAM, bearing, 
+                        np.log(np.power(distToCOA + 1, alphaK)))
+        x += np.sin(bearing) * stepLength
+        y += np.cos(bearing) * stepLength
+        if step >= nBurnIn and (step - nBurnIn) % thin == 0:
+            idx = (step - nBurnIn) // thin
+            offsets[idx, 0] = x
+            offsets[idx, 1] = y
+    return offsets
+
+@njit
+def fastForwardQuietDays(nQuiet, stoatArray, nStoats, pDaySurv, matingArray,
+            pheromoneInteractionArray, homeRangeOffsets, mask, tlx, tly, brx, bry, pixSize,
+            cellHead, stoatHash, hashGeometry, day, randomStreams):
+    """
+    Advance nQuiet days outside estrous, trapping, births and dispersal in
+    one go. Survival for the whole period is drawn at once and the survivors
+    are moved to a draw from the stationary distribution of home range
+    movement around their home_x/home_y. Returns True if no stoats are left.
+    """
+    # day within the period that each stoat dies on (nQuiet + 1 if it survives)
+    deathDay = np.full(nStoats, nQuiet + 1, dtype=np.int64)
+    for i in range(nStoats):
+        if not stoatArray[i]['deleted']:
+            streams.keyStreams(randomStreams, day, streams.FAST_FORWARD_HOUR, 
+                    stoatArray[i]['id'])
+            d = streams.drawGeometric(randomStreams, streams.MORTALITY_STREAM, 
+                    1.0 - pDaySurv)
+            if d <= nQuiet:
+                deathDay[i] = d
+
+    # kits still in the nest die with their mother
+    for i in range(nStoats):
+        if not stoatArray[i]['deleted'] and stoatArray[i]['parentid'] != -1:
+            for j in range(nStoats):
+                if (not stoatArray[j]['deleted'] and 
+                        stoatArray[j]['id'] == stoatArray[i]['parentid']):
+                    deathDay[i] = min(deathDay[i], deathDay[j])
+                    break
+
+    for i in range(nStoats):
+        if not stoatArray[i]['deleted'] and deathDay[i] <= nQuiet:
+            killStoat(stoatArray, nStoats, i, matingArray, pheromoneInteractionArray,
+                    cellHead, stoatHash)
+
+    eradication = True
+    nOffsets = homeRangeOffsets.shape[0]
+    for i in range(nStoats):
+        if stoatArray[i]['deleted']:
+            continue
+        eradication = False
+        stoatArray[i]['homerange'] = True
+        # kits stay in the nest
+        if stoatArray[i]['parentid'] != -1:
+            continue
+        # give up and leave where it is if there is too much sea
+        streams.keyStreams(randomStreams, day, streams.FAST_FORWARD_HOUR, 
+                stoatArray[i]['id'])
+        for tries in range(100):
+            idx = streams.drawRandint(randomStreams, streams.MOVEMENT_STREAM, 0, nOffsets)
+            newx = stoatArray[i]['home_x'] + homeRangeOffsets[idx, 0]
+            newy = stoatArray[i]['home_y'] + homeRangeOffsets[idx, 1]
+            if checkLocationIsOnIsland(mask, tlx, tly, brx, bry, pixSize, newx, newy):
+                stoatArray[i]['x'] = newx
+                stoatArray[i]['y'] = newy
+                break
+
+    rebuildStoatHash(stoatArray, nStoats, cellHead, stoatHash, hashGeometry)
+    return eradication
+
+@njit
+def getHomerangeBehaviour(stoatArray, nStoats, stoat, inEstrous):
+    """
+    False if the stoat is searching for a mate, True for home range movement
+    """
+    homerangeBehaviour = True # the default
+    if inEstrous:
+        if stoatArray[stoat]['male']:
+            # searching behaviour in this period
+            homerangeBehaviour = False
+        elif not stoatArray[stoat]['pregnant']:
+            # for females, searching behaviour unless pregnant
+            # or has no kits
+            if not checkStoatHasKitsInNest(stoatArray, nStoats, 
+                        stoatArray[stoat]['id']):
+                homerangeBehaviour = False
+    return homerangeBehaviour
+
+@njit
+def isReproductionOver(stoatArray, nStoats):
+    """
+    True if no more young can be born: no kits in the nest, no pregnant
+    females and no adults of one sex. From then on only mortality and 
+    trapping can change the outcome.
+    """
+    nMales = 0
+    nFemales = 0
+    for i in range(nStoats):
+        if stoatArray[i]['deleted']:
+            continue
+        if stoatArray[i]['parentid'] != -1 or stoatArray[i]['pregnant']:
+            return False
+        if stoatArray[i]['male']:
+            nMales += 1
+        else:
+            nFemales += 1
+    return nMales == 0 or nFemales == 0
+
+@njit
+def drawStepLength(stepShape, movementBuffers, movementBufferPos, randomStreams):
+    """
+    A draw from np.random.weibull(stepShape), from the movement stream
+    if using randomStreams otherwise the movement buffers
+    """
+    if randomStreams.shape[0] > 0:
+        return streams.drawWeibull(randomStreams, streams.MOVEMENT_STREAM, stepShape)
+    return movement.drawUnitWeibull(stepShape, movementBuffers, movementBufferPos)
+
+@njit
+def drawNewPosition(x, y, COA_x, COA_y, foundCOA, Kappac, homerangeBehaviour, bearingT_1,
+            stepScale, stepShape, alphaK, directionalVM, mask, tlx, tly, brx, bry, pixSize,
+            movementBuffers, movementBufferPos, vonMisesTable, randomStreams):
+    """
+    Draw the next step of a stoat at x, y moving with respect to COA_x, COA_y.
+    foundCOA is True if that is a mate or decoy with attraction Kappac.
+    Keeps trying until the stoat lands on the island. 
+    Step lengths and directed search bearings come from the buffers
+    (see movement.py) unless using randomStreams. Returns the new x, y and bearing.
+    """
+    newx = x
+    newy = y
+    bearing = bearingT_1
+    newPosOK = False # keep looping until new location on land
+    while not newPosOK:
+
+        stepLength = stepScale * drawStepLength(stepShape, movementBuffers,
+                            movementBufferPos, randomStreams)
+
+        xdistToCOA = COA_x - x
+        ydistToCOA = COA_y - y
+        distToCOA = np.sqrt(xdistToCOA * xdistToCOA + ydistToCOA * ydistToCOA)
+        if distToCOA == 0:
+            bearing = 0.0
+        else:
+            if foundCOA and distToCOA < (stepScale * 1.0):
+                stepLength = (distToCOA * 0.95) * drawStepLength(stepShape,
+                            movementBuffers, movementBufferPos, randomStreams)
+        
+            bearing = calcBearingToCOA(xdistToCOA, ydistToCOA, distToCOA)
+
+        # draw the actual bearing that the stoat moves in from vonMises
+        # note +1 on distance to ensure we don't end up with negative from the log
+        if not foundCOA:
+            # IF NOT HOMERANGE BEHAVIOUR - RANDOM WALK MOVEMENT SEARCH MATE
+            if not homerangeBehaviour:
+                if randomStreams.shape[0] > 0:
+                    bearing = streams.drawVonMises(randomStreams, streams.MOVEMENT_STREAM,
+                            bearingT_1, directionalVM)
+                else:
+                    bearing = movement.drawDirectedBearing(bearingT_1, directionalVM,
+                            movementBuffers, movementBufferPos, vonMisesTable)
+
+            # IF HOMERANGE BEHAVIOUR - NOT ESTROUS PERIOD
+            else:
+                bearing = streams.drawVonMises(randomStreams, streams.MOVEMENT_STREAM,
+                    bearing, np.log(np.power(distToCOA + 1, alphaK)))
+        else:
+            # new COA calculated - Kappac should be set
+            bearing = streams.drawVonMises(randomStreams, streams.MOVEMENT_STREAM,
+                    bearing, Kappac)
+
+        # UPDATE 'bearingT_1' for directed search for next step
+        bearingT_1 = bearing
+
+        # GET DELTA X AND Y, AND NEW X AND Y
+        xDistToMove = np.sin(bearing) * stepLength
+        yDistToMove = np.cos(bearing) * stepLength
+        newx = x + xDistToMove
+        newy = y + yDistToMove
+
+        # is this new location on the island?
+        # otherwise start from the original pos and try again
+        newPosOK = checkLocationIsOnIsland(mask, tlx, tly, 
+                brx, bry, pixSize, newx, newy)
+
+    return newx, newy, bearing
+
+@njit
+def planStoat(stoat, stoatPlan, day, hour, hoursPerDay, stoatArray, nStoats,
+            inEstrous, stepScale, stepShape, alphaK, minK, COA_radius, COA_decay_spatial, 
+            COA_decay_temporal, daysSincePheromoneRelease, pheromoneArray, 
+            pheromoneInteractionArray, encounterDistance, isBirthDay, isTrappingDay, 
+            trapsArray, trapEncDist, trapProbRemoval, pDaySurv, mask, tlx, tly, brx, bry, 
+            pixSize, matingArray, directionalVM, nDaysPregnantBeforeBirth,
+            spatialAttraction, temporalAttraction, attractionBinScale,
+            exactAttraction, cellHead, stoatHash, hashGeometry,
+            noBuffers, noBufferPos, vonMisesTable, parallelStreams):
+    """
+    Decide what one stoat does this hour, as in the body of the stoat loop in
+    runRealisation, without changing anything but stoatPlan[stoat].
+    noBuffers are empty movement buffers so the draws come from this
+    stoat's own copy of parallelStreams.
+    """
+    stoatPlan[stoat]['alive'] = False
+    stoatPlan[stoat]['id'] = stoatArray[stoat]['id']
+    stoatPlan[stoat]['mate'] = -1
+    stoatPlan[stoat]['mateId'] = -1
+    stoatPlan[stoat]['givesBirth'] = False
+    stoatPlan[stoat]['killed'] = False
+    stoatPlan[stoat]['trapped'] = False
+    stoatPlan[stoat]['moved'] = False
+    if stoatArray[stoat]['deleted']:
+        return
+
+    # this stoat's draws, keyed so they don't depend on the thread
+    randomStreams = parallelStreams.copy()
+    streams.keyStreams(randomStreams, day, hour, stoatArray[stoat]['id'])
+
+    stoatPlan[stoat]['alive'] = True
+    x = stoatArray[stoat]['x']
+    y = stoatArray[stoat]['y']
+    homerangeBehaviour = getHomerangeBehaviour(stoatArray, nStoats, stoat, inEstrous)
+    stoatPlan[stoat]['homerange'] = homerangeBehaviour
+
+    if stoatArray[stoat]['male']:
+        # check inEstrous and mature male
+        if inEstrous and stoatArray[stoat]['parentid'] == -1:
+            female = findFemaleToMate(x, y, stoatArray[stoat]['id'],
+                stoatArray, nStoats, encounterDistance, matingArray, cellHead, 
+                stoatHash, hashGeometry)
+            stoatPlan[stoat]['mate'] = female
+            if female != -1:
+                stoatPlan[stoat]['mateId'] = stoatArray[female]['id']
+    elif (isBirthDay and hour == 0 and stoatArray[stoat]['pregnant'] and
+            (day - stoatArray[stoat]['pregnant_day']) > nDaysPregnantBeforeBirth):
+        stoatPlan[stoat]['givesBirth'] = True
+
+    # trapping and mortality
+    killed = False
+    if isTrappingDay:
+        if checkWithinDistanceOfTraps(x, y, trapsArray, trapEncDist):
+            killed = streams.drawBernoulli(randomStreams, streams.TRAPPING_STREAM, 
+                        trapProbRemoval)
+            stoatPlan[stoat]['trapped'] = killed
+    if not killed and hour == hoursPerDay-1:
+        killed = streams.drawBernoulli(randomStreams, streams.MORTALITY_STREAM, 
+                        1.0 - pDaySurv)
+    stoatPlan[stoat]['killed'] = killed
+
+    # offspring that haven't dispersed don't move
+    if killed or stoatArray[stoat]['parentid'] != -1:
+        return
+
+    COA_x = stoatArray[stoat]['home_x']
+    COA_y = stoatArray[stoat]['home_y']
+    Kappac = 0.0
+    foundCOA = False
+    if not homerangeBehaviour:
+        # look for other COA
+        lookingForMale = not stoatArray[stoat]['male']
+        mateResult = checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, 
+                    stoatArray, nStoats, stoatArray[stoat]['id'], COA_radius, 
+                    COA_decay_spatial, COA_decay_temporal, minK, 
+                    daysSincePheromoneRelease, pheromoneArray, pheromoneInteractionArray,
+                    matingArray, spatialAttraction, temporalAttraction,
+                    attractionBinScale, exactAttraction,
+                    cellHead, stoatHash, hashGeometry, randomStreams)
+        if mateResult is not None:
+            COA_x, COA_y, Kappac = mateResult
+            foundCOA = True
+
+    newx, newy, bearing = drawNewPosition(x, y, COA_x, COA_y, foundCOA, Kappac, 
+                homerangeBehaviour, stoatArray[stoat]['bearingT_1'], stepScale, 
+                stepShape, alphaK, directionalVM, mask, tlx, tly, brx, bry, pixSize,
+                noBuffers, noBufferPos, vonMisesTable, randomStreams)
+    stoatPlan[stoat]['moved'] = True
+    stoatPlan[stoat]['x'] = newx
+    stoatPlan[stoat]['y'] = newy
+    stoatPlan[stoat]['bearingT_1'] = bearing
+
+@njit(parallel=True)
+def planStoatHour(stoatPlan, day, hour, hoursPerDay, stoatArray, nStoats,
+            inEstrous, stepScale, stepShape, alphaK, minK, COA_radius, COA_decay_spatial, 
+            COA_decay_temporal, daysSincePheromoneRelease, pheromoneArray, 
+            pheromoneInteractionArray, encounterDistance, isBirthDay, isTrappingDay, 
+            trapsArray, trapEncDist, trapProbRemoval, pDaySurv, mask, tlx, tly, brx, bry, 
+            pixSize, matingArray, directionalVM, nDaysPregnantBeforeBirth,
+            spatialAttraction, temporalAttraction, attractionBinScale,
+            exactAttraction, cellHead, stoatHash, hashGeometry,
+            vonMisesTable, parallelStreams):
+    """
+    Run planStoat for all the stoats in parallel. Each only reads the
+    state of the model as it was at the start of the hour.
+    """
+    # the movement buffers can't be shared between threads
+    noBuffers = np.empty((2, 0), dtype=np.float64)
+    noBufferPos = np.zeros(2, dtype=np.int64)
+    for stoat in prange(nStoats):
+        planStoat(stoat, stoatPlan, day, hour, hoursPerDay, stoatArray, 
+            nStoats, inEstrous, stepScale, stepShape, alphaK, minK, COA_radius, 
+            COA_decay_spatial, COA_decay_temporal, daysSincePheromoneRelease, 
+            pheromoneArray, pheromoneInteractionArray, encounterDistance, isBirthDay, 
+            isTrappingDay, trapsArray, trapEncDist, trapProbRemoval, pDaySurv, mask, 
+            tlx, tly, brx, bry, pixSize, matingArray, directionalVM, 
+            nDaysPregnantBeforeBirth, spatialAttraction, temporalAttraction, 
+            attractionBinScale, exactAttraction, cellHead,
+            stoatHash, hashGeometry, noBuffers, noBufferPos, vonMisesTable, parallelStreams)
+
+@njit
+def applyStoatHour(stoatPlan, day, hour, stoatArray, nStoats, Current_Id,
+            pheromoneArray, encounterDistance, pheromoneInteractionArray, habituationDays,
+            matingArray, probPregnacy, meanRecruits, stoatDebugTrapping, cellHead,
+            stoatHash, hashGeometry, parallelStreams):
+    """
+    Apply the plans made by planStoatHour in stoat order: matings, births,
+    pheromone interactions, deaths and moves. 
+    Returns nStoats, Current_Id and the number alive at the start of the hour.
+    """
+    nAlive = 0
+    nStoatsAtStart = nStoats
+    for stoat in range(nStoatsAtStart):
+        if not stoatPlan[stoat]['alive']:
+            continue
+        nAlive += 1
+        # kits die with their mother, and a birth earlier this hour can 
+        # reuse their slot
+        if (stoatArray[stoat]['deleted'] or 
+                stoatArray[stoat]['id'] != stoatPlan[stoat]['id']):
+            continue
+        stoatArray[stoat]['homerange'] = stoatPlan[stoat]['homerange']
+        streams.keyStreams(parallelStreams, day, hour, stoatArray[stoat]['id'])
+
+        mated = False
+        female = stoatPlan[stoat]['mate']
+        if (female != -1 and not stoatArray[female]['deleted'] and
+                stoatArray[female]['id'] == stoatPlan[stoat]['mateId']):
+            mateWithFemale(stoatArray[stoat]['id'], female, stoatArray, nStoats, 
+                    matingArray, habituationDays, day, probPregnacy, parallelStreams)
+            mated = True
+        if stoatPlan[stoat]['givesBirth']:
+            nStoats, Current_Id = doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id,
+                    parallelStreams)
+            rebuildStoatHash(stoatArray, nStoats, cellHead, stoatHash, hashGeometry)
+
+        if not mated:
+            doPheromoneInteraction(stoatArray[stoat]['x'], stoatArray[stoat]['y'],  
+                stoatArray[stoat]['id'], stoatArray, nStoats, 
+                pheromoneArray, encounterDistance, pheromoneInteractionArray, habituationDays)
+
+        if stoatPlan[stoat]['killed']:
+            if stoatPlan[stoat]['trapped'] and stoatDebugTrapping is not None:
+                stoatDebugTrapping[day] += 1
+            killStoat(stoatArray, nStoats, stoat, matingArray, pheromoneInteractionArray,
+                    cellHead, stoatHash)
+            continue
+
+        if stoatPlan[stoat]['moved']:
+            stoatArray[stoat]['x'] = stoatPlan[stoat]['x']
+            stoatArray[stoat]['y'] = stoatPlan[stoat]['y']
+            stoatArray[stoat]['bearingT_1'] = stoatPlan[stoat]['bearingT_1']
+            moveInStoatHash(stoat, stoatPlan[stoat]['x'], stoatPlan[stoat]['y'], 
+                    cellHead, stoatHash, hashGeometry)
+
+    return nStoats, Current_Id, nAlive
+
+@njit
+def saveKernelState(kernelState, day, nStoats, Current_Id, inEstrous, 
+            daysSincePheromoneRelease, debugIndex, eradication, finished):
+    """
+    Store the local state of runRealisation so it can carry on from day
+    """
+    kernelState[0]['day'] = day
+    kernelState[0]['nStoats'] = nStoats
+    kernelState[0]['Current_Id'] = Current_Id
+    kernelState[0]['inEstrous'] = inEstrous
+    kernelState[0]['daysSincePheromoneRelease'] = daysSincePheromoneRelease
+    kernelState[0]['debugIndex'] = debugIndex
+    kernelState[0]['eradicated'] = eradication
+    kernelState[0]['finished'] = finished
+
 @njit
 def inArray(value, array):
     """
@@ -410,277 +1107,431 @@ def inArray(value, array):
                 break
     return found
 
-@njit
-def runRealisation(nDays, hoursPerDay, stoatArray, nStoats, stepScale, stepShape, 
-            alphaK, minK, pheromoneReleaseDays, COA_radius, COA_decay_spatial, COA_decay_temporal,
-            estrousStartDays, estrousEndDays, pheromoneArray, pheromoneInteractionArray, habituationDays,
-            encounterDistance, birthDays, meanRecruits, trappingDays, trapsArray,
-            trapEncDist, trapProbRemoval, pDaySurv, dispersalDays,
-            mask, tlx, tly, brx, bry, pixSize, matingArray, Current_Id, stoatDebugEstrous,
-            stoatDebugDaysSincePheromone, stoatDebugFrame, stoatDebugTrapping, directionalVM,
-            nDaysPregnantBeforeBirth, probPregnacy):
+def makeKernelState(nStoats, Current_Id):
     """
-    Main function - iterates through all the days, hours etc
+    Create the state for a realisation that has not started yet.
     """
-    debugIndex = 0
+    kernelState = np.zeros(1, dtype=KERNEL_STATE_DTYPE)
+    kernelState['day'] = 0
+    kernelState['nStoats'] = nStoats
+    kernelState['Current_Id'] = Current_Id
+    kernelState['inEstrous'] = False
+    kernelState['daysSincePheromoneRelease'] = -1
+    kernelState['debugIndex'] = 0
+    kernelState['eradicated'] = False
+    kernelState['finished'] = False
+    kernelState['stoatHours'] = 0
+    return kernelState
+
+# everything runRealisation needs for a realisation, passed as one argument
+KERNEL_INPUT_FIELDS = ['nDays', 'hoursPerDay', 'stoatArray', 'kernelState',
+            'stepScale', 'stepShape', 'alphaK', 'minK', 'pheromoneReleaseDays',
+            'COA_radius', 'COA_decay_spatial', 'COA_decay_temporal',
+            'estrousStartDays', 'estrousEndDays', 'pheromoneArray',
+            'pheromoneInteractionArray', 'habituationDays', 'encounterDistance',
+            'birthDays', 'meanRecruits', 'trappingDays', 'trapsArray', 'trapEncDist',
+            'trapProbRemoval', 'pDaySurv', 'dispersalDays', 'mask', 'tlx', 'tly',
+            'brx', 'bry', 'pixSize', 'matingArray', 'stoatDebugEstrous',
+            'stoatDebugDaysSincePheromone', 'stoatDebugFrame', 'stoatDebugTrapping',
+            'directionalVM', 'nDaysPregnantBeforeBirth', 'probPregnacy',
+            'quietRunLength', 'fastForwardMinDays', 'homeRangeOffsets',
+            'absorbingRunLength', 'absorbingTailMinDays',
+            'spatialAttraction', 'temporalAttraction', 'attractionBinScale',
+            'exactAttraction', 'decoyAttractionDays', 'decoyInteractionDays',
+            'parallelStoats',
+            'parallelStreams', 'stoatPlan', 'cellHead', 'stoatHash', 'hashGeometry',
+            'movementBuffers', 'movementBufferPos', 'vonMisesTable', 'randomStreams']
+KernelInputs = namedtuple('KernelInputs', KERNEL_INPUT_FIELDS)
+
+# flags (recordMovie, useDecoys, useTrapping) of the usual kernels
+PRODUCTION_KERNEL = (False, True, True)
+RECORD_KERNEL = (True, True, True)
+NO_DECOY_KERNEL = (False, False, True)
+NO_TRAPPING_KERNEL = (False, True, False)
+
+# compiled kernels by their flags
+KERNEL_VARIANTS = {}
+
+def makeRealisationKernel(recordMovie, useDecoys, useTrapping):
+    """
+    Create a version of runRealisation for one configuration. The flags
+    are constants to numba so the code for the features that are turned
+    off isn't compiled in at all:
 
-    daysSincePheromoneRelease = -1
-    inEstrous = False
-    Kappac = 0.0
-    for day in range(nDays):
+    recordMovie - fill in the stoatDebug arrays for the movie (save=True)
+    useDecoys - release decoys and record stoats interacting with them
+    useTrapping - trap on trappingDays
+    """
+    @njit
+    def runRealisation(k, stopDay):
+        """
+        Main function - iterates through all the days, hours etc.
+        k is a KernelInputs (see makeKernelInputs).
+
+        Starts at kernelState[0]['day'] and stops before stopDay (or nDays),
+        leaving kernelState ready to carry on from there.
+
+        Runs of at least fastForwardMinDays quiet days (see getQuietRunLength)
+        are done in one step by fastForwardQuietDays. So are runs of at least
+        absorbingTailMinDays days without trapping or estrous (see 
+        getAbsorbingRunLength)
+        once no more young can be born (see isReproductionOver).
+
+        If parallelStoats is True each hour is done by planStoatHour (in 
+        parallel) and applyStoatHour. Random numbers then come from 
+        parallelStreams, keyed on the day, hour and stoat, so the results don't
+        depend on the number of threads.
+
+        randomStreams (from streams.makeStreams) gives each purpose its own
+        stream keyed on the day, hour and stoat for common random numbers.
+        If it is empty the draws come from np.random.
+
+        cellHead, stoatHash and hashGeometry (from makeStoatHash) must hold the
+        live stoats and are kept up to date as they move, are born and die.
+        """
+        nDays = k.nDays
+        hoursPerDay = k.hoursPerDay
+        stoatArray = k.stoatArray
+        kernelState = k.kernelState
+        stepScale = k.stepScale
+        stepShape = k.stepShape
+        alphaK = k.alphaK
+        minK = k.minK
+        pheromoneReleaseDays = k.pheromoneReleaseDays
+        COA_radius = k.COA_radius
+        COA_decay_spatial = k.COA_decay_spatial
+        COA_decay_temporal = k.COA_decay_temporal
+        estrousStartDays = k.estrousStartDays
+        estrousEndDays = k.estrousEndDays
+        pheromoneArray = k.pheromoneArray
+        pheromoneInteractionArray = k.pheromoneInteractionArray
+        habituationDays = k.habituationDays
+        encounterDistance = k.encounterDistance
+        birthDays = k.birthDays
+        meanRecruits = k.meanRecruits
+        trappingDays = k.trappingDays
+        trapsArray = k.trapsArray
+        trapEncDist = k.trapEncDist
+        trapProbRemoval = k.trapProbRemoval
+        pDaySurv = k.pDaySurv
+        dispersalDays = k.dispersalDays
+        mask = k.mask
+        tlx = k.tlx
+        tly = k.tly
+        brx = k.brx
+        bry = k.bry
+        pixSize = k.pixSize
+        matingArray = k.matingArray
+        stoatDebugEstrous = k.stoatDebugEstrous
+        stoatDebugDaysSincePheromone = k.stoatDebugDaysSincePheromone
+        stoatDebugFrame = k.stoatDebugFrame
+        stoatDebugTrapping = k.stoatDebugTrapping
+        directionalVM = k.directionalVM
+        nDaysPregnantBeforeBirth = k.nDaysPregnantBeforeBirth
+        probPregnacy = k.probPregnacy
+        quietRunLength = k.quietRunLength
+        fastForwardMinDays = k.fastForwardMinDays
+        homeRangeOffsets = k.homeRangeOffsets
+        absorbingRunLength = k.absorbingRunLength
+        absorbingTailMinDays = k.absorbingTailMinDays
+        spatialAttraction = k.spatialAttraction
+        temporalAttraction = k.temporalAttraction
+        attractionBinScale = k.attractionBinScale
+        exactAttraction = k.exactAttraction
+        decoyAttractionDays = k.decoyAttractionDays
+        decoyInteractionDays = k.decoyInteractionDays
+        parallelStoats = k.parallelStoats
+        parallelStreams = k.parallelStreams
+        stoatPlan = k.stoatPlan
+        cellHead = k.cellHead
+        stoatHash = k.stoatHash
+        hashGeometry = k.hashGeometry
+        movementBuffers = k.movementBuffers
+        movementBufferPos = k.movementBufferPos
+        vonMisesTable = k.vonMisesTable
+        randomStreams = k.randomStreams
+        if not useDecoys:
+            # nothing to search or interact with
+            pheromoneArray = pheromoneArray[:0]
+
+        nStoats = kernelState[0]['nStoats']
+        Current_Id = kernelState[0]['Current_Id']
+        debugIndex = kernelState[0]['debugIndex']
+        daysSincePheromoneRelease = kernelState[0]['daysSincePheromoneRelease']
+        inEstrous = kernelState[0]['inEstrous']
+        eradication = kernelState[0]['eradicated']
+        if kernelState[0]['finished']:
+            return eradication
+
+        stopDay = min(stopDay, nDays)
+        Kappac = 0.0
+        day = kernelState[0]['day']
+        while day < stopDay:
+
+            ############################
+            ##
+            ## Break out with failure if a lot of stoats
+            ##
+            if nStoats > 175:
+                eradication = False
+                print('nStoats > 75 and failed eradication: ', nStoats)
+                saveKernelState(kernelState, day, nStoats, Current_Id, inEstrous,
+                    daysSincePheromoneRelease, debugIndex, eradication, True)
+                break
+            ##
+            ############################
+
+
+            if useDecoys and inArray(day, pheromoneReleaseDays):
+                daysSincePheromoneRelease = 0
+
+            if inArray(day, estrousStartDays):
+                inEstrous = True
+            elif inArray(day, estrousEndDays):
+                inEstrous = False
+
+            if inArray(day, dispersalDays):
+                # disperse males and juvenile stoats to shake thing up a bit
+                for i in range(nStoats):
+                    if not stoatArray[i]['deleted'] and (stoatArray[i]['parentid'] != -1 or
+                                    stoatArray[i]['male']):
+                        streams.keyStreams(randomStreams, day, streams.DISPERSAL_HOUR, 
+                                stoatArray[i]['id'])
+                        x, y = createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixSize,
+                                randomStreams, streams.DISPERSAL_STREAM)
+                        stoatArray[i]['x'] = x
+                        stoatArray[i]['y'] = y
+                        stoatArray[i]['home_x'] = x
+                        stoatArray[i]['home_y'] = y
+                        stoatArray[i]['bearingT_1'] = streams.drawUniform(randomStreams,
+                                streams.DISPERSAL_STREAM, -np.pi, np.pi)
+                    # if a child, set so now an adult
+                    stoatArray[i]['parentid'] = -1
+                rebuildStoatHash(stoatArray, nStoats, cellHead, stoatHash, hashGeometry)
+
+            # no decoy pass on days the decoys can't attract or habituate 
+            # stoats to anything that matters (see getDecoyDays)
+            searchPheromoneArray = pheromoneArray
+            if not decoyAttractionDays[day]:
+                searchPheromoneArray = pheromoneArray[:0]
+            interactPheromoneArray = pheromoneArray
+            if not decoyInteractionDays[day]:
+                interactPheromoneArray = pheromoneArray[:0]
+
+            nQuiet = min(quietRunLength[day], stopDay - day)
+            if nQuiet < fastForwardMinDays:
+                nQuiet = 0
+            # once no more young can be born nothing but trapping and mortality
+            # matters, so the days up to the next trapping can be skipped too
+            nAbsorbing = min(absorbingRunLength[day], stopDay - day)
+            if (nAbsorbing > nQuiet and nAbsorbing >= absorbingTailMinDays and
+                    isReproductionOver(stoatArray, nStoats)):
+                nQuiet = nAbsorbing
+            if nQuiet > 0:
+                # nothing happening but home range movement and mortality
+                eradication = fastForwardQuietDays(nQuiet, stoatArray, nStoats, pDaySurv,
+                        matingArray, pheromoneInteractionArray, homeRangeOffsets,
+                        mask, tlx, tly, brx, bry, pixSize, cellHead, stoatHash, hashGeometry,
+                        day, randomStreams)
+                if daysSincePheromoneRelease != -1:
+                    daysSincePheromoneRelease += nQuiet
+                decrementRegistries(pheromoneInteractionArray, matingArray, nQuiet)
+                debugIndex += nQuiet * hoursPerDay
+                day += nQuiet
+                if eradication:
+                    print('eradicated')
+                    saveKernelState(kernelState, day, nStoats, Current_Id, inEstrous,
+                        daysSincePheromoneRelease, debugIndex, True, True)
+                    return True
+                saveKernelState(kernelState, day, nStoats, Current_Id, inEstrous,
+                    daysSincePheromoneRelease, debugIndex, eradication, day >= nDays)
+                continue
 
-        ############################
-        ##
-        ## Break out with failure if a lot of stoats
-        ##
-        if nStoats > 175:
-            eradication = False
-            print('nStoats > 75 and failed eradication: ', nStoats)
-            break
-        ##
-        ############################
+            for hour in range(hoursPerDay):
+                if parallelStoats:
+                    isTrappingDay = useTrapping and inArray(day, trappingDays)
+                    # decide what each stoat does in parallel then apply it in order
+                    planStoatHour(stoatPlan, day, hour, hoursPerDay, stoatArray, 
+                        nStoats, inEstrous, stepScale, stepShape, alphaK, minK, COA_radius, 
+                        COA_decay_spatial, COA_decay_temporal, daysSincePheromoneRelease, 
+                        searchPheromoneArray, pheromoneInteractionArray, encounterDistance, 
+                        inArray(day, birthDays), isTrappingDay, trapsArray, trapEncDist, 
+                        trapProbRemoval, pDaySurv, mask, tlx, tly, brx, bry, pixSize, 
+                        matingArray, directionalVM, nDaysPregnantBeforeBirth,
+                        spatialAttraction, temporalAttraction, attractionBinScale,
+                        exactAttraction, cellHead, stoatHash, 
+                        hashGeometry, vonMisesTable, parallelStreams)
+                    nStoats, Current_Id, nAlive = applyStoatHour(stoatPlan, 
+                        day, hour, stoatArray, nStoats, Current_Id, interactPheromoneArray, 
+                        encounterDistance, pheromoneInteractionArray, habituationDays,
+                        matingArray, probPregnacy, meanRecruits, stoatDebugTrapping,
+                        cellHead, stoatHash, hashGeometry, parallelStreams)
+                    eradication = nAlive == 0
+                    kernelState[0]['stoatHours'] += nAlive
+                else:
+                    count = 0
+                    #print('sdsds', nStoats, day, hour, stoatArray)
+                    eradication = True
+                    for stoat in range(nStoats):
+                        #if stoat in stoatDict:
+                        #    stoatDict[stoat].append((stoatArray[stoat]['x'], stoatArray[stoat]['y']))
+                        #else:
+                        #    stoatDict[stoat] = [(stoatArray[stoat]['x'], stoatArray[stoat]['y'])]
+                        if not stoatArray[stoat]['deleted']:
+                            eradication = False  # at least one individual exists
+                            count += 1
+                            streams.keyStreams(randomStreams, day, hour, 
+                                    stoatArray[stoat]['id'])
+
+                            COA_x = stoatArray[stoat]['home_x']
+                            COA_y = stoatArray[stoat]['home_y']
+                            x = stoatArray[stoat]['x']
+                            y = stoatArray[stoat]['y']
+
+                            homerangeBehaviour = getHomerangeBehaviour(stoatArray, nStoats, 
+                                                stoat, inEstrous)
+
+                            # store, for movie
+                            stoatArray[stoat]['homerange'] = homerangeBehaviour
+
+                            # if male search for non pregnant females
+                            mated = False
+                            if stoatArray[stoat]['male']:
+                                # check inEstrous and mature male
+                                if inEstrous and stoatArray[stoat]['parentid'] == -1:
+                                    mated = doMaleMating(x, y, stoatArray[stoat]['id'], 
+                                        stoatArray, nStoats, encounterDistance, matingArray, 
+                                        habituationDays, day, probPregnacy, cellHead, 
+                                        stoatHash, hashGeometry, randomStreams)
+                            elif (inArray(day, birthDays) and hour == 0 and stoatArray[stoat]['pregnant'] and
+                                    (day - stoatArray[stoat]['pregnant_day']) > nDaysPregnantBeforeBirth):
+                                # note: only one hour on this day results in giving birth
+                                # female will give birth
+                                #print('adding stoats', meanRecruits)
+                                nStoats, Current_Id = doBirth(stoatArray, nStoats, stoat, meanRecruits, 
+                                        Current_Id, randomStreams)
+                                rebuildStoatHash(stoatArray, nStoats, cellHead, stoatHash, 
+                                        hashGeometry)
+
+                            # interact with pheromones
+                            # TODO: just mated females won't do pheromones?
+                            if useDecoys and not mated:
+                                doPheromoneInteraction(x, y,  stoatArray[stoat]['id'],
+                                    stoatArray, nStoats, 
+                                    interactPheromoneArray, encounterDistance, pheromoneInteractionArray, habituationDays)
+
+                            # trapping and mortality
+                            # trapping done at each hour
+                            killed = False
+                            if useTrapping and inArray(day, trappingDays):
+                                if checkWithinDistanceOfTraps(x, y, trapsArray, trapEncDist):
+    ###                            print('within trap distance')
+                                    killed = streams.drawBernoulli(randomStreams, 
+                                            streams.TRAPPING_STREAM, trapProbRemoval)
+                                    if killed:
+    ###                                print('killed by traps')
+                                        if recordMovie:
+                                            stoatDebugTrapping[day] += 1
+
+                            # mortality done on the last hour per day
+                            if not killed and hour == hoursPerDay-1:
+                                killed = streams.drawBernoulli(randomStreams, 
+                                        streams.MORTALITY_STREAM, 1.0 - pDaySurv)
+    #                        if killed:
+    #                            print('Natural Mortality')
 
+                            if killed:
+    #                        print('killed')
+                                killStoat(stoatArray, nStoats, stoat, matingArray, 
+                                        pheromoneInteractionArray, cellHead, stoatHash)
+
+                                # don't bother with movement now
+                                continue
+
+
+                            # Now do movement
+                            # skip this bit if it is offspring that hasn't dispered yet
+                            if stoatArray[stoat]['parentid'] != -1:
+                                continue
+
+                            mateResult = None # stays None if homerange
 
-        if inArray(day, pheromoneReleaseDays):
-            daysSincePheromoneRelease = 0
 
-        if inArray(day, estrousStartDays):
-            inEstrous = True
-        elif inArray(day, estrousEndDays):
-            inEstrous = False
 
-        if inArray(day, dispersalDays):
-            # disperse males and juvenile stoats to shake thing up a bit
-            for i in range(nStoats):
-                if not stoatArray[i]['deleted'] and (stoatArray[i]['parentid'] != -1 or
-                                stoatArray[i]['male']):
-                    x, y = createRandomLocationOnIsland(mask, tlx, tly, brx, bry, pixSize)
-                    stoatArray[i]['x'] = x
-                    stoatArray[i]['y'] = y
-                    stoatArray[i]['home_x'] = x
-                    stoatArray[i]['home_y'] = y
-                    stoatArray[i]['bearingT_1'] = np.random.uniform(-np.pi, np.pi)
-                # if a child, set so now an adult
-                stoatArray[i]['parentid'] = -1
-
-        for hour in range(hoursPerDay):
-            count = 0
-            #print('sdsds', nStoats, day, hour, stoatArray)
-            eradication = True
-            for stoat in range(nStoats):
-                #if stoat in stoatDict:
-                #    stoatDict[stoat].append((stoatArray[stoat]['x'], stoatArray[stoat]['y']))
-                #else:
-                #    stoatDict[stoat] = [(stoatArray[stoat]['x'], stoatArray[stoat]['y'])]
-                if not stoatArray[stoat]['deleted']:
-                    eradication = False  # at least one individual exists
-                    count += 1
-
-                    COA_x = stoatArray[stoat]['home_x']
-                    COA_y = stoatArray[stoat]['home_y']
-                    x = stoatArray[stoat]['x']
-                    y = stoatArray[stoat]['y']
-
-                    homerangeBehaviour = True # the default
-                    if inEstrous:
-                        if stoatArray[stoat]['male']:
-                            # searching behaviour in this period
-                            homerangeBehaviour = False
-                        elif not stoatArray[stoat]['pregnant']:
-                            # for females, searching behaviour unless pregnant
-                            # or has no kits
-                            if not checkStoatHasKitsInNest(stoatArray, nStoats, 
-                                        stoatArray[stoat]['id']):
-                                homerangeBehaviour = False
-                        
-                    # store, for movie
-                    stoatArray[stoat]['homerange'] = homerangeBehaviour
-                            
-                    # if male search for non pregnant females
-                    mated = False
-                    if stoatArray[stoat]['male']:
-                        # check inEstrous and mature male
-                        if inEstrous and stoatArray[stoat]['parentid'] == -1:
-                            mated = doMaleMating(x, y, stoatArray[stoat]['id'], 
-                                stoatArray, nStoats, encounterDistance, matingArray, 
-                                habituationDays, day, probPregnacy)
-                    elif (inArray(day, birthDays) and hour == 0 and stoatArray[stoat]['pregnant'] and
-                            (day - stoatArray[stoat]['pregnant_day']) > nDaysPregnantBeforeBirth):
-                        # note: only one hour on this day results in giving birth
-                        # female will give birth
-                        #print('adding stoats', meanRecruits)
-                        nStoats, Current_Id = doBirth(stoatArray, nStoats, stoat, meanRecruits, Current_Id)
-
-                    # interact with pheromones
-                    # TODO: just mated females won't do pheromones?
-                    if not mated:
-                        doPheromoneInteraction(x, y,  stoatArray[stoat]['id'],
-                            stoatArray, nStoats, 
-                            pheromoneArray, encounterDistance, pheromoneInteractionArray, habituationDays)
-
-                    # trapping and mortality
-                    # trapping done at each hour
-                    killed = False
-                    if inArray(day, trappingDays):
-                        if checkWithinDistanceOfTraps(x, y, trapsArray, trapEncDist):
-###                            print('within trap distance')
-                            killed = np.random.binomial(1, trapProbRemoval) == 1
-                            if killed:
-###                                print('killed by traps')
-                                if stoatDebugTrapping is not None:
-                                    stoatDebugTrapping[day] += 1
-
-                    # mortality done on the last hour per day
-                    if not killed and hour == hoursPerDay-1:
-                        killed = np.random.binomial(1, 1.0 - pDaySurv) == 1
-#                        if killed:
-#                            print('Natural Mortality')
-
-                    if killed:
-#                        print('killed')
-                        stoatArray[stoat]['deleted'] = True
-                        # now kill immature all children
-                        for i in range(nStoats):
-                            if stoatArray[i]['parentid'] == stoatArray[stoat]['id']:
-                                stoatArray[i]['deleted'] = True
-
-                        # and remove from matingArray
-                        for i in range(matingArray.shape[0]):
-                            if (matingArray[i]['maleid'] == stoatArray[stoat]['id'] or 
-                                    matingArray[i]['femaleid'] == stoatArray[stoat]['id']):
-                                matingArray[i]['maleid'] = -1
-
-                        # phermone array
-                        for i in range(pheromoneInteractionArray.shape[0]):
-                            if pheromoneInteractionArray[i]['stoatid'] == stoatArray[stoat]['id']:
-                                pheromoneInteractionArray[i]['stoatid'] = -1
-
-                        # don't bother with movement now
-                        continue
-                            
-
-                    # Now do movement
-                    # skip this bit if it is offspring that hasn't dispered yet
-                    if stoatArray[stoat]['parentid'] != -1:
-                        continue
-
-                    mateResult = None # stays None if homerange
-
-
-
-                    if not homerangeBehaviour:
-                        # look for other COA
-                        lookingForMale = not stoatArray[stoat]['male']
-                        mateResult = checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, 
-                                    stoatArray, nStoats, stoatArray[stoat]['id'], COA_radius, 
-                                    COA_decay_spatial, COA_decay_temporal, minK, 
-                                    daysSincePheromoneRelease, pheromoneArray, pheromoneInteractionArray,
-                                    matingArray)
-#                        if mateResult is None:
-#                            print('Was unable to find new COA')
-
-                    if mateResult is not None:
-                        COA_x, COA_y, Kappac = mateResult
-
-
-
-
-
-
-                    newPosOK = False # keep looping until new location on land
-                    while not newPosOK:
-
-                        stepLength = stepScale * np.random.weibull(stepShape)
-
-                        xdistToCOA = COA_x - x
-                        ydistToCOA = COA_y - y
-                        distToCOA = np.sqrt(xdistToCOA * xdistToCOA + ydistToCOA * ydistToCOA)
-                        if distToCOA == 0:
-                            bearing = 0.0
-                        else:
-                            if mateResult is not None and distToCOA < (stepScale * 1.0):
-                                stepLength = (distToCOA * 0.95) * np.random.weibull(stepShape)
-                        
-                            # CALC THE ARCSIN
-                            asinTH = np.arcsin(xdistToCOA / distToCOA)
-                            # CONDITIONS WITH ZERO CHANGE IN X DIRECTION
-                            if xdistToCOA == 0:
-                                bearing = np.arccos(ydistToCOA)
-                            # CONDITION WITH CHANGES IN X DIRECTION
-                            if ydistToCOA > 0.0:
-                                bearing = asinTH
-                            if xdistToCOA > 0.0 and ydistToCOA <= 0.0:
-                                bearing = np.pi - asinTH
-                            if xdistToCOA < 0.0 and ydistToCOA <= 0.0:
-                                bearing = -np.pi - asinTH
-
-                        # draw the actual bearing that the stoat moves in from vonMises
-                        # note +1 on distance to ensure we don't end up with negative from the log
-                        #print(bearing, distToCOA, stepLength)
-                        if mateResult is None:
-                            # IF NOT HOMERANGE BEHAVIOUR - RANDOM WALK MOVEMENT SEARCH MATE
                             if not homerangeBehaviour:
-                                bearing = stoatArray[stoat]['bearingT_1']
-                                bearing = np.random.vonmises(bearing, directionalVM)
-#                                print('no mates and not HomeRangeBehaviour, bearing=', bearing)
-
-                            # IF HOMERANGE BEHAVIOUR - NOT ESTROUS PERIOD
-                            else:
-                                bearing = np.random.vonmises(bearing, 
-                                    np.log(np.power(distToCOA + 1, alphaK)))
-                        else:
-                            # new COA calculated - Kappac should be set
-                            bearing = np.random.vonmises(bearing, Kappac)
-
-                        # UPDATE 'bearingT_1' for directed search for next step
-                        stoatArray[stoat]['bearingT_1'] = bearing
-
-                        # GET DELTA X AND Y, AND NEW X AND Y
-                        xDistToMove = np.sin(bearing) * stepLength
-                        yDistToMove = np.cos(bearing) * stepLength
-                        newx = stoatArray[stoat]['x'] + xDistToMove
-                        newy = stoatArray[stoat]['y'] + yDistToMove
-
-                        # is this new location on the island?
-                        # otherwise start from the original pos and try again
-                        newPosOK = checkLocationIsOnIsland(mask, tlx, tly, 
-                                brx, bry, pixSize, newx, newy)
-                        if newPosOK:
+                                # look for other COA
+                                lookingForMale = not stoatArray[stoat]['male']
+                                mateResult = checkForEstrousMatesAndDecoysInRadius(lookingForMale, x, y, 
+                                            stoatArray, nStoats, stoatArray[stoat]['id'], COA_radius, 
+                                            COA_decay_spatial, COA_decay_temporal, minK, 
+                                            daysSincePheromoneRelease, searchPheromoneArray, pheromoneInteractionArray,
+                                            matingArray, spatialAttraction, temporalAttraction,
+                                            attractionBinScale, exactAttraction,
+                                            cellHead, stoatHash, hashGeometry, randomStreams)
+    #                        if mateResult is None:
+    #                            print('Was unable to find new COA')
+
+                            if mateResult is not None:
+                                COA_x, COA_y, Kappac = mateResult
+
+                            newx, newy, bearing = drawNewPosition(x, y, COA_x, COA_y, 
+                                mateResult is not None, Kappac, homerangeBehaviour, 
+                                stoatArray[stoat]['bearingT_1'], stepScale, stepShape, alphaK, 
+                                directionalVM, mask, tlx, tly, brx, bry, pixSize, 
+                                movementBuffers, movementBufferPos, vonMisesTable, randomStreams)
                             stoatArray[stoat]['x'] = newx
                             stoatArray[stoat]['y'] = newy
+                            # UPDATE 'bearingT_1' for directed search for next step
+                            stoatArray[stoat]['bearingT_1'] = bearing
+                            moveInStoatHash(stoat, newx, newy, cellHead, stoatHash, hashGeometry)
 
-#            print(count, nStoats, day, hour)
-            if stoatDebugEstrous is not None:
-                stoatDebugEstrous[debugIndex] = inEstrous
-                stoatDebugDaysSincePheromone[debugIndex] = daysSincePheromoneRelease
-                for i in range(stoatArray.shape[0]):
-                    stoatDebugFrame[debugIndex, i] = stoatArray[i]
-
-            debugIndex += 1
-            if eradication:
-                print('eradicated')
-                return True
-
-
-        if daysSincePheromoneRelease != -1:
-            daysSincePheromoneRelease += 1
-
-        # decrement pheromoneInteractionArray
-        for i in range(pheromoneInteractionArray.shape[0]):
-            if pheromoneInteractionArray[i]['stoatid'] != -1:
-                pheromoneInteractionArray[i]['ndays'] -= 1
-                if pheromoneInteractionArray[i]['ndays'] == 0:
-                    pheromoneInteractionArray[i]['stoatid'] = -1
-
-        # decrement matingArray
-        for i in range(matingArray.shape[0]):
-            if matingArray[i]['maleid'] != -1:
-                matingArray[i]['ndays'] -= 1
-                if matingArray[i]['ndays'] == 0:
-                    matingArray[i]['maleid'] = -1
-                
+                    kernelState[0]['stoatHours'] += count
+    #            print(count, nStoats, day, hour)
+                if recordMovie:
+                    stoatDebugEstrous[debugIndex] = inEstrous
+                    stoatDebugDaysSincePheromone[debugIndex] = daysSincePheromoneRelease
+                    for i in range(stoatArray.shape[0]):
+                        stoatDebugFrame[debugIndex, i] = stoatArray[i]
 
-    return eradication
+                debugIndex += 1
+                if eradication:
+                    print('eradicated')
+                    saveKernelState(kernelState, day + 1, nStoats, Current_Id, inEstrous,
+                        daysSincePheromoneRelease, debugIndex, True, True)
+                    return True
+
+
+            if daysSincePheromoneRelease != -1:
+                daysSincePheromoneRelease += 1
+
+            # decrement pheromoneInteractionArray and matingArray
+            decrementRegistries(pheromoneInteractionArray, matingArray, 1)
+
+            # day complete - save where we are up to
+            day += 1
+            saveKernelState(kernelState, day, nStoats, Current_Id, inEstrous,
+                daysSincePheromoneRelease, debugIndex, eradication, day >= nDays)
+
+        return eradication
+
+    return runRealisation
+
+def getRealisationKernel(recordMovie, useDecoys, useTrapping):
+    """
+    The kernel for the given flags, compiled the first time it is asked for
+    """
+    key = (bool(recordMovie), bool(useDecoys), bool(useTrapping))
+    if key not in KERNEL_VARIANTS:
+        KERNEL_VARIANTS[key] = makeRealisationKernel(*key)
+    return KERNEL_VARIANTS[key]
+
+@njit
+def seedKernelRandom(seed):
+    """
+    Seed the random number generator used by the numba compiled code,
+    which is separate from numpy's.
+    """
+    np.random.seed(seed)
 
 def dayMonthToDays(startDate, endDate, dayMonths, ndays=1):
     result = []
@@ -693,16 +1544,183 @@ def dayMonthToDays(startDate, endDate, dayMonths, ndays=1):
             startday = (date - startDate).days
             for n in range(ndays):
                 result.append(startday + n)
-    return np.array(result)
+    # int even when empty so numba always sees the same type
+    return np.array(result, dtype=np.int64)
+
+def makeAttractionTables(nDays, COA_radius, COA_decay_spatial, COA_decay_temporal,
+            minK, nBins):
+    """
+    Lookup tables for the attraction of a centre of attraction, 
+    (1/minK) * exp(-COA_decay_spatial*dist) * exp(-COA_decay_temporal*days).
+
+    Returns the spatial part (including 1/minK) at the edges of nBins bins
+    of distance up to COA_radius (see lookupSpatialAttraction), the temporal
+    part indexed by days since release and the bins per metre.
+    """
+    binScale = nBins / float(COA_radius)
+    # one extra for rounding at the edge
+    dist = np.arange(nBins + 2) / binScale
+    spatialAttraction = (1.0 / minK) * np.exp(-COA_decay_spatial * dist)
+    # daysSincePheromoneRelease can't get to nDays
+    temporalAttraction = np.exp(-COA_decay_temporal * np.arange(nDays + 1))
+    return spatialAttraction, temporalAttraction, binScale
+
+def getDecoyDays(nDays, pheromoneReleaseDays, temporalAttraction, minK, 
+            threshold, habituationDays):
+    """
+    Which days the decoys matter on. Each release attracts stoats until 
+    even the closest decoy can't attract more than threshold, 
+    (1/minK) * temporalAttraction[days since release] < threshold. An 
+    encounter with a decoy stops a stoat being attracted to it for 
+    habituationDays, so encounters only matter in the habituationDays up 
+    to the last of those days.
+    Returns bool arrays of the days to search for decoys to be attracted to 
+    and the days to record encounters with them.
+    """
+    attractionDays = np.zeros(nDays, dtype=bool)
+    attracting = (1.0 / minK) * temporalAttraction >= threshold
+    # the attraction only decays so each release attracts for nAttracting days
+    nAttracting = attracting.shape[0]
+    if not attracting.all():
+        nAttracting = int(np.argmin(attracting))
+    for releaseDay in pheromoneReleaseDays:
+        releaseDay = int(releaseDay)
+        if 0 <= releaseDay < nDays:
+            attractionDays[releaseDay:releaseDay + nAttracting] = True
+
+    # an encounter on a day is in pheromoneInteractionArray for it and 
+    # the next habituationDays - 1 days
+    interactionDays = np.zeros(nDays, dtype=bool)
+    for day in np.flatnonzero(attractionDays):
+        interactionDays[max(day - habituationDays + 1, 0):day + 1] = True
+    return attractionDays, interactionDays
+
+def setDecoyDays(params, inputs):
+    """
+    Set inputs.decoyAttractionDays and inputs.decoyInteractionDays (see 
+    getDecoyDays). Needs doing again whenever the release days change.
+    """
+    (inputs.decoyAttractionDays, 
+        inputs.decoyInteractionDays) = getDecoyDays(inputs.nDays, 
+            inputs.pheromoneReleaseDays, inputs.temporalAttraction, params.minK,
+            params.decoyAttractionThreshold, inputs.habituationDays)
+
+def getSearchDays(nDays, estrousStartDays, estrousEndDays, habituationDays):
+    """
+    True for the days in estrous, when stoats search for mates instead of
+    moving about their home range, and for the habituationDays before each
+    start of estrous as pheromone interactions then still affect the search.
+    """
+    search = np.zeros(nDays, dtype=bool)
+    # same logic as runRealisation
+    inEstrous = False
+    for day in range(nDays):
+        if day in estrousStartDays:
+            inEstrous = True
+        elif day in estrousEndDays:
+            inEstrous = False
+        if inEstrous:
+            search[day] = True
+
+    for startDay in estrousStartDays:
+        startDay = int(startDay)
+        search[max(startDay - habituationDays, 0):startDay] = True
+    return search
+
+def getQuietRunLength(params, nDays, estrousStartDays, estrousEndDays, 
+            otherDays, habituationDays):
+    """
+    For each day, the number of consecutive 'quiet' days starting on it
+    (0 if the day itself isn't quiet). Quiet days are outside estrous and 
+    not a trapping, birth, dispersal or pheromone release day (all in 
+    otherDays), so stoats only do home range movement and mortality.
+    Days within habituationDays of the start of estrous aren't quiet as 
+    pheromone interactions then still affect the search for mates.
+    """
+    quiet = ~getSearchDays(nDays, estrousStartDays, estrousEndDays, habituationDays)
+
+    for days in otherDays:
+        if days is not None and len(days) > 0:
+            days = days[(days >= 0) & (days < nDays)].astype(int)
+            quiet[days] = False
+
+    runLength = np.zeros(nDays, dtype=np.int32)
+    run = 0
+    for day in range(nDays - 1, -1, -1):
+        if quiet[day]:
+            run += 1
+        else:
+            run = 0
+        runLength[day] = run
+    return runLength
+
+def getAbsorbingRunLength(nDays, trappingDays, searchDays, otherDays):
+    """
+    For each day, the number of consecutive days starting on it that can be
+    skipped once no more young can be born (see isReproductionOver). None
+    of them are trapping days or searchDays (see getSearchDays), as the
+    stoats left still search for mates in estrous and the skipped days
+    are home range movement, and none but the first are in otherDays 
+    (dispersal and pheromone release) as what happens on those is done at
+    the start of the day, before skipping.
+    """
+    trapping = searchDays.copy()
+    if trappingDays is not None and len(trappingDays) > 0:
+        trappingDays = trappingDays[(trappingDays >= 0) & (trappingDays < nDays)]
+        trapping[trappingDays.astype(int)] = True
+    event = np.zeros(nDays, dtype=bool)
+    for days in otherDays:
+        if days is not None and len(days) > 0:
+            days = days[(days >= 0) & (days < nDays)].astype(int)
+            event[days] = True
+
+    runLength = np.zeros(nDays, dtype=np.int32)
+    run = 0
+    for day in range(nDays - 1, -1, -1):
+        if trapping[day]:
+            run = 0
+        elif day + 1 < nDays and event[day + 1]:
+            run = 1
+        else:
+            run += 1
+        runLength[day] = run
+    return runLength
+
+def setRunLengths(params, inputs, save):
+    """
+    Set inputs.quietRunLength and inputs.absorbingRunLength from the 
+    schedules in inputs. Needs doing again whenever the release or 
+    trapping days change (see snapshot.forkFromSnapshot).
+    """
+    # the frames of the movie need every hour so no fast forwarding if saving
+    if params.fastForward and not save:
+        inputs.quietRunLength = getQuietRunLength(params, inputs.nDays,
+            inputs.estrousStartDays, inputs.estrousEndDays, 
+            [inputs.trappingDays, inputs.birthDays, inputs.dispersalDays,
+            inputs.pheromoneReleaseDays], inputs.habituationDays)
+    else:
+        inputs.quietRunLength = np.zeros(inputs.nDays, dtype=np.int32)
+
+    if params.absorbingTail and not save:
+        trappingDays = inputs.trappingDays
+        if inputs.trapsArray.shape[0] == 0:
+            trappingDays = None
+        searchDays = getSearchDays(inputs.nDays, inputs.estrousStartDays,
+            inputs.estrousEndDays, inputs.habituationDays)
+        inputs.absorbingRunLength = getAbsorbingRunLength(inputs.nDays, trappingDays,
+            searchDays, [inputs.dispersalDays, inputs.pheromoneReleaseDays])
+    else:
+        inputs.absorbingRunLength = np.zeros(inputs.nDays, dtype=np.int32)
 
-def getRandomVariates(params):
+def getRandomVariates(params, rng=np.random):
     """
-    Get random variates for this realisation of model
+    Get random variates for this realisation of model.
+    rng is np.random or a np.random.RandomState.
     """
     ## get number of stoats to add to initial population 2 + nAdd
-    nAdd = int(np.random.uniform(params.meanNAdd[0], params.meanNAdd[1]))
+    nAdd = int(rng.uniform(params.meanNAdd[0], params.meanNAdd[1]))
     ## get dates of pheromone release
-    twoPheroPerYear = (np.random.binomial(1, .5) == 1)
+    twoPheroPerYear = (rng.binomial(1, .5) == 1)
 
     twoPheroPerYear = True
 
@@ -718,25 +1736,25 @@ def getRandomVariates(params):
 #    spacing = params.decoySpacing[result]
 
     ## GET DECOY SPACING 
-    spacing = np.random.uniform(params.decoySpacing[0], params.decoySpacing[1])
+    spacing = rng.uniform(params.decoySpacing[0], params.decoySpacing[1])
     ## ROUND TO NEAREST 10 METRES
     spacing = np.round(spacing, -1)
 
     ## get spatial decay parameter for pheromone attractions (k)
-    COA_decay_spatial = np.random.uniform(params.COA_decay_spatial[0],
+    COA_decay_spatial = rng.uniform(params.COA_decay_spatial[0],
                             params.COA_decay_spatial[1])
     ## get temporal decay parameter for pheromone attractions (k)
-    COA_decay_temporal = np.random.uniform(params.COA_decay_temporal[0],
+    COA_decay_temporal = rng.uniform(params.COA_decay_temporal[0],
                             params.COA_decay_temporal[1])
     ## get random number of habituation days
-    habituationDays = np.random.randint(params.habituationDays[0],
+    habituationDays = rng.randint(params.habituationDays[0],
                             params.habituationDays[1])
 
     ## get random daily survivorship
-    pAnnSurv = (np.random.uniform(params.PAnnualSurv[0], params.PAnnualSurv[1])) 
+    pAnnSurv = (rng.uniform(params.PAnnualSurv[0], params.PAnnualSurv[1])) 
     pDaySurv = np.power(pAnnSurv, 1.0 / 365.0)
 
-    alphaK = np.random.uniform(params.alphaK[0], params.alphaK[1])
+    alphaK = rng.uniform(params.alphaK[0], params.alphaK[1])
 
     ## Print for assessing maps
     print('nAdd', nAdd, 'decoy spacing=', spacing, 'alphaK=', alphaK, 'COA_decay_spatial=', COA_decay_spatial, 
@@ -748,121 +1766,411 @@ def getRandomVariates(params):
             COA_decay_temporal, habituationDays, pDaySurv)
 
 
-def runModel(params, save=True, savePath='.'):
+def getStateDtypes(compact):
     """
-    Main function
+    Returns the dtypes for the stoat, pheromone, pheromone interaction and
+    mating arrays, either the usual ones or the compact ones
+    """
+    if compact:
+        return (COMPACT_STOAT_DTYPE, COMPACT_PHEROMONE_DTYPE, 
+                COMPACT_PHEROMONE_INTERACTION_DTYPE, COMPACT_MATING_DTYPE)
+    return STOAT_DTYPE, PHEROMONE_DTYPE, PHEROMONE_INTERACTION_DTYPE, MATING_DTYPE
 
+def getStateMemory(inputs):
     """
+    Bytes used by each of the arrays of a realisation (from prepareRealisation).
+    Returns a dictionary of bytes by name and the total.
+    """
+    memory = {}
+    for name, value in vars(inputs).items():
+        if isinstance(value, np.ndarray):
+            memory[name] = value.nbytes
+        elif isinstance(value, landscape.PackedMask):
+            memory[name] = landscape.getPackedMaskBytes(value)
+    return memory, sum(memory.values())
+
+def getRecordingMemory(params):
+    """
+    Bytes of the arrays prepareRealisation allocates to record every hour
+    of a realisation when saving (for the movie)
+    """
+    nDays = (params.endDate - params.startDate).days
+    nhours = nDays * params.hoursPerDay
+    return (nhours * (np.dtype(np.bool).itemsize + np.dtype(np.int32).itemsize) + 
+            nhours * INITIAL_STOAT_ARRAY_SIZE * np.dtype(STOAT_DTYPE).itemsize +
+            nDays * np.dtype(np.int32).itemsize)
 
-    # Open the mask and read it
-    ds = gdal.Open(params.extentMask)
+def reportStateMemory(inputs):
+    """
+    A table of the memory used by a realisation, largest arrays first,
+    as a string
+    """
+    memory, total = getStateMemory(inputs)
+    lines = []
+    for name in sorted(memory, key=memory.get, reverse=True):
+        lines.append('{:30s} {:12.1f} KB'.format(name, memory[name] / 1024))
+    lines.append('{:30s} {:12.1f} KB'.format('Total', total / 1024))
+    return '\n'.join(lines)
+
+class RealisationInputs(object):
+    """
+    Everything runRealisation needs for one realisation: the mask, the
+    random variates for this realisation, the day schedules and the
+    arrays holding the state of the model.
+    """
+    pass
+
+
+def readMask(filename):
+    """
+    Open the mask and read it. Returns the mask array, the geo transform
+    and tlx, tly, brx, bry, pixSize
+    """
+    if gdal is None:
+        raise ImportError('GDAL is needed to read the extent mask')
+    ds = gdal.Open(filename)
     transform = ds.GetGeoTransform()
     tlx, tly = gdal.ApplyGeoTransform(transform, 0, 0)
     brx, bry = gdal.ApplyGeoTransform(transform, ds.RasterXSize, ds.RasterYSize)
     pixSize = transform[1]
     mask = ds.GetRasterBand(1).ReadAsArray()
     del ds
+    return mask, transform, tlx, tly, brx, bry, pixSize
+
+
+def prepareRealisation(params, save=True, maskData=None, trapsArray=None,
+            realisationTelemetry=None):
+    """
+    Draw the random variates for a realisation and set up all the arrays
+    it needs. Returns a RealisationInputs ready for callRealisation.
+
+    maskData (as returned by readMask or landscape.readPackedMask) and 
+    trapsArray can be given instead of reading params.extentMask and 
+    params.trapsFile. The time taken is added to realisationTelemetry
+    (a telemetry.RealisationTelemetry) if given, and it is kept as 
+    inputs.telemetry for callRealisation and runModel.
+    """
+    if realisationTelemetry is None:
+        realisationTelemetry = telemetry.RealisationTelemetry()
+    with realisationTelemetry.phase('setup'):
+        inputs = makeRealisationInputs(params, save, maskData, trapsArray,
+                    realisationTelemetry)
+    inputs.telemetry = realisationTelemetry
+    return inputs
+
+def makeRealisationInputs(params, save, maskData, trapsArray, realisationTelemetry):
+    """
+    Does the work of prepareRealisation
+    """
+    inputs = RealisationInputs()
+
+    # Open the mask and read it
+    if maskData is None:
+        with realisationTelemetry.phase('rasterLoad'):
+            if params.packedMask:
+                maskData = landscape.readPackedMask(params.extentMask)
+            else:
+                maskData = readMask(params.extentMask)
+    (mask, transform, tlx, tly, brx, bry, pixSize) = maskData
+    inputs.mask = mask
+    inputs.transform = transform
+    inputs.pixSize = pixSize
+
+    (stoatDtype, pheromoneDtype, interactionDtype, 
+        matingDtype) = getStateDtypes(params.compactState)
+    if params.compactState:
+        if save:
+            raise ValueError('compactState is only for runs with save=False')
+        # the kernel works relative to the bottom left of the raster
+        inputs.originX = tlx
+        inputs.originY = bry
+    else:
+        inputs.originX = 0.0
+        inputs.originY = 0.0
+    absTlx = tlx
+    absTly = tly
+    absBrx = brx
+    absBry = bry
+    tlx = tlx - inputs.originX
+    tly = tly - inputs.originY
+    brx = brx - inputs.originX
+    bry = bry - inputs.originY
+    inputs.tlx = tlx
+    inputs.tly = tly
+    inputs.brx = brx
+    inputs.bry = bry
     
     # create an array to handle the stoats
-    stoatArray = np.zeros((INITIAL_STOAT_ARRAY_SIZE,), dtype=STOAT_DTYPE)
+    stoatArray = np.zeros((INITIAL_STOAT_ARRAY_SIZE,), dtype=stoatDtype)
     stoatArray['deleted'] = True # empty
+    inputs.stoatArray = stoatArray
 
     # for keeping a track of which stoats have mated with which 
-    matingArray = np.empty(INITIAL_STOAT_ARRAY_SIZE * 2, dtype=MATING_DTYPE)
+    matingArray = np.empty(INITIAL_STOAT_ARRAY_SIZE * 2, dtype=matingDtype)
     matingArray['maleid'] = -1  # unused flag
+    inputs.matingArray = matingArray
+
+    # common random numbers (see streams.py) if there is a seed, 
+    # otherwise np.random
+    inputs.randomStreams = streams.makeStreams(params.commonRandomSeed)
+    rng = np.random
+    if params.commonRandomSeed is not None:
+        parameterSeed = streams.getStreamSeed(inputs.randomStreams, 
+                    streams.PARAMETER_STREAM)
+        rng = np.random.RandomState(parameterSeed)
+        # for anything numba draws without a stream
+        seedKernelRandom(parameterSeed)
 
     # Draw random variates of parameters for this realisation
     (nAdd, pheromoneReleaseDayMonths, spacing, alphaK, COA_decay_spatial, 
-        COA_decay_temporal, habituationDays, pDaySurv) = getRandomVariates(params)
-  
+        COA_decay_temporal, habituationDays, pDaySurv) = getRandomVariates(params, rng)
+    inputs.nAdd = nAdd
+    inputs.pheromoneReleaseDayMonths = pheromoneReleaseDayMonths
+    inputs.spacing = spacing
+    inputs.alphaK = alphaK
+    inputs.COA_decay_spatial = COA_decay_spatial
+    inputs.COA_decay_temporal = COA_decay_temporal
+    inputs.habituationDays = habituationDays
+    inputs.pDaySurv = pDaySurv
 
     # initial stoats
     nStoats, Current_Id = createInitialStoats(stoatArray, nAdd, mask, tlx, tly, 
-                    brx, bry, pixSize, params.nDaysPregnantBeforeBirth)
+                    brx, bry, pixSize, params.nDaysPregnantBeforeBirth, inputs.randomStreams)
+    inputs.kernelState = makeKernelState(nStoats, Current_Id)
+
+    # for finding the stoats near a point
+    (inputs.cellHead, inputs.stoatHash, 
+        inputs.hashGeometry) = makeStoatHash(tlx, tly, brx, bry, params.stoatHashCellSize)
+    rebuildStoatHash(stoatArray, nStoats, inputs.cellHead, inputs.stoatHash, 
+                inputs.hashGeometry)
 
     # read in the traps
-    trapsArray = readTrapsFile(params.trapsFile)
+    if trapsArray is None:
+        trapsArray = readTrapsFile(params.trapsFile)
+    if params.compactState:
+        # a copy as the caller may be using trapsArray for other realisations
+        trapsArray = (trapsArray - [inputs.originX, inputs.originY]).astype(np.float32)
+    inputs.trapsArray = trapsArray
 
     # convert datetime object to number of days for numba code
-    nDays = (params.endDate - params.startDate).days
+    inputs.nDays = (params.endDate - params.startDate).days
+    if params.compactState and inputs.nDays > COMPACT_MAX_VALUE:
+        raise ValueError('Too many days for compactState')
 
-    pheromoneReleaseDays = dayMonthToDays(params.startDate, 
+    inputs.pheromoneReleaseDays = dayMonthToDays(params.startDate, 
                 params.endDate, pheromoneReleaseDayMonths)
 
-
-#    print('top of runModel fx, pheromoneReleaseDays', pheromoneReleaseDays)
-
-
-    estrousStartDays = dayMonthToDays(params.startDate, 
+    inputs.estrousStartDays = dayMonthToDays(params.startDate, 
                 params.endDate, [params.estrousStartDayMonth])
-    estrousEndDays = dayMonthToDays(params.startDate, 
+    inputs.estrousEndDays = dayMonthToDays(params.startDate, 
                 params.endDate, [params.estrousEndDayMonth])
 
-    birthDays = dayMonthToDays(params.startDate, 
+    inputs.birthDays = dayMonthToDays(params.startDate, 
                 params.endDate, [params.birthDayMonth])
 
-    pheromoneArray = makePheromoneArray(mask, tlx, tly, brx, bry, pixSize,
-                                spacing, transform)
+    # decoys are placed on the same grid whatever the coordinates
+    with realisationTelemetry.phase('decoyGrid'):
+        pheromoneArray = makePheromoneArray(mask, absTlx, absTly, absBrx, absBry,
+                                pixSize, spacing, transform)
     # clobber it
     #pheromoneArray = np.empty(0, dtype=PHEROMONE_DTYPE)
+    if params.compactState:
+        compactPheromoneArray = np.empty(pheromoneArray.shape[0], dtype=pheromoneDtype)
+        compactPheromoneArray['x'] = pheromoneArray['x'] - inputs.originX
+        compactPheromoneArray['y'] = pheromoneArray['y'] - inputs.originY
+        pheromoneArray = compactPheromoneArray
+    inputs.pheromoneArray = pheromoneArray
+
+    (inputs.spatialAttraction, inputs.temporalAttraction, 
+        inputs.attractionBinScale) = makeAttractionTables(inputs.nDays, 
+                params.COA_radius, COA_decay_spatial, COA_decay_temporal, 
+                params.minK, params.nAttractionBins)
+    if params.compactState:
+        inputs.spatialAttraction = inputs.spatialAttraction.astype(np.float32)
+        inputs.temporalAttraction = inputs.temporalAttraction.astype(np.float32)
+    setDecoyDays(params, inputs)
+
+    # for doing the stoats in parallel
+    inputs.stoatPlan = np.zeros(INITIAL_STOAT_ARRAY_SIZE, dtype=STOAT_PLAN_DTYPE)
+    inputs.parallelSeed = rng.randint(0, 2**31 - 1)
+    # keyed streams are much cheaper than reseeding np.random for each stoat
+    inputs.parallelStreams = inputs.randomStreams
+    if params.commonRandomSeed is None:
+        inputs.parallelStreams = streams.makeStreams(inputs.parallelSeed)
+
+    # step lengths and bearings are drawn in blocks, but not from the 
+    # shared buffers when every stoat has its own stream
+    blockSize = params.movementBlockSize
+    if params.commonRandomSeed is not None:
+        blockSize = 0
+    (inputs.movementBuffers, inputs.movementBufferPos, 
+        inputs.vonMisesTable) = movement.makeMovementBuffers(blockSize,
+                params.directionalVM, params.vonMisesTableBins)
 
     pheromoneInteractionArray = np.empty(INITIAL_STOAT_ARRAY_SIZE * pheromoneArray.shape[0], 
-                dtype=PHEROMONE_INTERACTION_DTYPE)
+                dtype=interactionDtype)
     pheromoneInteractionArray['stoatid'] = -1
+    inputs.pheromoneInteractionArray = pheromoneInteractionArray
 
-    trappingDays = None
+    inputs.trappingDays = None
     if params.trappingDayMonths is not None: 
-        trappingDays = dayMonthToDays(params.startDate, params.endDate, 
+        inputs.trappingDays = dayMonthToDays(params.startDate, params.endDate, 
             params.trappingDayMonths, params.nTrapDays)
 
+    inputs.dispersalDays = dayMonthToDays(params.startDate, 
+                params.endDate, [params.dispersalDateDayMonth])
 
+    setRunLengths(params, inputs, save)
 
-    dispersalDays = dayMonthToDays(params.startDate, 
-                params.endDate, [params.dispersalDateDayMonth])
+    if (params.fastForward or params.absorbingTail) and not save:
+        inputs.homeRangeOffsets = makeHomeRangeOffsets(params.stepScale, 
+            params.stepShape, alphaK, params.nHomeRangeOffsets, 
+            params.homeRangeBurnIn, params.homeRangeThin, inputs.randomStreams)
+        if params.compactState:
+            inputs.homeRangeOffsets = inputs.homeRangeOffsets.astype(np.float32)
+    else:
+        inputs.homeRangeOffsets = np.zeros((1, 2), dtype=np.float64)
 
 #    print('Trapping days', trappingDays, 'Dispersaldays', dispersalDays,
 #        'pheromone Days', pheromoneReleaseDays)
 
+    nhours = inputs.nDays * params.hoursPerDay
+    if save:
+        inputs.stoatDebugInEstrous = np.zeros(nhours, dtype=np.bool)
+        inputs.stoatDebugDaysSincePheromone = np.zeros(nhours, dtype=np.int32)
+        inputs.stoatDebugFrame = np.zeros((nhours, INITIAL_STOAT_ARRAY_SIZE), dtype=STOAT_DTYPE)
+        inputs.stoatDebugTrapping = np.zeros(inputs.nDays, dtype=np.int32)
+    else:
+        inputs.stoatDebugInEstrous = None
+        inputs.stoatDebugDaysSincePheromone = None
+        inputs.stoatDebugFrame = None
+        inputs.stoatDebugTrapping = None
 
+    return inputs
 
-#    pDaySurv = np.power(params.PAnnualSurv, 1.0 / 365.0)
 
-    nhours = nDays * params.hoursPerDay
-    if save:
-        stoatDebugInEstrous = np.zeros(nhours, dtype=np.bool)
-        stoatDebugDaysSincePheromone = np.zeros(nhours, dtype=np.int32)
-        stoatDebugFrame = np.zeros((nhours, INITIAL_STOAT_ARRAY_SIZE), dtype=STOAT_DTYPE)
-        stoatDebugTrapping = np.zeros(nDays, dtype=np.int32)
-    else:
-        stoatDebugInEstrous = None
-        stoatDebugDaysSincePheromone = None
-        stoatDebugFrame = None
-        stoatDebugTrapping = None
-
-    eradicated = runRealisation(nDays, params.hoursPerDay, stoatArray, nStoats, 
-            params.stepScale, params.stepShape, alphaK, params.minK,
-            pheromoneReleaseDays, params.COA_radius, COA_decay_spatial, COA_decay_temporal,
-            estrousStartDays, estrousEndDays, pheromoneArray, pheromoneInteractionArray, habituationDays,
-            params.encounterDistance, birthDays, params.meanRecruits, trappingDays, trapsArray,
-            params.trapEncDist, params.trapProbRemoval, pDaySurv, dispersalDays,
-            mask, tlx, tly, brx, bry, pixSize, matingArray, Current_Id, stoatDebugInEstrous,
-            stoatDebugDaysSincePheromone, stoatDebugFrame, stoatDebugTrapping, params.directionalVM,
-            params.nDaysPregnantBeforeBirth, params.probPregnacy)
+def makeKernelInputs(params, inputs):
+    """
+    Gather what runRealisation needs from params and inputs (from 
+    prepareRealisation) into a KernelInputs. The scalars are converted
+    so numba always sees the same types and doesn't recompile.
+    """
+    return KernelInputs(nDays=int(inputs.nDays), hoursPerDay=int(params.hoursPerDay), 
+            stoatArray=inputs.stoatArray, kernelState=inputs.kernelState, 
+            stepScale=float(params.stepScale), stepShape=float(params.stepShape), 
+            alphaK=float(inputs.alphaK), minK=float(params.minK),
+            pheromoneReleaseDays=inputs.pheromoneReleaseDays, 
+            COA_radius=float(params.COA_radius), 
+            COA_decay_spatial=float(inputs.COA_decay_spatial), 
+            COA_decay_temporal=float(inputs.COA_decay_temporal), 
+            estrousStartDays=inputs.estrousStartDays, 
+            estrousEndDays=inputs.estrousEndDays, pheromoneArray=inputs.pheromoneArray, 
+            pheromoneInteractionArray=inputs.pheromoneInteractionArray, 
+            habituationDays=int(inputs.habituationDays),
+            encounterDistance=float(params.encounterDistance), 
+            birthDays=inputs.birthDays, meanRecruits=float(params.meanRecruits), 
+            trappingDays=inputs.trappingDays, trapsArray=inputs.trapsArray, 
+            trapEncDist=float(params.trapEncDist), 
+            trapProbRemoval=float(params.trapProbRemoval), 
+            pDaySurv=float(inputs.pDaySurv), dispersalDays=inputs.dispersalDays,
+            mask=inputs.mask, tlx=float(inputs.tlx), tly=float(inputs.tly), 
+            brx=float(inputs.brx), bry=float(inputs.bry), pixSize=float(inputs.pixSize), 
+            matingArray=inputs.matingArray, 
+            stoatDebugEstrous=inputs.stoatDebugInEstrous,
+            stoatDebugDaysSincePheromone=inputs.stoatDebugDaysSincePheromone, 
+            stoatDebugFrame=inputs.stoatDebugFrame, 
+            stoatDebugTrapping=inputs.stoatDebugTrapping, 
+            directionalVM=float(params.directionalVM),
+            nDaysPregnantBeforeBirth=int(params.nDaysPregnantBeforeBirth), 
+            probPregnacy=float(params.probPregnacy),
+            quietRunLength=inputs.quietRunLength, 
+            fastForwardMinDays=max(int(params.fastForwardMinDays), 1),
+            homeRangeOffsets=inputs.homeRangeOffsets,
+            absorbingRunLength=inputs.absorbingRunLength,
+            absorbingTailMinDays=max(int(params.absorbingTailMinDays), 1), 
+            spatialAttraction=inputs.spatialAttraction, 
+            temporalAttraction=inputs.temporalAttraction,
+            attractionBinScale=float(inputs.attractionBinScale), 
+            exactAttraction=bool(params.exactAttraction), 
+            decoyAttractionDays=inputs.decoyAttractionDays,
+            decoyInteractionDays=inputs.decoyInteractionDays, 
+            parallelStoats=bool(params.parallelStoats), 
+            parallelStreams=inputs.parallelStreams, stoatPlan=inputs.stoatPlan, 
+            cellHead=inputs.cellHead, stoatHash=inputs.stoatHash,
+            hashGeometry=inputs.hashGeometry, movementBuffers=inputs.movementBuffers, 
+            movementBufferPos=inputs.movementBufferPos, 
+            vonMisesTable=inputs.vonMisesTable, randomStreams=inputs.randomStreams)
+
+def getKernelVariant(inputs):
+    """
+    The flags (recordMovie, useDecoys, useTrapping) of the kernel that
+    only includes what this realisation uses
+    """
+    recordMovie = inputs.stoatDebugFrame is not None
+    useDecoys = (inputs.pheromoneArray.shape[0] > 0 and 
+                    inputs.pheromoneReleaseDays.shape[0] > 0)
+    useTrapping = (inputs.trappingDays is not None and 
+                    inputs.trappingDays.shape[0] > 0 and inputs.trapsArray.shape[0] > 0)
+    return recordMovie, useDecoys, useTrapping
+
+def callRealisation(params, inputs, stopDay=None, variant=None):
+    """
+    Run the realisation described by inputs (from prepareRealisation) 
+    from the day it is up to until stopDay (or the end). Returns
+    whether the stoats were eradicated.
+
+    variant is the (recordMovie, useDecoys, useTrapping) flags of the kernel
+    to use. The default is from getKernelVariant.
+    """
+    if stopDay is None:
+        stopDay = inputs.nDays
+    if variant is None:
+        variant = getKernelVariant(inputs)
+
+    runRealisation = getRealisationKernel(*variant)
+    with inputs.telemetry.phase('kernel'):
+        eradicated = runRealisation(makeKernelInputs(params, inputs), stopDay)
+    return eradicated
+
+
+def getModelResult(inputs, eradicated):
+    """
+    The tuple returned by runModel for a realisation
+    """
+    return (eradicated, inputs.nAdd, inputs.spacing, 
+            len(inputs.pheromoneReleaseDayMonths), inputs.alphaK, 
+            inputs.COA_decay_spatial, inputs.COA_decay_temporal, 
+            inputs.habituationDays, inputs.pDaySurv)
+
+
+def runModel(params, save=True, savePath='.', maskData=None, trapsArray=None,
+            realisationTelemetry=None):
+    """
+    Main function
+
+    The time taken by each phase is added to realisationTelemetry (a
+    telemetry.RealisationTelemetry) if given.
+    """
+    inputs = prepareRealisation(params, save, maskData, trapsArray, 
+                realisationTelemetry)
+
+    eradicated = callRealisation(params, inputs)
 
     if save:
-        outname = os.path.join(savePath, 'stoats.npz')
-        np.savez_compressed(outname, inEstrous=stoatDebugInEstrous,
-                daysSincePheromone=stoatDebugDaysSincePheromone, debugInfo=stoatDebugFrame,
-                trappingDays=trappingDays, pheromones=pheromoneArray,
-                traps=trapsArray, trappingCount=stoatDebugTrapping)
-                
-        outname = os.path.join(savePath, 'stoatsparams.pkl')
-        paramsFile = open(outname, 'wb')
-        # cache some other things 
-        params.COA_decay_spatial = COA_decay_spatial
-        params.COA_decay_temporal = COA_decay_temporal
-        pickle.dump(params, paramsFile)
-        paramsFile.close()
-
-    return (eradicated, nAdd, spacing, len(pheromoneReleaseDayMonths), alphaK, 
-            COA_decay_spatial, COA_decay_temporal, habituationDays, pDaySurv)
+        with inputs.telemetry.phase('resultWrite'):
+            outname = os.path.join(savePath, 'stoats.npz')
+            np.savez_compressed(outname, inEstrous=inputs.stoatDebugInEstrous,
+                    daysSincePheromone=inputs.stoatDebugDaysSincePheromone, 
+                    debugInfo=inputs.stoatDebugFrame,
+                    trappingDays=inputs.trappingDays, pheromones=inputs.pheromoneArray,
+                    traps=inputs.trapsArray, trappingCount=inputs.stoatDebugTrapping)
+
+            outname = os.path.join(savePath, 'stoatsparams.pkl')
+            paramsFile = open(outname, 'wb')
+            # cache some other things 
+            params.COA_decay_spatial = inputs.COA_decay_spatial
+            params.COA_decay_temporal = inputs.COA_decay_temporal
+            pickle.dump(params, paramsFile)
+            paramsFile.close()
+
+    return getModelResult(inputs, eradicated)
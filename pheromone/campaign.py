@@ -0,0 +1,137 @@
+"""
+Running many realisations with rios.parallel, as startSimulation.py and
+'python -m pheromone.cli run' do.
+
+The realisations are run in chunks and the results so far are pickled
+after each, so a campaign that is stopped can be carried on by
+runCampaign(..., resume=True) without losing more than a chunk.
+
+Each realisation seeds np.random and numba from its place in the campaign
+(plus firstSeed). The workers of a chunk are forked with the same
+np.random state, so without this every chunk would make the same draws,
+and seeding by place means a resumed campaign runs what it would have.
+"""
+
+import os
+import pickle
+import multiprocessing
+import numpy as np
+from rios.parallel import jobmanager
+from pheromone import calculation
+from pheromone import calcresults
+from pheromone import telemetry
+
+# Use the same environment variable as RIOS to define the type of
+# parallel processing.
+# Default to the multiprocessing type.
+DEFAULT_JOBMGR_TYPE = os.getenv('RIOS_DFLT_JOBMGRTYPE', default='multiprocessing')
+
+
+def parallelRunModel(pars, seed, results):
+    """
+    A slight variation on pheromone.runModel
+    which makes the results a parameter so it
+    can be used with rios.parallel. np.random and
+    numba are seeded with seed first.
+    """
+    np.random.seed(seed)
+    calculation.seedKernelRandom(seed)
+    realisationTelemetry = telemetry.RealisationTelemetry()
+    (eradicated, nAdd, decoySpacing, nDecoyDeplyment, alphaK, COA_decay_spatial,
+        COA_decay_temporal, habituationDays, pDaySurv) = calculation.runModel(pars,
+                save=False, realisationTelemetry=realisationTelemetry)
+    results.eradicated = eradicated
+    results.nAdd = nAdd
+    results.decoySpacing = decoySpacing
+    results.nDecoyDeplyment = nDecoyDeplyment
+    results.alphaK = alphaK
+    results.COA_decay_spatial = COA_decay_spatial
+    results.COA_decay_temporal = COA_decay_temporal
+    results.habituationDays = habituationDays
+    results.pDaySurv = pDaySurv
+    results.seed = seed
+    results.wallTimes = realisationTelemetry.wall
+    results.cpuTimes = realisationTelemetry.cpu
+    results.peakRSS = telemetry.getPeakRSS()
+    results.worker = telemetry.getWorker()
+
+class PheromoneJobInfo(jobmanager.JobInfo):
+    """
+    Contains an implementation of RIOS's jobmanager.JobInfo
+    for the pheromone model.
+    """
+    def __init__(self, pars, nIterations, seed):
+        self.pars = pars
+        self.nIterations = nIterations
+        self.seed = seed
+
+    def getFunctionParams(self):
+        "make input suitable for parallelRunModel"
+        results = calcresults.PheromoneResults()
+        results.iter = self.nIterations
+        return self.pars, self.seed, results
+
+    def getFunctionResult(self, params):
+        "output was the last parameter"
+        return params[-1]
+
+def runJobs(pars, nJobs, nIterations, jobMgrType=DEFAULT_JOBMGR_TYPE, tmpDir=None,
+            firstSeed=0):
+    """
+    Run nJobs realisations of pars in parallel, seeded with firstSeed,
+    firstSeed + 1 and so on. nIterations is the size of the whole campaign
+    (recorded in the results). Returns a list of PheromoneResults.
+    """
+    # if using multiprocessing, run a job per cpu
+    # otherwise (assume SLURM) run a job per iteration
+    # not sure if this is correct
+    if jobMgrType == 'multiprocessing':
+        nThreads = multiprocessing.cpu_count()
+    else:
+        nThreads = nJobs
+    jobmgrClass = jobmanager.getJobManagerClassByType(jobMgrType)
+    jobmgr = jobmgrClass(nThreads)
+
+    # Home dir runs out of quota
+    # I couldn't find a cluster-wide temp var created on Pan
+    # so simply use this dir if it exists (assume we are on Pan)
+    # otherwise leave as default.
+    if tmpDir is not None and os.path.isdir(tmpDir):
+        jobmgr.setTempdir(tmpDir)
+
+    jobInputs = [PheromoneJobInfo(pars, nIterations, firstSeed + i) for i in range(nJobs)]
+    # run all in parallel and collect results
+    return jobmgr.runSubJobs(parallelRunModel, jobInputs)
+
+def saveResults(results, resultsDataPath):
+    """
+    Pickle results, replacing resultsDataPath only once they are all written
+    """
+    tmpPath = resultsDataPath + '.tmp'
+    fileobj = open(tmpPath, 'wb')
+    pickle.dump(results, fileobj, protocol=4) # so we get large file support
+    fileobj.close()
+    os.replace(tmpPath, resultsDataPath)
+
+def runCampaign(pars, resultsDataPath, nIterations, chunkSize=None,
+            jobMgrType=DEFAULT_JOBMGR_TYPE, tmpDir=None, resume=False, firstSeed=0):
+    """
+    Run nIterations realisations of pars, chunkSize at a time (all at once
+    if None), pickling the results to resultsDataPath after each chunk.
+    With resume the results already in resultsDataPath count towards
+    nIterations. Realisation i is seeded with firstSeed + i. Returns the
+    list of PheromoneResults.
+    """
+    results = []
+    if resume and os.path.exists(resultsDataPath):
+        results = calcresults.PheromoneResults.unpickleFromFile(resultsDataPath)
+    if chunkSize is None:
+        chunkSize = nIterations
+    chunkSize = max(chunkSize, 1)
+    while len(results) < nIterations:
+        nJobs = min(chunkSize, nIterations - len(results))
+        results.extend(runJobs(pars, nJobs, nIterations, jobMgrType, tmpDir,
+                    firstSeed + len(results)))
+        saveResults(results, resultsDataPath)
+        print('{} of {} realisations done'.format(len(results), nIterations))
+    return results
@@ -0,0 +1,251 @@
+"""
+Command line for running and looking at campaigns:
+
+    python -m pheromone.cli run OUTDIR --config params.json --niterations 400
+    python -m pheromone.cli resume OUTDIR
+    python -m pheromone.cli postprocess OUTDIR/results.pkl
+    python -m pheromone.cli inspect OUTDIR/results.pkl --telemetry
+    python -m pheromone.cli plan --config params.json
+
+The parameters are those of PheromoneParams, changed by a JSON config file
+of attribute names and values (--config) and then by --set NAME=VALUE
+(VALUE as JSON, or else a string). Dates are given as 'YYYY-MM-DD'.
+run saves what it was given to OUTDIR/campaign.json so resume can carry
+on from the results so far.
+
+Each command only imports the modules it needs, so inspect and
+postprocess don't load numba, GDAL or RIOS and inspect starts quickly.
+"""
+
+import os
+import json
+import argparse
+import datetime
+
+DEFAULT_ITERATIONS = 400
+CAMPAIGN_FILE = 'campaign.json'
+RESULTS_FILE = 'results.pkl'
+
+
+def setParameter(pars, name, value):
+    """
+    Set an attribute of PheromoneParams from a value read from JSON,
+    converting it to the type of the default (dates and day months)
+    """
+    if name not in vars(pars):
+        raise SystemExit('PheromoneParams has no parameter {}'.format(name))
+    default = getattr(pars, name)
+    if isinstance(default, datetime.date) and isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    elif isinstance(default, tuple) and isinstance(value, list):
+        value = tuple(value)
+    elif (isinstance(default, list) and len(default) > 0 and
+            isinstance(default[0], tuple) and isinstance(value, list)):
+        value = [tuple(item) for item in value]
+    setattr(pars, name, value)
+
+def parseSetting(text):
+    """
+    NAME=VALUE with VALUE as JSON (or else a string)
+    """
+    if '=' not in text:
+        raise argparse.ArgumentTypeError('Expected NAME=VALUE, not {}'.format(text))
+    name, value = text.split('=', 1)
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return name, value
+
+def makePars(cmdargs):
+    """
+    PheromoneParams from --config, --set, --mask and --traps
+    """
+    from pheromone import params
+    pars = params.PheromoneParams()
+    if cmdargs.config is not None:
+        with open(cmdargs.config) as fileobj:
+            for name, value in json.load(fileobj).items():
+                setParameter(pars, name, value)
+    for name, value in cmdargs.set:
+        setParameter(pars, name, value)
+    if cmdargs.mask is not None:
+        pars.setExtentMask(os.path.abspath(cmdargs.mask))
+    if cmdargs.traps is not None:
+        pars.setTrapsFile(os.path.abspath(cmdargs.traps))
+    if pars.extentMask is None or pars.trapsFile is None:
+        raise SystemExit('Need the mask and traps (--mask and --traps or in the config)')
+    return pars
+
+def getParamsValues(pars):
+    """
+    The attributes of pars as values JSON can write
+    """
+    from pheromone import cache
+    return {name : cache.toJSONValue(value) for name, value in vars(pars).items()}
+
+
+def doRun(cmdargs):
+    pars = makePars(cmdargs)
+    os.makedirs(cmdargs.outdir, exist_ok=True)
+    settings = {'params' : getParamsValues(pars), 'niterations' : cmdargs.niterations,
+            'chunksize' : cmdargs.chunksize, 'jobmgr' : cmdargs.jobmgr,
+            'tmpdir' : cmdargs.tmpdir, 'seed' : cmdargs.seed}
+    with open(os.path.join(cmdargs.outdir, CAMPAIGN_FILE), 'w') as fileobj:
+        json.dump(settings, fileobj, indent=2)
+    runSettings(settings, cmdargs.outdir, resume=False)
+
+def doResume(cmdargs):
+    campaignFile = os.path.join(cmdargs.outdir, CAMPAIGN_FILE)
+    if not os.path.exists(campaignFile):
+        raise SystemExit('No {} in {} to resume'.format(CAMPAIGN_FILE, cmdargs.outdir))
+    with open(campaignFile) as fileobj:
+        settings = json.load(fileobj)
+    for name in ('niterations', 'jobmgr', 'tmpdir'):
+        if getattr(cmdargs, name) is not None:
+            settings[name] = getattr(cmdargs, name)
+    runSettings(settings, cmdargs.outdir, resume=True)
+
+def runSettings(settings, outdir, resume):
+    """
+    Run the campaign described by settings (as saved in CAMPAIGN_FILE)
+    """
+    from pheromone import params
+    from pheromone import campaign
+    from pheromone import analytics
+    pars = params.PheromoneParams()
+    for name, value in settings['params'].items():
+        setParameter(pars, name, value)
+    jobmgr = settings['jobmgr']
+    if jobmgr is None:
+        jobmgr = campaign.DEFAULT_JOBMGR_TYPE
+    results = campaign.runCampaign(pars, os.path.join(outdir, RESULTS_FILE),
+            settings['niterations'], settings['chunksize'], jobmgr,
+            settings['tmpdir'], resume, settings.get('seed', 0))
+    print(analytics.formatTelemetrySummary(analytics.getTelemetrySummary(results)))
+
+def doPostprocess(cmdargs):
+    from pheromone import calcresults
+    from pheromone import analytics
+    outdir = cmdargs.outdir
+    if outdir is None:
+        outdir = os.path.dirname(os.path.abspath(cmdargs.results))
+    results = calcresults.PheromoneResults.unpickleFromFile(cmdargs.results)
+    calcresults.PheromoneResults.writeToFileFX(results,
+            os.path.join(outdir, 'simulationResults.csv'))
+    columns = analytics.resultsToColumns(results)
+    analytics.saveColumns(columns, os.path.join(outdir, 'resultsColumns.npz'))
+    print(analytics.formatSurface(analytics.getEradicationSurface(columns,
+            cmdargs.xname, cmdargs.yname)))
+
+def doInspect(cmdargs):
+    import numpy as np
+    from pheromone import calcresults
+    from pheromone import analytics
+    columns = analytics.loadColumns(cmdargs.results)
+    eradicated = columns['eradicated']
+    n = eradicated.shape[0]
+    if n == 0:
+        print('No realisations')
+        return
+    p = eradicated.mean()
+    print('{} realisations, P(eradication) {:.3f} (MC s.e. {:.3f})'.format(n, p,
+            np.sqrt(p * (1 - p) / n)))
+    print('{:>24s} {:>12s} {:>12s}'.format('', 'min', 'max'))
+    for name in analytics.PARAMETER_FIELDS:
+        print('{:>24s} {:12.6g} {:12.6g}'.format(name, columns[name].min(),
+                columns[name].max()))
+    if cmdargs.telemetry:
+        if os.path.splitext(cmdargs.results)[1].lower() != '.pkl':
+            raise SystemExit('Only results.pkl has the telemetry')
+        results = calcresults.PheromoneResults.unpickleFromFile(cmdargs.results)
+        print(analytics.formatTelemetrySummary(analytics.getTelemetrySummary(results,
+                cmdargs.slowest)))
+
+def doPlan(cmdargs):
+    from pheromone import planner
+    pars = makePars(cmdargs)
+    nodeBytes = None
+    if cmdargs.nodememory is not None:
+        nodeBytes = cmdargs.nodememory * planner.BYTES_PER_GB
+    plan = planner.makePlan(pars, nIterations=cmdargs.niterations, save=cmdargs.save,
+            nCores=cmdargs.ncores, nodeBytes=nodeBytes, nNodes=cmdargs.nnodes,
+            calibrationDays=cmdargs.calibrationdays)
+    print(planner.formatPlan(plan))
+
+
+def addParamsArgs(p):
+    p.add_argument('--config', help='JSON file of PheromoneParams attributes')
+    p.add_argument('--set', type=parseSetting, action='append', default=[],
+        metavar='NAME=VALUE', help='PheromoneParams attribute (can be repeated)')
+    p.add_argument('--mask', help='Extent mask')
+    p.add_argument('--traps', help='Traps file')
+
+def getCmdargs():
+    p = argparse.ArgumentParser(description='Run and look at campaigns of the ' +
+            'pheromone model')
+    subparsers = p.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run = subparsers.add_parser('run', help='Run a campaign')
+    run.add_argument('outdir', help='Directory for the results')
+    addParamsArgs(run)
+    run.add_argument('--niterations', type=int, default=DEFAULT_ITERATIONS,
+        help='Realisations to run (default=%(default)s)')
+    run.add_argument('--chunksize', type=int,
+        help='Realisations run between saving the results (default all)')
+    run.add_argument('--jobmgr', help='RIOS job manager type (default ' +
+        '$RIOS_DFLT_JOBMGRTYPE or multiprocessing)')
+    run.add_argument('--tmpdir', help='Temporary directory for the job manager')
+    run.add_argument('--seed', type=int, default=0,
+        help='Seed of the first realisation, the rest follow on (default=%(default)s)')
+    run.set_defaults(function=doRun)
+
+    resume = subparsers.add_parser('resume', help='Carry on a campaign')
+    resume.add_argument('outdir', help='Directory of the campaign')
+    resume.add_argument('--niterations', type=int,
+        help='Change the realisations to run in all')
+    resume.add_argument('--jobmgr', help='Change the RIOS job manager type')
+    resume.add_argument('--tmpdir', help='Change the temporary directory')
+    resume.set_defaults(function=doResume)
+
+    postprocess = subparsers.add_parser('postprocess',
+        help='Write simulationResults.csv and resultsColumns.npz from results.pkl')
+    postprocess.add_argument('results', help='results.pkl')
+    postprocess.add_argument('--outdir', help='Where to write (default next to results)')
+    postprocess.add_argument('-x', '--xname', default='decoySpacing',
+        help='Parameter to bin over (default=%(default)s)')
+    postprocess.add_argument('-y', '--yname', help='Second parameter to bin over')
+    postprocess.set_defaults(function=doPostprocess)
+
+    inspect = subparsers.add_parser('inspect', help='Summary of a results file')
+    inspect.add_argument('results',
+        help='results.pkl, simulationResults.csv or a .npz of columns')
+    inspect.add_argument('--telemetry', default=False, action='store_true',
+        help='Also summarise the telemetry (results.pkl only)')
+    inspect.add_argument('--slowest', type=int, default=10,
+        help='Slowest realisations listed with --telemetry (default=%(default)s)')
+    inspect.set_defaults(function=doInspect)
+
+    plan = subparsers.add_parser('plan', help='Dry run of a campaign (see planner.py)')
+    addParamsArgs(plan)
+    plan.add_argument('--niterations', type=int, default=DEFAULT_ITERATIONS,
+        help='Realisations in the campaign (default=%(default)s)')
+    plan.add_argument('--save', default=False, action='store_true',
+        help='Plan for runs that record every hour')
+    plan.add_argument('--ncores', type=int, default=os.cpu_count(),
+        help='Cores of each node (default=%(default)s)')
+    plan.add_argument('--nodememory', type=float, help='GB of memory of each node')
+    plan.add_argument('--nnodes', type=int, default=1,
+        help='Nodes the campaign runs on (default=%(default)s)')
+    plan.add_argument('--calibrationdays', type=int, default=180,
+        help='Days each calibration run is simulated for (default=%(default)s)')
+    plan.set_defaults(function=doPlan)
+    return p.parse_args()
+
+def main():
+    cmdargs = getCmdargs()
+    cmdargs.function(cmdargs)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Bit-packed landscape mask for rasters too big to hold as one byte per pixel.
+
+The mask is stored one bit per pixel (np.packbits along rows) together with
+a coarse occupancy pyramid. Each level of the pyramid says whether a block
+of pixels is all sea, all land or mixed, so looking up a pixel in a block
+that is all one or the other never touches the bits. The levels go from
+coarse to fine and are only read down to the first one that isn't mixed.
+
+readPackedMask builds it from a GDAL raster a window at a time, so the
+whole raster is never held as a byte array.
+
+isLandPixel works on either this or a normal mask array, in python and in
+numba compiled code, so the model's kernels can use either.
+"""
+
+from collections import namedtuple
+import numpy as np
+from numba import njit, types
+from numba.extending import overload
+# only needed to read the mask from a file
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+# states of a block in the pyramid
+SEA_BLOCK = 0
+LAND_BLOCK = 1
+MIXED_BLOCK = 2
+
+# log2 of the block sizes of the levels of the pyramid, coarse to fine
+DEFAULT_LEVEL_SHIFTS = (9, 6)
+# size of the windows read from the raster (a multiple of the finest block)
+DEFAULT_WINDOW_SIZE = 2048
+
+# bits is (nRows, ceil(nCols / 8)) uint8. The block states of all the levels
+# are in the one int8 array levels (so numba can pass it to parallel loops),
+# level i starting at levelStarts[i] with levelCols[i] blocks to a row.
+PackedMask = namedtuple('PackedMask', ['bits', 'levels', 'levelStarts', 'levelCols',
+                'levelShifts', 'nRows', 'nCols'])
+
+
+@njit
+def packedIsLand(packedMask, row, col):
+    """
+    True if the pixel at row, col is land. Outside the raster is sea.
+    """
+    if row < 0 or col < 0 or row >= packedMask.nRows or col >= packedMask.nCols:
+        return False
+    for i in range(packedMask.levelShifts.shape[0]):
+        shift = packedMask.levelShifts[i]
+        state = packedMask.levels[packedMask.levelStarts[i] +
+                    (row >> shift) * packedMask.levelCols[i] + (col >> shift)]
+        if state == SEA_BLOCK:
+            return False
+        elif state == LAND_BLOCK:
+            return True
+    byte = packedMask.bits[row, col >> 3]
+    return ((byte >> (7 - (col & 7))) & 1) == 1
+
+@njit
+def arrayIsLand(mask, row, col):
+    """
+    isLandPixel for an array mask. Checks the bounds as numba doesn't, so
+    a location on the right or bottom edge (which rounds to one past the
+    last pixel) doesn't read whatever is after the mask.
+    """
+    if row < 0 or col < 0 or row >= mask.shape[0] or col >= mask.shape[1]:
+        return False
+    return mask[row, col] > 0
+
+
+def isLandPixel(mask, row, col):
+    """
+    True if the pixel at row, col of mask (an array or PackedMask) is land.
+    Outside the raster is sea.
+    """
+    if isinstance(mask, PackedMask):
+        return packedIsLand(mask, row, col)
+    return arrayIsLand(mask, row, col)
+
+@overload(isLandPixel)
+def ol_isLandPixel(mask, row, col):
+    """
+    The same for numba. Picks the version for the type of mask when
+    the calling function is compiled.
+    """
+    if isinstance(mask, types.Array):
+        def impl(mask, row, col):
+            return arrayIsLand(mask, row, col)
+        return impl
+    elif isinstance(mask, types.BaseNamedTuple):
+        def impl(mask, row, col):
+            return packedIsLand(mask, row, col)
+        return impl
+
+
+@njit
+def isLandPixels(mask, rows, cols):
+    """
+    isLandPixel for arrays of rows and cols. Returns a bool array.
+    """
+    result = np.empty(rows.shape[0], dtype=np.bool_)
+    for i in range(rows.shape[0]):
+        result[i] = isLandPixel(mask, rows[i], cols[i])
+    return result
+
+
+def getPackedMaskBytes(packedMask):
+    """
+    Memory used by a PackedMask
+    """
+    return (packedMask.bits.nbytes + packedMask.levels.nbytes +
+            packedMask.levelStarts.nbytes + packedMask.levelCols.nbytes +
+            packedMask.levelShifts.nbytes)
+
+def classifyBlocks(landCount, pixelCount):
+    """
+    Block states from the number of land pixels and of pixels in each block
+    """
+    states = np.full(landCount.shape, MIXED_BLOCK, dtype=np.int8)
+    states[landCount == 0] = SEA_BLOCK
+    states[(landCount == pixelCount) & (pixelCount > 0)] = LAND_BLOCK
+    return states
+
+def sumBlocks(counts, factor):
+    """
+    Add up counts over factor x factor blocks (padding the edges with 0)
+    """
+    nRows = -(-counts.shape[0] // factor)
+    nCols = -(-counts.shape[1] // factor)
+    padded = np.zeros((nRows * factor, nCols * factor), dtype=counts.dtype)
+    padded[:counts.shape[0], :counts.shape[1]] = counts
+    return padded.reshape(nRows, factor, nCols, factor).sum(axis=(1, 3))
+
+def buildPackedMask(readWindow, nRows, nCols, levelShifts=DEFAULT_LEVEL_SHIFTS,
+            windowSize=DEFAULT_WINDOW_SIZE):
+    """
+    Build a PackedMask from readWindow(xoff, yoff, xsize, ysize), which
+    returns that window of the mask as an array (non zero is land).
+    """
+    levelShifts = tuple(sorted([int(shift) for shift in levelShifts], reverse=True))
+    finestShift = levelShifts[-1]
+    finestBlock = 1 << finestShift
+    if windowSize % finestBlock != 0 or windowSize % 8 != 0:
+        raise ValueError('windowSize must be a multiple of the finest block and of 8')
+
+    bits = np.zeros((nRows, -(-nCols // 8)), dtype=np.uint8)
+    nBlockRows = -(-nRows // finestBlock)
+    nBlockCols = -(-nCols // finestBlock)
+    landCount = np.zeros((nBlockRows, nBlockCols), dtype=np.int64)
+    pixelCount = np.zeros((nBlockRows, nBlockCols), dtype=np.int64)
+
+    for yoff in range(0, nRows, windowSize):
+        ysize = min(windowSize, nRows - yoff)
+        for xoff in range(0, nCols, windowSize):
+            xsize = min(windowSize, nCols - xoff)
+            land = readWindow(xoff, yoff, xsize, ysize) > 0
+            bits[yoff:yoff + ysize, xoff // 8:(xoff + xsize + 7) // 8] = np.packbits(
+                    land, axis=1)
+            # windows start on block boundaries
+            blockRow = yoff // finestBlock
+            blockCol = xoff // finestBlock
+            windowLand = sumBlocks(land.astype(np.int64), finestBlock)
+            windowPixels = sumBlocks(np.ones(land.shape, dtype=np.int64), finestBlock)
+            landCount[blockRow:blockRow + windowLand.shape[0],
+                    blockCol:blockCol + windowLand.shape[1]] = windowLand
+            pixelCount[blockRow:blockRow + windowLand.shape[0],
+                    blockCol:blockCol + windowLand.shape[1]] = windowPixels
+
+    levels = []
+    levelStarts = []
+    levelCols = []
+    start = 0
+    for shift in levelShifts:
+        factor = 1 << (shift - finestShift)
+        states = classifyBlocks(sumBlocks(landCount, factor),
+                sumBlocks(pixelCount, factor))
+        levels.append(states.flatten())
+        levelStarts.append(start)
+        levelCols.append(states.shape[1])
+        start += states.size
+
+    return PackedMask(bits=bits, levels=np.concatenate(levels),
+                levelStarts=np.array(levelStarts, dtype=np.int64),
+                levelCols=np.array(levelCols, dtype=np.int64),
+                levelShifts=np.array(levelShifts, dtype=np.int64),
+                nRows=int(nRows), nCols=int(nCols))
+
+def packMask(mask, levelShifts=DEFAULT_LEVEL_SHIFTS, windowSize=DEFAULT_WINDOW_SIZE):
+    """
+    PackedMask from a mask array already in memory
+    """
+    def readWindow(xoff, yoff, xsize, ysize):
+        return mask[yoff:yoff + ysize, xoff:xoff + xsize]
+    return buildPackedMask(readWindow, mask.shape[0], mask.shape[1], levelShifts,
+                windowSize)
+
+def readPackedMask(filename, levelShifts=DEFAULT_LEVEL_SHIFTS,
+            windowSize=DEFAULT_WINDOW_SIZE):
+    """
+    As calculation.readMask but returns a PackedMask in place of the mask
+    array, reading the raster windowSize x windowSize pixels at a time.
+    """
+    if gdal is None:
+        raise ImportError('GDAL is needed to read the extent mask')
+    ds = gdal.Open(filename)
+    transform = ds.GetGeoTransform()
+    tlx, tly = gdal.ApplyGeoTransform(transform, 0, 0)
+    brx, bry = gdal.ApplyGeoTransform(transform, ds.RasterXSize, ds.RasterYSize)
+    pixSize = transform[1]
+    band = ds.GetRasterBand(1)
+
+    def readWindow(xoff, yoff, xsize, ysize):
+        return band.ReadAsArray(xoff, yoff, xsize, ysize)
+    packedMask = buildPackedMask(readWindow, ds.RasterYSize, ds.RasterXSize,
+                levelShifts, windowSize)
+    del band
+    del ds
+    return packedMask, transform, tlx, tly, brx, bry, pixSize
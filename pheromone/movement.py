@@ -0,0 +1,224 @@
+"""
+Buffered samplers for the step lengths and bearings of moving stoats.
+
+stepShape and directionalVM are fixed for a realisation, so rather than
+calling np.random.weibull and np.random.vonmises once per step (and again
+each time a step lands in the sea) the draws are made a block at a time
+into per-realisation buffers:
+
+ - Weibull step lengths by inversion, (-log(U)) ** (1 / stepShape).
+ - von Mises turns for the directed search from a table: the circle is split
+   into bins, a bin is chosen from an alias table in proportion to the
+   largest density in it and a point uniform in the bin is accepted with
+   probability density / largest density. As the density changes little
+   over a bin most points are accepted just by comparing with the smallest
+   density in the bin, without working out the density at all.
+
+Both are exact (not approximations) so the movement has the same
+distribution as before. The turns are drawn around 0 and added to the
+previous bearing, as np.random.vonmises(bearingT_1, directionalVM) does.
+
+Run this module to benchmark the samplers against np.random:
+    python -m pheromone.movement
+"""
+
+import time
+import argparse
+import numpy as np
+from numba import njit
+
+# rows of the buffers
+WEIBULL_ROW = 0
+VONMISES_ROW = 1
+
+# one bin of the table for the von Mises turns
+VONMISES_BIN_DTYPE = [('left', np.float64), # left edge of the bin (radians)
+                      ('fMax', np.float64), # largest density in the bin
+                      ('fMin', np.float64), # smallest density in the bin
+                      ('prob', np.float64), # alias table probability of keeping this bin
+                      ('alias', np.int32) # bin to use otherwise
+                      ]
+
+
+@njit
+def vonMisesDensity(x, kappa):
+    """
+    Density of the turn, not normalised and scaled so it is 1 at 0
+    """
+    return np.exp(kappa * (np.cos(x) - 1.0))
+
+
+def makeVonMisesTable(kappa, nBins):
+    """
+    Table for drawing turns from a von Mises distribution around 0 with
+    concentration kappa. The density decreases away from 0 so the largest
+    and smallest values in a bin are at its edges.
+    """
+    table = np.empty(nBins, dtype=VONMISES_BIN_DTYPE)
+    width = 2.0 * np.pi / nBins
+    left = -np.pi + np.arange(nBins) * width
+    right = left + width
+    near = np.minimum(np.abs(left), np.abs(right))
+    # the bin with 0 in it
+    near[(left <= 0.0) & (right >= 0.0)] = 0.0
+    far = np.maximum(np.abs(left), np.abs(right))
+    table['left'] = left
+    table['fMax'] = np.exp(kappa * (np.cos(near) - 1.0))
+    table['fMin'] = np.exp(kappa * (np.cos(far) - 1.0))
+
+    # alias table (Vose) from the largest density in each bin
+    scaled = table['fMax'] * nBins / table['fMax'].sum()
+    prob = np.ones(nBins, dtype=np.float64)
+    alias = np.arange(nBins, dtype=np.int32)
+    small = [j for j in range(nBins) if scaled[j] < 1.0]
+    large = [j for j in range(nBins) if scaled[j] >= 1.0]
+    while len(small) > 0 and len(large) > 0:
+        s = small.pop()
+        l = large[-1]
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = (scaled[l] + scaled[s]) - 1.0
+        if scaled[l] < 1.0:
+            small.append(large.pop())
+    # whatever is left over has prob 1 give or take rounding
+    table['prob'] = prob
+    table['alias'] = alias
+    return table
+
+
+def makeMovementBuffers(blockSize, directionalVM, nBins):
+    """
+    Create the buffers for a realisation and the table for its von Mises
+    turns. blockSize=0 gives empty buffers which make the samplers below
+    draw from np.random one at a time as the model used to.
+    Returns movementBuffers, movementBufferPos and vonMisesTable.
+    """
+    movementBuffers = np.empty((2, blockSize), dtype=np.float64)
+    # start 'used up' so they are filled with the first draws
+    movementBufferPos = np.full(2, blockSize, dtype=np.int64)
+    vonMisesTable = makeVonMisesTable(directionalVM, nBins)
+    return movementBuffers, movementBufferPos, vonMisesTable
+
+@njit
+def fillWeibull(values, stepShape):
+    invShape = 1.0 / stepShape
+    for i in range(values.shape[0]):
+        # 1 - U so we never take the log of 0
+        values[i] = (-np.log(1.0 - np.random.random())) ** invShape
+
+@njit
+def fillVonMises(values, kappa, vonMisesTable):
+    nBins = vonMisesTable.shape[0]
+    width = 2.0 * np.pi / nBins
+    for i in range(values.shape[0]):
+        while True:
+            u = np.random.random() * nBins
+            j = int(u)
+            # the fraction left over decides between the bin and its alias
+            if u - j >= vonMisesTable[j]['prob']:
+                j = vonMisesTable[j]['alias']
+            x = vonMisesTable[j]['left'] + width * np.random.random()
+            v = vonMisesTable[j]['fMax'] * np.random.random()
+            if v <= vonMisesTable[j]['fMin'] or v <= vonMisesDensity(x, kappa):
+                break
+        values[i] = x
+
+@njit
+def drawUnitWeibull(stepShape, movementBuffers, movementBufferPos):
+    """
+    A draw from np.random.weibull(stepShape)
+    """
+    blockSize = movementBuffers.shape[1]
+    if blockSize == 0:
+        return np.random.weibull(stepShape)
+    if movementBufferPos[WEIBULL_ROW] >= blockSize:
+        fillWeibull(movementBuffers[WEIBULL_ROW], stepShape)
+        movementBufferPos[WEIBULL_ROW] = 0
+    value = movementBuffers[WEIBULL_ROW, movementBufferPos[WEIBULL_ROW]]
+    movementBufferPos[WEIBULL_ROW] += 1
+    return value
+
+@njit
+def wrapBearing(bearing):
+    """
+    Wrap into [-pi, pi) as np.random.vonmises does
+    """
+    bearing = np.fmod(bearing + np.pi, 2.0 * np.pi)
+    if bearing < 0.0:
+        bearing += 2.0 * np.pi
+    return bearing - np.pi
+
+@njit
+def drawDirectedBearing(bearingT_1, directionalVM, movementBuffers, movementBufferPos,
+            vonMisesTable):
+    """
+    A draw from np.random.vonmises(bearingT_1, directionalVM)
+    """
+    blockSize = movementBuffers.shape[1]
+    if blockSize == 0:
+        return np.random.vonmises(bearingT_1, directionalVM)
+    if movementBufferPos[VONMISES_ROW] >= blockSize:
+        fillVonMises(movementBuffers[VONMISES_ROW], directionalVM, vonMisesTable)
+        movementBufferPos[VONMISES_ROW] = 0
+    value = movementBuffers[VONMISES_ROW, movementBufferPos[VONMISES_ROW]]
+    movementBufferPos[VONMISES_ROW] += 1
+    return wrapBearing(bearingT_1 + value)
+
+@njit
+def sampleSteps(nDraws, stepShape, directionalVM, movementBuffers, movementBufferPos,
+            vonMisesTable):
+    """
+    Draw nDraws step lengths and bearings, for the benchmark
+    """
+    steps = np.empty(nDraws, dtype=np.float64)
+    bearings = np.empty(nDraws, dtype=np.float64)
+    bearing = 0.0
+    for i in range(nDraws):
+        steps[i] = drawUnitWeibull(stepShape, movementBuffers, movementBufferPos)
+        bearing = drawDirectedBearing(bearing, directionalVM, movementBuffers,
+                    movementBufferPos, vonMisesTable)
+        bearings[i] = bearing
+    return steps, bearings
+
+
+def getCmdargs():
+    p = argparse.ArgumentParser(description='Benchmark the movement samplers')
+    p.add_argument('--draws', type=int, default=10000000,
+        help='Number of steps to draw (default=%(default)s)')
+    p.add_argument('--shape', type=float, default=0.9,
+        help='Weibull shape (default=%(default)s)')
+    p.add_argument('--kappa', type=float, default=3.5,
+        help='von Mises concentration (default=%(default)s)')
+    p.add_argument('--bins', type=int, default=4096,
+        help='Bins in the von Mises table (default=%(default)s)')
+    p.add_argument('--blocks', type=int, nargs='+', default=[0, 256, 4096, 65536],
+        help='Block sizes to try, 0 for np.random (default=%(default)s)')
+    return p.parse_args()
+
+
+def main():
+    cmdargs = getCmdargs()
+    # compile first
+    for blockSize in cmdargs.blocks:
+        buffers, bufferPos, table = makeMovementBuffers(blockSize, cmdargs.kappa,
+                cmdargs.bins)
+        sampleSteps(10, cmdargs.shape, cmdargs.kappa, buffers, bufferPos, table)
+
+    # the turns should have the same moments whatever the block size
+    print('{:>8s} {:>10s} {:>12s} {:>10s} {:>10s} {:>10s} {:>10s}'.format('block',
+            'secs', 'draws/sec', 'mean step', 'sd step', 'mean cos', 'mean cos2'))
+    for blockSize in cmdargs.blocks:
+        buffers, bufferPos, table = makeMovementBuffers(blockSize, cmdargs.kappa,
+                cmdargs.bins)
+        np.random.seed(1)
+        start = time.perf_counter()
+        steps, bearings = sampleSteps(cmdargs.draws, cmdargs.shape, cmdargs.kappa,
+                buffers, bufferPos, table)
+        secs = time.perf_counter() - start
+        turns = np.diff(bearings)
+        print('{:8d} {:10.3f} {:12.0f} {:10.4f} {:10.4f} {:10.4f} {:10.4f}'.format(
+                blockSize, secs, cmdargs.draws / secs, steps.mean(), steps.std(),
+                np.cos(turns).mean(), np.cos(2 * turns).mean()))
+
+if __name__ == '__main__':
+    main()
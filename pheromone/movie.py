@@ -0,0 +1,219 @@
+"""
+Render the frames recorded by runModel(save=True) in stoats.npz.
+
+debugInfo in stoats.npz holds a copy of the whole stoat array for every
+hour of the run, so for a long run it is far bigger than memory once
+uncompressed. FrameReader reads it straight out of the zip a chunk of
+frames at a time, and getLiveStoats keeps just what is drawn for the
+animals still alive, so only a small part of it is ever in memory.
+
+Symbols are those of movie.wmv (see README.md):
+ - Green squares: traps (paler on days without trapping)
+ - Blue squares: decoys, fading as the pheromone decays
+ - Small/large circles: stoats in home range/searching, black for males,
+   blue for females and red for pregnant females
+ - Large black or blue circles that don't move: nests with kits
+ - Red squares: nests with fertilised female kits
+"""
+
+import zipfile
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# what is kept of each live stoat for drawing
+RENDER_DTYPE = [('x', np.float64), ('y', np.float64), ('male', np.bool_),
+                ('pregnant', np.bool_), ('homerange', np.bool_),
+                ('kit', np.bool_) # still in the nest (parentid != -1)
+                ]
+
+# name, marker, colour and size of each kind of stoat
+STOAT_STYLES = [('maleHomerange', 'o', 'black', 10),
+                ('maleSearching', 'o', 'black', 40),
+                ('femaleHomerange', 'o', 'blue', 10),
+                ('femaleSearching', 'o', 'blue', 40),
+                ('pregnantHomerange', 'o', 'red', 10),
+                ('pregnantSearching', 'o', 'red', 40),
+                ('maleNest', 'o', 'black', 60),
+                ('femaleNest', 'o', 'blue', 60),
+                ('pregnantNest', 's', 'red', 40)]
+
+# size of the traps and decoys
+TRAP_SIZE = 12
+DECOY_SIZE = 8
+# alpha of traps when not trapping and the least a decoy fades to
+TRAP_IDLE_ALPHA = 0.3
+DECOY_MIN_ALPHA = 0.1
+
+
+class FrameReader(object):
+    """
+    Reads the frames of an array in a .npz file (written by np.savez or
+    np.savez_compressed) in order, a chunk at a time, decompressing as it goes.
+    """
+    def __init__(self, filename, name='debugInfo'):
+        self.zipFile = zipfile.ZipFile(filename)
+        self.fileobj = self.zipFile.open(name + '.npy')
+        version = np.lib.format.read_magic(self.fileobj)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(self.fileobj)
+        else:
+            header = np.lib.format.read_array_header_2_0(self.fileobj)
+        shape, fortranOrder, self.dtype = header
+        if fortranOrder:
+            raise ValueError('Can only read frames of arrays in C order')
+        self.nFrames = shape[0]
+        self.frameShape = shape[1:]
+        self.frameBytes = self.dtype.itemsize * int(np.prod(self.frameShape))
+        self.nextFrame = 0
+
+    def skip(self, nFrames):
+        """
+        Move forward nFrames without returning them
+        """
+        nFrames = min(nFrames, self.nFrames - self.nextFrame)
+        # ZipExtFile.seek still decompresses but doesn't keep the data
+        self.fileobj.seek(nFrames * self.frameBytes, 1)
+        self.nextFrame += nFrames
+
+    def read(self, nFrames):
+        """
+        The next nFrames frames (fewer at the end) as an array
+        """
+        nFrames = min(nFrames, self.nFrames - self.nextFrame)
+        data = self.fileobj.read(nFrames * self.frameBytes)
+        self.nextFrame += nFrames
+        return np.frombuffer(data, dtype=self.dtype).reshape((nFrames,) +
+                    self.frameShape)
+
+    def iterChunks(self, chunkSize):
+        """
+        Yields (first frame index, frames) for chunks of chunkSize frames
+        """
+        while self.nextFrame < self.nFrames:
+            start = self.nextFrame
+            yield start, self.read(chunkSize)
+
+    def close(self):
+        self.fileobj.close()
+        self.zipFile.close()
+
+
+def isRecordedFrame(frame):
+    """
+    The frame array is allocated for every hour but a run that ends in
+    eradication stops filling it in. Those frames are still all zeros
+    whereas the empty slots of a real frame are marked deleted.
+    """
+    return frame['deleted'].any() or frame['x'].any()
+
+def getLiveStoats(frame):
+    """
+    RENDER_DTYPE array of the stoats alive in a frame of debugInfo
+    """
+    frame = frame[~frame['deleted']]
+    live = np.empty(frame.shape[0], dtype=RENDER_DTYPE)
+    for name in ('x', 'y', 'male', 'pregnant', 'homerange'):
+        live[name] = frame[name]
+    live['kit'] = frame['parentid'] != -1
+    return live
+
+def getStoatStyleMasks(live):
+    """
+    Dictionary of a bool array for each of STOAT_STYLES saying which of
+    the live stoats are drawn that way
+    """
+    kit = live['kit']
+    adult = ~kit
+    male = live['male']
+    pregnant = live['pregnant'] & ~male
+    female = ~male & ~pregnant
+    homerange = live['homerange']
+    searching = ~homerange
+    return {'maleHomerange' : adult & male & homerange,
+            'maleSearching' : adult & male & searching,
+            'femaleHomerange' : adult & female & homerange,
+            'femaleSearching' : adult & female & searching,
+            'pregnantHomerange' : adult & pregnant & homerange,
+            'pregnantSearching' : adult & pregnant & searching,
+            'maleNest' : kit & male,
+            'femaleNest' : kit & female,
+            'pregnantNest' : kit & pregnant}
+
+def getExtent(traps, pheromones, maskData=None, margin=0.05):
+    """
+    (xmin, xmax, ymin, ymax) to draw. The mask if there is one otherwise
+    around the traps and decoys.
+    """
+    if maskData is not None:
+        (mask, transform, tlx, tly, brx, bry, pixSize) = maskData
+        return tlx, brx, bry, tly
+    xs = np.concatenate([traps[:, 0], pheromones['x']])
+    ys = np.concatenate([traps[:, 1], pheromones['y']])
+    xmin, xmax, ymin, ymax = xs.min(), xs.max(), ys.min(), ys.max()
+    dx = (xmax - xmin) * margin
+    dy = (ymax - ymin) * margin
+    return xmin - dx, xmax + dx, ymin - dy, ymax + dy
+
+
+class FrameRenderer(object):
+    """
+    A matplotlib figure that is drawn once and then has just the positions
+    and colours of its markers changed for each frame.
+    """
+    def __init__(self, traps, pheromones, extent, mask=None, width=800,
+                height=800, dpi=100, decayTemporal=None):
+        self.pheromones = pheromones
+        self.decayTemporal = decayTemporal
+        self.figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_axes([0.0, 0.0, 1.0, 0.95])
+        ax.set_xlim(extent[0], extent[1])
+        ax.set_ylim(extent[2], extent[3])
+        ax.set_aspect('equal')
+        ax.set_xticks([])
+        ax.set_yticks([])
+        if mask is not None:
+            ax.imshow(mask > 0, extent=extent, cmap='Greys', vmin=0, vmax=4,
+                    interpolation='nearest')
+
+        self.traps = ax.scatter(traps[:, 0], traps[:, 1], s=TRAP_SIZE, marker='s',
+                    c='green', linewidths=0)
+        self.decoys = ax.scatter(pheromones['x'], pheromones['y'], s=DECOY_SIZE,
+                    marker='s', c='blue', linewidths=0)
+        self.decoys.set_visible(False)
+        empty = np.empty((0, 2))
+        self.stoats = {}
+        for name, marker, colour, size in STOAT_STYLES:
+            self.stoats[name] = ax.scatter(empty[:, 0], empty[:, 1], s=size,
+                        marker=marker, c=colour, linewidths=0)
+        self.title = self.figure.text(0.5, 0.975, '', ha='center', va='center')
+
+    def draw(self, live, title, trapping, daysSincePheromone):
+        """
+        Draw a frame. Returns the image as an (height, width, 4) uint8 array.
+        """
+        masks = getStoatStyleMasks(live)
+        for name in self.stoats:
+            mask = masks[name]
+            self.stoats[name].set_offsets(np.column_stack((live['x'][mask],
+                        live['y'][mask])))
+
+        if trapping:
+            self.traps.set_alpha(1.0)
+        else:
+            self.traps.set_alpha(TRAP_IDLE_ALPHA)
+
+        if daysSincePheromone == -1 or self.pheromones.shape[0] == 0:
+            self.decoys.set_visible(False)
+        else:
+            alpha = 1.0
+            if self.decayTemporal is not None:
+                alpha = max(np.exp(-self.decayTemporal * daysSincePheromone),
+                        DECOY_MIN_ALPHA)
+            self.decoys.set_alpha(alpha)
+            self.decoys.set_visible(True)
+
+        self.title.set_text(title)
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba()).copy()
@@ -25,6 +25,10 @@ class PheromoneParams(object):
         self.dispersalDateDayMonth = (16, 1)
 
         self.hoursPerDay = 16           # 30 min steps - change to 16
+
+        ## Do each hour's stoats in parallel threads (set NUMBA_NUM_THREADS)
+        ## for large populations. Changes the order of random draws.
+        self.parallelStoats = False
         
         ## Range of initial stoats to add
         self.meanNAdd = [6,7] #[6, 12]
@@ -35,6 +39,12 @@ class PheromoneParams(object):
         # directional or biased random walk to find mates
         self.directionalVM = 3.5 #1.5
 
+        ## step lengths and directed search bearings are drawn this many
+        ## at a time (0 to draw them one at a time)
+        self.movementBlockSize = 4096
+        ## bins in the table the directed search bearings are drawn from
+        self.vonMisesTableBins = 4096
+
         self.alphaK = [0.02, 0.0201] # [0.01, 0.1]    # 0.075
 
         self.COA_radius = 2500      # 1000 # metres
@@ -43,6 +53,15 @@ class PheromoneParams(object):
         self.COA_decay_temporal = [0.005, 0.006] # [0.005, 0.05]      # gamma parameter
         
         self.minK = 0.005
+
+        ## attraction of mates and decoys is calculated every time, or with
+        ## exactAttraction False interpolated in a lookup table with this
+        ## many bins of distance within COA_radius
+        self.exactAttraction = True
+        self.nAttractionBins = 4096
+        ## decoys are ignored on days they can't attract more than this
+        ## (see calculation.getDecoyDays)
+        self.decoyAttractionThreshold = 0.0
         
         self.meanRecruits = 9
         
@@ -50,6 +69,9 @@ class PheromoneParams(object):
 
         self.encounterDistance = 25  # 25 metres
 
+        ## size (metres) of the grid cells used to find stoats near a point
+        self.stoatHashCellSize = 500.0
+
         ## probability of pregnacy given an encounter
         self.probPregnacy = 0.9
 
@@ -63,6 +85,36 @@ class PheromoneParams(object):
         self.trapProbRemoval = 0.20
         self.PAnnualSurv = [0.5, 0.501] # [0.45, 0.61]        # [0.45, 0.55]
 
+        ## Fast forward through runs of quiet days (outside estrous and 
+        ## trapping) instead of simulating every hour. Ignored when saving.
+        self.fastForward = False
+        self.fastForwardMinDays = 30     # shortest run of quiet days to skip
+        ## sample of the stationary home range distribution
+        self.nHomeRangeOffsets = 20000
+        self.homeRangeBurnIn = 5000     # steps
+        self.homeRangeThin = 10
+
+        ## Once no more young can be born (no kits, no pregnant females and
+        ## only one sex left) skip the days between trappings and outside
+        ## estrous as fastForward does, so sparse late runs end sooner. 
+        ## Ignored when saving.
+        self.absorbingTail = False
+        self.absorbingTailMinDays = 5    # shortest run of days to skip
+
+        ## Keep the state of each realisation in float32 coordinates
+        ## (relative to the raster) and int16 ids and days to save memory
+        ## when running many at once. Can't be used when saving.
+        self.compactState = False
+
+        ## Read extentMask into a bit-packed mask (see landscape.py) for 
+        ## rasters too big to hold one byte per pixel
+        self.packedMask = False
+
+        ## Seed for common random numbers (see streams.py). Realisations with
+        ## the same seed make the same draws for the same stoats so scenarios
+        ## can be compared in pairs. None uses np.random as usual.
+        self.commonRandomSeed = None
+
     def setDecoySpacing(self, minRes, maxRes):
         self.decoySpacing = [minRes, maxRes]
 
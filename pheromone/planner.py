@@ -0,0 +1,266 @@
+"""
+Pre-flight plan of a simulation campaign.
+
+The memory and time a campaign needs depend on things only known at run
+time: decoySpacing sets the number of decoys and so the size of
+pheromoneInteractionArray, saving records every hour of every day and the
+dates set the length of each run. makePlan works these out for a
+PheromoneParams, the mask and the traps before any jobs are submitted:
+
+ - the number of decoys over the range of decoySpacing
+ - the memory of the state of a realisation with the most decoys
+   (calculation.getStateMemory) and of the recording if saving
+ - the time of a realisation, from a calibration run of the first season
+   at each of the spacings with the most and fewest decoys, scaled up by
+   the days in estrous (estrous and decoys cost far more than the rest of
+   the year, so scaling by days would say little)
+ - the time a worker spends compiling, measured in a new process as this
+   one has compiled the kernels by then
+ - the workers that fit in the memory of a node and the realisations per
+   job (chunk size) so compiling is only a small part of each job
+
+planCampaign.py prints the plan.
+"""
+
+import copy
+import datetime
+import multiprocessing
+from collections import namedtuple
+import numpy as np
+from pheromone import calculation
+from pheromone import landscape
+from pheromone import telemetry
+
+# spacings looked at over the range of decoySpacing
+DEFAULT_SPACING_SAMPLES = 21
+# the first estrous with the releases, births and trapping around it
+DEFAULT_CALIBRATION_DAYS = 180
+DEFAULT_CALIBRATION_RUNS = 1
+# days run to compile the kernels (which doesn't depend on the days run)
+COMPILE_DAYS = 1
+# time to compile if numba doesn't report it (older than 0.52)
+DEFAULT_COMPILE_SECONDS = 60.0
+# longest a job should take
+DEFAULT_JOB_HOURS = 2.0
+# most of each job that should go on compiling
+DEFAULT_COMPILE_FRACTION = 0.05
+# fraction of the memory of a node the workers can use
+DEFAULT_MEMORY_FRACTION = 0.8
+# memory of a worker besides the state if the peak RSS can't be found
+DEFAULT_PROCESS_BYTES = 512 * 1024 * 1024
+BYTES_PER_GB = 1024 ** 3
+
+# spacings and decoyCounts are the spacings looked at and the number of
+# decoys at each, realisationSeconds is (at the most decoys, at the fewest)
+# and the rest are per realisation or per worker as named
+CampaignPlan = namedtuple('CampaignPlan', ['nDays', 'spacings', 'decoyCounts',
+                'stateBytes', 'recordingBytes', 'workerBytes', 'compileSeconds',
+                'realisationSeconds', 'nIterations', 'workersPerNode', 'chunkSize',
+                'coreHours', 'wallHours'])
+
+
+def getSpacings(params, nSamples=DEFAULT_SPACING_SAMPLES):
+    """
+    Spacings over the range of params.decoySpacing, rounded to 10 metres as
+    getRandomVariates does
+    """
+    low, high = params.decoySpacing[:2]
+    return np.unique(np.round(np.linspace(low, high, nSamples), -1))
+
+def getDecoyCounts(maskData, spacings):
+    """
+    Number of decoys on the mask at each of spacings
+    """
+    (mask, transform, tlx, tly, brx, bry, pixSize) = maskData
+    return np.array([calculation.makePheromoneArray(mask, tlx, tly, brx, bry,
+                pixSize, spacing, transform).shape[0] for spacing in spacings],
+                dtype=np.int64)
+
+def setSpacing(params, spacing, nDays=None):
+    """
+    Copy of params with every realisation at spacing and, if given,
+    only nDays long
+    """
+    params = copy.copy(params)
+    params.decoySpacing = [spacing, spacing]
+    if nDays is not None:
+        params.endDate = params.startDate + datetime.timedelta(days=nDays)
+    return params
+
+def getEstrousDayCount(params, nDays):
+    """
+    Number of the first nDays of a realisation of params in estrous
+    """
+    endDate = params.startDate + datetime.timedelta(days=nDays)
+    estrousStartDays = calculation.dayMonthToDays(params.startDate, endDate,
+                [params.estrousStartDayMonth])
+    estrousEndDays = calculation.dayMonthToDays(params.startDate, endDate,
+                [params.estrousEndDayMonth])
+    return int(calculation.getSearchDays(nDays, estrousStartDays, estrousEndDays,
+                0).sum())
+
+def getCompileSeconds(params, maskData, trapsArray, spacings, save=False):
+    """
+    Seconds spent compiling to run realisations with decoys at each of
+    spacings. Only counts if nothing has been compiled yet in this process
+    (see measureCompile).
+    """
+    compileSeconds = 0.0
+    for spacing in spacings:
+        pars = setSpacing(params, spacing)
+        realisationTelemetry = telemetry.RealisationTelemetry()
+        inputs = calculation.prepareRealisation(pars, save, maskData, trapsArray,
+                    realisationTelemetry)
+        calculation.callRealisation(pars, inputs, stopDay=COMPILE_DAYS)
+        compileSeconds += realisationTelemetry.wall['jitCompile']
+    return compileSeconds
+
+def measureCompile(params, maskData, trapsArray, spacings, save=False):
+    """
+    getCompileSeconds in a new process (not forked, so nothing is compiled
+    yet), as it is for a worker starting a job
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        compileSeconds = pool.apply(getCompileSeconds, (params, maskData,
+                    trapsArray, spacings, save))
+    if compileSeconds == 0:
+        compileSeconds = DEFAULT_COMPILE_SECONDS
+    return compileSeconds
+
+def calibrate(params, maskData, trapsArray, spacing, save=False,
+            nDays=DEFAULT_CALIBRATION_DAYS, nRuns=DEFAULT_CALIBRATION_RUNS, seed=0):
+    """
+    Run nRuns realisations with decoys at spacing for their first nDays.
+    Returns the telemetry.RealisationTelemetry of each and the days each
+    simulated.
+    """
+    pars = setSpacing(params, spacing, nDays)
+    timings = []
+    simulatedDays = []
+    for i in range(nRuns):
+        np.random.seed(seed + i)
+        calculation.seedKernelRandom(seed + i)
+        realisationTelemetry = telemetry.RealisationTelemetry()
+        inputs = calculation.prepareRealisation(pars, save, maskData, trapsArray,
+                    realisationTelemetry)
+        calculation.callRealisation(pars, inputs)
+        # it stops early if they were eradicated
+        simulatedDays.append(max(int(inputs.kernelState[0]['day']), 1))
+        timings.append(realisationTelemetry)
+    return timings, simulatedDays
+
+def makePlan(params, maskData=None, trapsArray=None, nIterations=400, save=False,
+            nCores=1, nodeBytes=None, nNodes=1, calibrationDays=DEFAULT_CALIBRATION_DAYS,
+            nCalibration=DEFAULT_CALIBRATION_RUNS, jobHours=DEFAULT_JOB_HOURS,
+            compileFraction=DEFAULT_COMPILE_FRACTION,
+            memoryFraction=DEFAULT_MEMORY_FRACTION, seed=0):
+    """
+    Work out the CampaignPlan of nIterations realisations of params on nNodes
+    nodes with nCores cores and nodeBytes of memory each (None for no limit).
+    maskData and trapsArray are read from params.extentMask and
+    params.trapsFile if not given (and then the time to read the mask is
+    counted in each realisation). Runs 2 * nCalibration realisations of
+    calibrationDays and compiles the kernels again in a new process.
+    """
+    # runModel reads the mask for each realisation unless it is given
+    # maskData, so time that too
+    loadTelemetry = telemetry.RealisationTelemetry()
+    if maskData is None:
+        with loadTelemetry.phase('rasterLoad'):
+            if params.packedMask:
+                maskData = landscape.readPackedMask(params.extentMask)
+            else:
+                maskData = calculation.readMask(params.extentMask)
+    if trapsArray is None:
+        trapsArray = calculation.readTrapsFile(params.trapsFile)
+    nDays = (params.endDate - params.startDate).days
+
+    spacings = getSpacings(params)
+    decoyCounts = getDecoyCounts(maskData, spacings)
+    mostSpacing = spacings[np.argmax(decoyCounts)]
+    fewestSpacing = spacings[np.argmin(decoyCounts)]
+
+    # the state doesn't grow once prepared, so this is all of it
+    inputs = calculation.prepareRealisation(setSpacing(params, mostSpacing), False,
+                maskData, trapsArray)
+    memory, stateBytes = calculation.getStateMemory(inputs)
+    del inputs
+    recordingBytes = calculation.getRecordingMemory(params) if save else 0
+
+    realisationSeconds = []
+    for spacing in (mostSpacing, fewestSpacing):
+        timings, simulatedDays = calibrate(params, maskData, trapsArray, spacing, save,
+                    min(calibrationDays, nDays), nCalibration, seed)
+        setupSeconds = np.mean([timing.wall['decoyGrid'] + timing.wall['setup']
+                    for timing in timings])
+        kernelSeconds = sum([timing.wall['kernel'] for timing in timings])
+        # by the days in estrous, or by days if none were simulated
+        nEstrous = sum([getEstrousDayCount(params, days) for days in simulatedDays])
+        if nEstrous > 0:
+            kernelSeconds *= getEstrousDayCount(params, nDays) / nEstrous
+        else:
+            kernelSeconds *= nDays / sum(simulatedDays)
+        realisationSeconds.append(loadTelemetry.wall['rasterLoad'] + setupSeconds +
+                    kernelSeconds)
+
+    # this process has compiled everything by now
+    compileSeconds = measureCompile(params, maskData, trapsArray,
+                (mostSpacing, fewestSpacing), save)
+
+    # the peak so far includes the state with the most decoys, but only
+    # the recording of the calibration runs
+    peakRSS = telemetry.getPeakRSS()
+    if peakRSS is None:
+        workerBytes = DEFAULT_PROCESS_BYTES + stateBytes + recordingBytes
+    else:
+        workerBytes = peakRSS + recordingBytes
+        if save:
+            workerBytes -= calculation.getRecordingMemory(setSpacing(params,
+                        mostSpacing, min(calibrationDays, nDays)))
+
+    workersPerNode = nCores
+    if nodeBytes is not None:
+        workersPerNode = min(workersPerNode, int(nodeBytes * memoryFraction // workerBytes))
+    workersPerNode = max(workersPerNode, 1)
+
+    # enough realisations in each job that compiling is only compileFraction
+    # of it, but no more than fit in jobHours
+    slowest = max(max(realisationSeconds), 1e-9)
+    chunkSize = int(np.ceil(compileSeconds / (compileFraction * slowest)))
+    chunkSize = min(chunkSize, max(int(jobHours * 3600 / slowest), 1))
+    chunkSize = max(min(chunkSize, nIterations), 1)
+
+    nJobs = int(np.ceil(nIterations / chunkSize))
+    coreHours = (nIterations * np.mean(realisationSeconds) +
+                nJobs * compileSeconds) / 3600.0
+    wallHours = coreHours / (workersPerNode * nNodes)
+
+    return CampaignPlan(nDays=nDays, spacings=spacings, decoyCounts=decoyCounts,
+                stateBytes=stateBytes, recordingBytes=recordingBytes,
+                workerBytes=workerBytes, compileSeconds=compileSeconds,
+                realisationSeconds=tuple(realisationSeconds), nIterations=nIterations,
+                workersPerNode=workersPerNode, chunkSize=chunkSize,
+                coreHours=coreHours, wallHours=wallHours)
+
+def formatPlan(plan):
+    """
+    The plan as lines of text
+    """
+    most = np.argmax(plan.decoyCounts)
+    fewest = np.argmin(plan.decoyCounts)
+    lines = ['{} days per realisation'.format(plan.nDays)]
+    lines.append('Decoys {} (at {:g}m) to {} (at {:g}m)'.format(plan.decoyCounts[fewest],
+            plan.spacings[fewest], plan.decoyCounts[most], plan.spacings[most]))
+    lines.append('State of a realisation {:.1f} MB, recording {:.1f} MB'.format(
+            plan.stateBytes / 1024**2, plan.recordingBytes / 1024**2))
+    lines.append('Memory of a worker {:.2f} GB'.format(plan.workerBytes / BYTES_PER_GB))
+    lines.append('Compiling {:.1f}s per worker'.format(plan.compileSeconds))
+    lines.append('A realisation {:.1f}s with the most decoys, {:.1f}s with the fewest'.format(
+            *plan.realisationSeconds))
+    lines.append('Recommend {} workers per node, {} realisations per job ({} jobs)'.format(
+            plan.workersPerNode, plan.chunkSize,
+            int(np.ceil(plan.nIterations / plan.chunkSize))))
+    lines.append('{} realisations: about {:.1f} core-hours, {:.1f} hours on the nodes'.format(
+            plan.nIterations, plan.coreHours, plan.wallHours))
+    return '\n'.join(lines)
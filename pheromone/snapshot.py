@@ -0,0 +1,189 @@
+"""
+Snapshot a realisation part way through and fork several scenario
+continuations from it.
+
+The decoy and no-decoy scenarios (pheromoneReleaseDayMonths vs []) simulate
+exactly the same dynamics until the first release day, so that part only
+needs to be simulated once. Each fork starts from a copy of the same state
+and seeds the random number generator numba uses from the realisation's
+streams and the snapshot day, so the scenarios are also paired on common
+random numbers up to the point where they diverge.
+"""
+
+import copy
+import numpy as np
+from pheromone import calculation
+from pheromone import streams
+
+
+def getKernelSeed(inputs, day):
+    """
+    Seed of the random number generator used by numba compiled code (separate
+    from numpy's own) for carrying on from day. It comes from the parallel
+    streams (the same as randomStreams with common random numbers), so it
+    only depends on the realisation and the day.
+    """
+    return streams.getDaySeed(inputs.parallelStreams, streams.PARAMETER_STREAM, day)
+
+
+class KernelSnapshot(object):
+    """
+    Complete state of a realisation at the start of a given day:
+    the inputs from calculation.prepareRealisation (stoat array, mating
+    and interaction registries and the kernel state with the day counter)
+    plus the seed to carry on with.
+    """
+    def __init__(self, params, inputs):
+        self.params = params
+        self.day = int(inputs.kernelState[0]['day'])
+        self.inputs = copyRealisationInputs(inputs)
+        self.randomSeed = getKernelSeed(inputs, self.day)
+
+
+def copyRealisationInputs(inputs):
+    """
+    Copy of a RealisationInputs where the arrays that the kernel modifies
+    are not shared with the original
+    """
+    newInputs = copy.copy(inputs)
+    newInputs.stoatArray = inputs.stoatArray.copy()
+    newInputs.matingArray = inputs.matingArray.copy()
+    newInputs.pheromoneInteractionArray = inputs.pheromoneInteractionArray.copy()
+    newInputs.kernelState = inputs.kernelState.copy()
+    newInputs.cellHead = inputs.cellHead.copy()
+    newInputs.stoatHash = inputs.stoatHash.copy()
+    newInputs.movementBuffers = inputs.movementBuffers.copy()
+    newInputs.movementBufferPos = inputs.movementBufferPos.copy()
+    newInputs.randomStreams = inputs.randomStreams.copy()
+    newInputs.parallelStreams = inputs.parallelStreams.copy()
+    newInputs.telemetry = inputs.telemetry.copy()
+    return newInputs
+
+
+def getFirstReleaseDay(inputs):
+    """
+    The first day decoys are released in this realisation, or the last day
+    if there are none.
+    """
+    if inputs.pheromoneReleaseDays.shape[0] == 0:
+        return inputs.nDays
+    return int(inputs.pheromoneReleaseDays.min())
+
+
+def takeSnapshot(params, snapshotDay=None):
+    """
+    Start a new realisation and run it up to (but not including) snapshotDay.
+    By default this is the first pheromone release day as scenarios that
+    only differ in their decoys are identical until then.
+    Returns a KernelSnapshot.
+    """
+    inputs = calculation.prepareRealisation(params, save=False)
+    if snapshotDay is None:
+        snapshotDay = getFirstReleaseDay(inputs)
+    if snapshotDay < 0 or snapshotDay > inputs.nDays:
+        raise ValueError('snapshotDay outside the simulation period')
+
+    # stoats interact with the decoys even before any are released, and
+    # forks might release some, so don't use the no-decoy kernel
+    recordMovie, useDecoys, useTrapping = calculation.getKernelVariant(inputs)
+    useDecoys = inputs.pheromoneArray.shape[0] > 0
+    # and record the encounters with them the forks' releases might need
+    inputs.decoyInteractionDays[:snapshotDay] = True
+    calculation.callRealisation(params, inputs, stopDay=snapshotDay,
+            variant=(recordMovie, useDecoys, useTrapping))
+    return KernelSnapshot(params, inputs)
+
+
+def checkScheduleUnchanged(oldDays, newDays, day, name):
+    """
+    A fork can only change a schedule from the snapshot day onwards
+    """
+    if oldDays is None:
+        oldDays = np.empty(0, dtype=np.int64)
+    if newDays is None:
+        newDays = np.empty(0, dtype=np.int64)
+    oldBefore = np.sort(oldDays[oldDays < day])
+    newBefore = np.sort(newDays[newDays < day])
+    if not np.array_equal(oldBefore, newBefore):
+        msg = '{} before day {} differ from the snapshot'.format(name, day)
+        raise ValueError(msg)
+
+
+def forkFromSnapshot(snapshot, pheromoneReleaseDayMonths=None,
+                trappingDayMonths=None):
+    """
+    Continue the realisation in snapshot to the end with a (possibly)
+    different decoy release schedule and/or trapping schedule. Pass [] as
+    pheromoneReleaseDayMonths for the no-decoy scenario. None keeps the
+    schedule of the snapshot.
+
+    The decoys themselves (and so the decoy spacing) are those of the
+    snapshot as stoats have already been habituated to them.
+
+    The snapshot is not changed, so it can be forked any number of times.
+    Returns the same tuple as calculation.runModel.
+    """
+    params = snapshot.params
+    inputs = copyRealisationInputs(snapshot.inputs)
+
+    if pheromoneReleaseDayMonths is not None:
+        releaseDays = calculation.dayMonthToDays(params.startDate,
+                params.endDate, pheromoneReleaseDayMonths)
+        checkScheduleUnchanged(inputs.pheromoneReleaseDays, releaseDays,
+                snapshot.day, 'Pheromone release days')
+        inputs.pheromoneReleaseDayMonths = pheromoneReleaseDayMonths
+        inputs.pheromoneReleaseDays = releaseDays
+        calculation.setDecoyDays(params, inputs)
+
+    if trappingDayMonths is not None:
+        trappingDays = calculation.dayMonthToDays(params.startDate,
+            params.endDate, trappingDayMonths, params.nTrapDays)
+        checkScheduleUnchanged(inputs.trappingDays, trappingDays,
+                snapshot.day, 'Trapping days')
+        inputs.trappingDays = trappingDays
+
+    if pheromoneReleaseDayMonths is not None or trappingDayMonths is not None:
+        # the runs of days fastForward and absorbingTail can skip end on 
+        # release and trapping days (snapshots are never saving)
+        calculation.setRunLengths(params, inputs, save=False)
+
+    calculation.seedKernelRandom(snapshot.randomSeed)
+    eradicated = calculation.callRealisation(params, inputs)
+    return calculation.getModelResult(inputs, eradicated)
+
+
+def runPairedScenarios(params, scenarios, snapshotDay=None):
+    """
+    Run one realisation up to snapshotDay and fork each of the scenarios from
+    there. scenarios is a list of pheromoneReleaseDayMonths lists, eg
+    [params.pheromoneReleaseDayMonths, []] for decoy vs no-decoy.
+    By default snapshotDay is the first release day of any of the 
+    scenarios (the start if none have releases), so the result doesn't 
+    depend on their order.
+
+    Returns a list with the runModel tuple for each scenario.
+    """
+    if len(scenarios) == 0:
+        raise ValueError('Need at least one scenario')
+
+    if snapshotDay is None:
+        snapshotDay = 0
+        firstDays = []
+        for scenario in scenarios:
+            releaseDays = calculation.dayMonthToDays(params.startDate,
+                    params.endDate, scenario)
+            if releaseDays.shape[0] > 0:
+                firstDays.append(int(releaseDays.min()))
+        if len(firstDays) > 0:
+            snapshotDay = min(firstDays)
+
+    # none of the scenarios release any decoys before the snapshot day
+    # (forkFromSnapshot checks if snapshotDay was given) so which one 
+    # the realisation is started with makes no difference
+    firstParams = copy.copy(params)
+    firstParams.pheromoneReleaseDayMonths = scenarios[0]
+    snapshot = takeSnapshot(firstParams, snapshotDay)
+    results = []
+    for scenario in scenarios:
+        results.append(forkFromSnapshot(snapshot, scenario))
+    return results
@@ -0,0 +1,234 @@
+"""
+Common random numbers for comparing scenarios.
+
+With one generator for everything, anything that changes the number of
+draws (more decoys means more attraction draws, say) shifts every draw
+after it, so two scenarios run from the same seed soon have nothing in
+common and their difference is lost in the noise between realisations.
+
+Here each purpose has its own stream (placement of the initial stoats,
+movement, mortality, trapping, reproduction, dispersal and the choice of
+the mate or decoy to head for, plus one for the parameters of the
+realisation) and the draws of a stream are keyed on
+the realisation's seed, the day, the hour and the stoat: the n-th draw a
+stoat makes for a purpose in an hour is a hash of those and n. So a stoat
+that does the same thing in two scenarios gets the same draws in both,
+whatever else has happened, and the difference between paired realisations
+only comes from where the scenarios really differ.
+
+Keying is just a few multiplies, unlike reseeding a Mersenne twister.
+An empty randomStreams array means the draws come from np.random as before.
+"""
+
+import numpy as np
+from numba import njit
+
+# the streams
+PLACEMENT_STREAM = 0
+MOVEMENT_STREAM = 1
+MORTALITY_STREAM = 2
+TRAPPING_STREAM = 3
+REPRODUCTION_STREAM = 4
+DISPERSAL_STREAM = 5
+# drawn in python by getRandomVariates and for the generator numba uses
+# for anything else
+PARAMETER_STREAM = 6
+# which estrous female or decoy a stoat heads for, apart from MOVEMENT_STREAM
+# so the number of candidates doesn't shift the step draws after it
+ATTRACTION_STREAM = 7
+N_STREAMS = 8
+
+# days and hours to key the streams with outside the hourly loop
+INITIAL_DAY = -1
+DISPERSAL_HOUR = -1
+FAST_FORWARD_HOUR = -2
+# the walk of calculation.makeHomeRangeOffsets (on INITIAL_DAY)
+HOME_RANGE_HOUR = -3
+
+STREAM_DTYPE = [('seed', np.uint64), # seed of this stream for the realisation
+                ('key', np.uint64), # hash of the seed, day, hour and stoat
+                ('counter', np.int64) # draws made since keyed
+                ]
+
+# 2**-53, to turn 53 bits into a double in [0, 1)
+UNIT_SCALE = 1.0 / 9007199254740992.0
+
+
+@njit
+def mixSeed(z, value):
+    """
+    Mix an integer into a 64 bit hash (splitmix64)
+    """
+    z = (z ^ np.uint64(value & 0xFFFFFFFF)) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def makeStreams(seed):
+    """
+    The streams for the realisation with this seed (0 to 2**32 - 1), or
+    empty ones if seed is None so the model uses np.random.
+    """
+    if seed is None:
+        return np.empty(0, dtype=STREAM_DTYPE)
+    randomStreams = np.zeros(N_STREAMS, dtype=STREAM_DTYPE)
+    # numba returns a python int, which it can't pass back in if over 2**63
+    z = np.uint64(mixSeed(np.uint64(0), int(seed)))
+    for stream in range(N_STREAMS):
+        randomStreams[stream]['seed'] = mixSeed(z, stream)
+    return randomStreams
+
+def getStreamSeed(randomStreams, stream):
+    """
+    A 32 bit seed (for np.random.RandomState or seedKernelRandom) from
+    the stream
+    """
+    return int(randomStreams[stream]['seed'] >> np.uint64(32))
+
+def getDaySeed(randomStreams, stream, day):
+    """
+    A 32 bit seed from the stream for the day, for seedKernelRandom when
+    carrying on from a snapshot of that day
+    """
+    return int(mixSeed(randomStreams[stream]['seed'], day)) >> 32
+
+@njit
+def keyStreams(randomStreams, day, hour, stoatid):
+    """
+    Start the draws of all the streams for this stoat in this hour
+    """
+    for stream in range(randomStreams.shape[0]):
+        z = mixSeed(randomStreams[stream]['seed'], day)
+        z = mixSeed(z, hour)
+        randomStreams[stream]['key'] = mixSeed(z, stoatid)
+        randomStreams[stream]['counter'] = 0
+
+@njit
+def streamRandom(randomStreams, stream):
+    """
+    The next draw of a stream, uniform on [0, 1)
+    """
+    counter = randomStreams[stream]['counter'] + 1
+    randomStreams[stream]['counter'] = counter
+    z = mixSeed(randomStreams[stream]['key'], counter)
+    return np.float64(z >> np.uint64(11)) * UNIT_SCALE
+
+# the draws the model makes. Each uses np.random if randomStreams is empty
+
+@njit
+def drawRandom(randomStreams, stream):
+    if randomStreams.shape[0] == 0:
+        return np.random.random()
+    return streamRandom(randomStreams, stream)
+
+@njit
+def drawUniform(randomStreams, stream, low, high):
+    if randomStreams.shape[0] == 0:
+        return np.random.uniform(low, high)
+    return low + (high - low) * streamRandom(randomStreams, stream)
+
+@njit
+def drawBernoulli(randomStreams, stream, p):
+    """
+    True with probability p
+    """
+    if randomStreams.shape[0] == 0:
+        return np.random.binomial(1, p) == 1
+    return streamRandom(randomStreams, stream) < p
+
+@njit
+def drawRandint(randomStreams, stream, low, high):
+    if randomStreams.shape[0] == 0:
+        return np.random.randint(low, high)
+    return low + int(streamRandom(randomStreams, stream) * (high - low))
+
+@njit
+def drawPoisson(randomStreams, stream, mean):
+    """
+    By multiplying uniforms (fine for the small means of litter sizes)
+    """
+    if randomStreams.shape[0] == 0:
+        return np.random.poisson(mean)
+    limit = np.exp(-mean)
+    count = 0
+    product = streamRandom(randomStreams, stream)
+    while product > limit:
+        count += 1
+        product *= streamRandom(randomStreams, stream)
+    return count
+
+@njit
+def drawGeometric(randomStreams, stream, p):
+    """
+    Number of trials up to and including the first success
+    """
+    if randomStreams.shape[0] == 0:
+        return np.random.geometric(p)
+    if p >= 1.0:
+        return 1
+    u = streamRandom(randomStreams, stream)
+    return 1 + int(np.floor(np.log(1.0 - u) / np.log(1.0 - p)))
+
+@njit
+def drawWeibull(randomStreams, stream, shape):
+    """
+    By inversion, with scale 1
+    """
+    if randomStreams.shape[0] == 0:
+        return np.random.weibull(shape)
+    return (-np.log(1.0 - streamRandom(randomStreams, stream))) ** (1.0 / shape)
+
+@njit
+def drawVonMises(randomStreams, stream, mu, kappa):
+    """
+    Best and Fisher's method as np.random.vonmises, result in [-pi, pi)
+    """
+    if randomStreams.shape[0] == 0:
+        return np.random.vonmises(mu, kappa)
+    if kappa < 1e-8:
+        return np.pi * (2.0 * streamRandom(randomStreams, stream) - 1.0)
+    if kappa < 1e-5:
+        s = 1.0 / kappa + kappa
+    else:
+        r = 1.0 + np.sqrt(1.0 + 4.0 * kappa * kappa)
+        rho = (r - np.sqrt(2.0 * r)) / (2.0 * kappa)
+        s = (1.0 + rho * rho) / (2.0 * rho)
+    while True:
+        z = np.cos(np.pi * streamRandom(randomStreams, stream))
+        w = (1.0 + s * z) / (s + z)
+        y = kappa * (s - w)
+        v = streamRandom(randomStreams, stream)
+        # 1 - v so we never take the log of 0
+        v = 1.0 - v
+        if y * (2.0 - y) - v >= 0.0 or np.log(y / v) + 1.0 - y >= 0.0:
+            break
+    result = np.arccos(w)
+    if streamRandom(randomStreams, stream) < 0.5:
+        result = -result
+    result += mu
+    # wrap into [-pi, pi)
+    result = np.fmod(result + np.pi, 2.0 * np.pi)
+    if result < 0.0:
+        result += 2.0 * np.pi
+    return result - np.pi
+
+@njit
+def drawCategory(randomStreams, stream, probs):
+    """
+    Index i with probability probs[i], as the index of the 1 in
+    np.random.multinomial(1, probs)
+    """
+    if randomStreams.shape[0] == 0:
+        chosen = np.random.multinomial(1, probs)
+        for i in range(probs.shape[0]):
+            if chosen[i] > 0:
+                return i
+        return -1
+    u = streamRandom(randomStreams, stream)
+    total = 0.0
+    for i in range(probs.shape[0]):
+        total += probs[i]
+        if u < total:
+            return i
+    # rounding
+    return probs.shape[0] - 1
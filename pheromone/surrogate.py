@@ -0,0 +1,286 @@
+"""
+Surrogate of the probability of eradication for active sampling.
+
+Much of the parameter space is plainly 0% or 100% eradication, so running
+realisations evenly over it spends most of them where the answer is already
+known. activeSampling.py instead fits a cheap model of P(eradicated) to the
+realisations so far and runs the next wave where it is least sure which
+side of the boundary (P = 0.5) a point is on.
+
+The model is a logistic regression on the linear, squared and pairwise
+terms of the parameters (scaled to [0, 1]) with a ridge penalty, fitted by
+Newton's method. Its uncertainty is the Laplace approximation (the inverse
+Hessian at the fit) so each prediction has a mean and standard deviation
+on the logit scale. Points are picked by the straddle score
+beta * sd - |mean| of Bryan et al. (2005), which is high near the boundary
+and wherever the model knows little.
+
+A realisation is run at a point by giving each parameter a range of just
+that value (setParameterPoint) so getRandomVariates draws it.
+
+getSurrogateSurface gives the map of the boundary as an
+analytics.EradicationSurface for printing with analytics.formatSurface.
+"""
+
+import copy
+from collections import namedtuple
+import numpy as np
+from pheromone import analytics
+
+# (name in PheromoneParams, whether it is an integer) of the parameters
+# drawn for each realisation by calculation.getRandomVariates
+SURROGATE_PARAMETERS = [('meanNAdd', True), ('decoySpacing', False),
+                ('alphaK', False), ('COA_decay_spatial', False),
+                ('COA_decay_temporal', False), ('habituationDays', True),
+                ('PAnnualSurv', False)]
+
+DEFAULT_PENALTY = 0.1
+DEFAULT_BETA = 1.96
+# least distance (in the unit cube) between the points of a wave
+DEFAULT_MIN_DISTANCE = 0.15
+# points averaged over for each bin of getSurrogateSurface
+DEFAULT_SURFACE_SAMPLES = 2000
+NEWTON_ITERATIONS = 50
+NEWTON_TOLERANCE = 1e-8
+INTERCEPT_PENALTY_SCALE = 1e-4
+# logits are clipped to this when working out the weights
+MAX_LOGIT = 30.0
+
+# names, lower and upper of the parameters that vary and which are integers
+ParameterBox = namedtuple('ParameterBox', ['names', 'lower', 'upper', 'integer'])
+# coefficients of getFeatures and their covariance
+Surrogate = namedtuple('Surrogate', ['coefficients', 'covariance'])
+
+
+def getParameterBox(pars):
+    """
+    ParameterBox of the ranges in pars that have more than one value
+    """
+    names = []
+    lower = []
+    upper = []
+    integer = []
+    for name, isInteger in SURROGATE_PARAMETERS:
+        low, high = getattr(pars, name)[:2]
+        if isInteger:
+            # int(uniform(low, high)) and randint(low, high) never give high
+            low = int(np.ceil(low))
+            high = int(np.ceil(high)) - 1
+        if high > low:
+            names.append(name)
+            lower.append(low)
+            upper.append(high)
+            integer.append(isInteger)
+    return ParameterBox(names=names, lower=np.array(lower, dtype=np.float64),
+                upper=np.array(upper, dtype=np.float64),
+                integer=np.array(integer, dtype=bool))
+
+def fromUnit(box, unit):
+    """
+    Parameter values of points in the unit cube (one row each), rounded
+    as getRandomVariates would draw them
+    """
+    values = box.lower + unit * (box.upper - box.lower)
+    values[:, box.integer] = np.round(values[:, box.integer])
+    for i, name in enumerate(box.names):
+        if name == 'decoySpacing':
+            # getRandomVariates rounds the spacing to 10 metres
+            values[:, i] = np.round(values[:, i], -1)
+    return values
+
+def toUnit(box, values):
+    return (values - box.lower) / (box.upper - box.lower)
+
+def snapUnit(box, unit):
+    """
+    The points of the unit cube the realisations at unit are actually run
+    at, so the surrogate is fitted to those
+    """
+    return toUnit(box, fromUnit(box, unit))
+
+def setParameterPoint(pars, box, values):
+    """
+    Copy of pars with the parameters of box fixed at values
+    """
+    pars = copy.copy(pars)
+    for name, value, isInteger in zip(box.names, values, box.integer):
+        if isInteger:
+            # randint needs high > low
+            setattr(pars, name, [int(value), int(value) + 1])
+        else:
+            setattr(pars, name, [value, value])
+    return pars
+
+def latinHypercube(nPoints, nDims, rng=np.random):
+    """
+    nPoints in the unit cube with one in each of nPoints slices of each axis
+    """
+    unit = np.empty((nPoints, nDims))
+    for i in range(nDims):
+        unit[:, i] = (rng.permutation(nPoints) + rng.uniform(size=nPoints)) / nPoints
+    return unit
+
+def getFeatures(unit):
+    """
+    Constant, linear, squared and pairwise terms of points in the unit cube
+    (centred so the terms aren't too correlated)
+    """
+    x = unit - 0.5
+    nPoints, nDims = x.shape
+    columns = [np.ones(nPoints), *x.T, *(x ** 2).T]
+    for i in range(nDims):
+        for j in range(i + 1, nDims):
+            columns.append(x[:, i] * x[:, j])
+    return np.column_stack(columns)
+
+def getLogLikelihood(features, y, coefficients, ridge):
+    """
+    Penalised log likelihood of the logistic regression
+    """
+    logit = features @ coefficients
+    # log(1 + exp(logit)) without overflow
+    return (y * logit - np.logaddexp(0.0, logit)).sum() - 0.5 * (ridge * 
+                coefficients ** 2).sum()
+
+def getHessian(features, coefficients, ridge):
+    p = 1.0 / (1.0 + np.exp(-np.clip(features @ coefficients, -MAX_LOGIT, MAX_LOGIT)))
+    return (features.T * (p * (1.0 - p))) @ features + np.diag(ridge), p
+
+def fitSurrogate(unit, eradicated, penalty=DEFAULT_PENALTY):
+    """
+    Fit the logistic regression to points in the unit cube and whether
+    each was eradicated. Returns a Surrogate.
+    """
+    features = getFeatures(unit)
+    y = np.asarray(eradicated, dtype=np.float64)
+    # hardly any penalty on the constant (just enough that it can't run
+    # off to infinity if every realisation had the same outcome)
+    ridge = np.full(features.shape[1], penalty)
+    ridge[0] = penalty * INTERCEPT_PENALTY_SCALE
+    coefficients = np.zeros(features.shape[1])
+    logLikelihood = getLogLikelihood(features, y, coefficients, ridge)
+    for iteration in range(NEWTON_ITERATIONS):
+        hessian, p = getHessian(features, coefficients, ridge)
+        gradient = features.T @ (y - p) - ridge * coefficients
+        step = np.linalg.solve(hessian, gradient)
+        # halve the step until it improves the fit
+        scale = 1.0
+        while scale > NEWTON_TOLERANCE:
+            newLogLikelihood = getLogLikelihood(features, y, coefficients + 
+                        scale * step, ridge)
+            if newLogLikelihood >= logLikelihood:
+                break
+            scale *= 0.5
+        coefficients = coefficients + scale * step
+        improvement = newLogLikelihood - logLikelihood
+        logLikelihood = newLogLikelihood
+        if np.abs(scale * step).max() < NEWTON_TOLERANCE or improvement < NEWTON_TOLERANCE:
+            break
+    hessian, p = getHessian(features, coefficients, ridge)
+    return Surrogate(coefficients=coefficients, covariance=np.linalg.inv(hessian))
+
+def predictSurrogate(surrogate, unit):
+    """
+    Mean and standard deviation of the logit of P(eradicated) at points in
+    the unit cube, and P(eradicated) averaged over that uncertainty
+    (probit approximation).
+    """
+    features = getFeatures(unit)
+    mean = features @ surrogate.coefficients
+    variance = np.einsum('ij,jk,ik->i', features, surrogate.covariance, features)
+    sd = np.sqrt(np.maximum(variance, 0.0))
+    probability = 1.0 / (1.0 + np.exp(-mean / np.sqrt(1.0 + np.pi * sd ** 2 / 8.0)))
+    return mean, sd, probability
+
+def getStraddleScore(mean, sd, beta=DEFAULT_BETA):
+    return beta * sd - np.abs(mean)
+
+def getUncertainFraction(surrogate, unit, beta=DEFAULT_BETA):
+    """
+    Fraction of the points in unit whose side of the boundary isn't known
+    (the interval mean +- beta * sd includes 0)
+    """
+    mean, sd, probability = predictSurrogate(surrogate, unit)
+    return (getStraddleScore(mean, sd, beta) > 0).mean()
+
+def selectWave(surrogate, candidates, nPoints, minDistance=DEFAULT_MIN_DISTANCE,
+            beta=DEFAULT_BETA):
+    """
+    The nPoints candidates (points in the unit cube) with the highest
+    straddle scores, skipping any within minDistance of one already picked
+    so a wave isn't all in one spot.
+    """
+    mean, sd, probability = predictSurrogate(surrogate, candidates)
+    order = np.argsort(-getStraddleScore(mean, sd, beta))
+    chosen = []
+    for i in order:
+        if len(chosen) == nPoints:
+            break
+        if len(chosen) > 0:
+            distance = np.sqrt(((candidates[chosen] - candidates[i]) ** 2).sum(axis=1))
+            if distance.min() < minDistance:
+                continue
+        chosen.append(i)
+    return candidates[chosen]
+
+def getUnitBins(box, dim, nBins):
+    """
+    Edges in the unit cube of the bins of parameter dim of box and the
+    lower and upper values of each bin. An integer parameter with no more
+    than nBins values gets a bin for each value.
+    """
+    lower = box.lower[dim]
+    upper = box.upper[dim]
+    if box.integer[dim] and upper - lower + 1 <= nBins:
+        values = np.arange(lower, upper + 1)
+        edges = np.clip((np.append(values, upper + 1) - 0.5 - lower) / (upper - lower),
+                    0.0, 1.0)
+        return edges, values, values
+    edges = np.linspace(0.0, 1.0, nBins + 1)
+    values = lower + edges * (upper - lower)
+    return edges, values[:-1], values[1:]
+
+def getSurrogateSurface(surrogate, box, unit, eradicated, xname, yname=None,
+            nBins=analytics.DEFAULT_BINS, nSamples=DEFAULT_SURFACE_SAMPLES,
+            beta=DEFAULT_BETA, rng=np.random):
+    """
+    P(eradicated) from the surrogate binned over one or two parameters,
+    averaged over the others, as an analytics.EradicationSurface. lower and
+    upper are from the logit mean +- beta * sd. n and nEradicated are of the
+    realisations run (at points unit) in each bin.
+    """
+    names = [xname] if yname is None else [xname, yname]
+    dims = [box.names.index(name) for name in names]
+    bins = [getUnitBins(box, dim, nBins) for dim in dims]
+    shape = tuple(edges.shape[0] - 1 for edges, binLower, binUpper in bins)
+    eradicated = np.asarray(eradicated, dtype=bool)
+
+    pEradication = np.zeros(shape)
+    lower = np.zeros(shape)
+    upper = np.zeros(shape)
+    n = np.zeros(shape, dtype=np.int64)
+    nEradicated = np.zeros(shape, dtype=np.int64)
+    samples = rng.uniform(size=(nSamples, len(box.names)))
+    for cell in np.ndindex(*shape):
+        points = samples.copy()
+        inCell = np.ones(unit.shape[0], dtype=bool)
+        for k, dim in enumerate(dims):
+            edges = bins[k][0]
+            i = cell[k]
+            points[:, dim] = edges[i] + samples[:, dim] * (edges[i + 1] - edges[i])
+            inCell &= unit[:, dim] >= edges[i]
+            # the last bin includes its upper edge
+            if i < shape[k] - 1:
+                inCell &= unit[:, dim] < edges[i + 1]
+        mean, sd, probability = predictSurrogate(surrogate, points)
+        pEradication[cell] = probability.mean()
+        lower[cell] = (1.0 / (1.0 + np.exp(-(mean - beta * sd)))).mean()
+        upper[cell] = (1.0 / (1.0 + np.exp(-(mean + beta * sd)))).mean()
+        n[cell] = inCell.sum()
+        nEradicated[cell] = eradicated[inCell].sum()
+
+    return analytics.EradicationSurface(names=names,
+                binLower=[binLower for edges, binLower, binUpper in bins],
+                binUpper=[binUpper for edges, binLower, binUpper in bins],
+                n=n, nEradicated=nEradicated, pEradication=pEradication,
+                lower=lower, upper=upper)
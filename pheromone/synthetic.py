@@ -0,0 +1,87 @@
+"""
+Synthetic islands and trap layouts so the model can be run and timed
+without ressy.img, the traps file or GDAL.
+"""
+
+import numpy as np
+from pheromone import landscape
+
+# same corner as a typical EPSG:27200 raster
+SYNTHETIC_TLX = 2000000.0
+SYNTHETIC_TLY = 5500000.0
+
+
+def makeIslandMask(nCols, nRows, landFraction=0.5, complexity=4, pixSize=10.0,
+            seed=0):
+    """
+    Make a synthetic island mask. The coastline is a star shaped curve
+    r(theta) = R * (1 + sum of 'complexity' random harmonics) scaled so
+    about landFraction of the raster is land. complexity=0 gives an ellipse.
+
+    Returns the same tuple as calculation.readMask:
+    (mask, transform, tlx, tly, brx, bry, pixSize)
+    """
+    rng = np.random.RandomState(seed)
+    yy, xx = np.mgrid[0:nRows, 0:nCols]
+    # centred coords scaled so the raster is -1..1 in both directions
+    u = (xx + 0.5) / nCols * 2.0 - 1.0
+    v = (yy + 0.5) / nRows * 2.0 - 1.0
+    r = np.sqrt(u * u + v * v)
+    theta = np.arctan2(v, u)
+
+    shape = np.ones_like(theta)
+    for k in range(1, complexity + 1):
+        # higher harmonics are smaller so it stays in one piece
+        amp = rng.uniform(0.0, 0.3) / k
+        phase = rng.uniform(-np.pi, np.pi)
+        shape += amp * np.cos(2 * k * theta + phase)
+    shape = np.maximum(shape, 0.05)
+
+    # find R that gives the requested fraction of land
+    rel = r / shape
+    R = np.percentile(rel, landFraction * 100.0)
+    mask = (rel <= R).astype(np.uint8)
+    # leave a strip of sea around the edge like a real raster
+    mask[0, :] = 0
+    mask[-1, :] = 0
+    mask[:, 0] = 0
+    mask[:, -1] = 0
+
+    tlx = SYNTHETIC_TLX
+    tly = SYNTHETIC_TLY
+    transform = (tlx, pixSize, 0.0, tly, 0.0, -pixSize)
+    brx = tlx + nCols * pixSize
+    bry = tly - nRows * pixSize
+    return mask, transform, tlx, tly, brx, bry, pixSize
+
+
+def makeTrapGrid(maskData, spacing, offset=None):
+    """
+    Traps on a regular grid of the given spacing (metres), kept where they
+    are on land. Returns an (n, 2) array of x, y like calculation.readTrapsFile.
+    """
+    (mask, transform, tlx, tly, brx, bry, pixSize) = maskData
+    if offset is None:
+        offset = spacing / 2.0
+    xs = np.arange(tlx + offset, brx, spacing)
+    ys = np.arange(bry + offset, tly, spacing)
+    x, y = np.meshgrid(xs, ys)
+    x = x.flatten()
+    y = y.flatten()
+    xPix = ((x - tlx) / pixSize).astype(int)
+    yPix = ((tly - y) / pixSize).astype(int)
+    onLand = landscape.isLandPixels(mask, yPix, xPix)
+    return np.column_stack((x[onLand], y[onLand]))
+
+
+def writeTrapsFile(trapsArray, filename):
+    """
+    Write traps in the same layout as ressyalldatatraploc5.csv
+    (x and y in the 4th and 5th columns) so readTrapsFile can read them.
+    """
+    fileobj = open(filename, 'w')
+    fileobj.write('id,line,trap,easting,northing\n')
+    for i in range(trapsArray.shape[0]):
+        fileobj.write('{},0,{},{:.1f},{:.1f}\n'.format(i, i, trapsArray[i, 0],
+                trapsArray[i, 1]))
+    fileobj.close()
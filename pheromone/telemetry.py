@@ -0,0 +1,104 @@
+"""
+Where the time and memory of a realisation go.
+
+prepareRealisation, callRealisation and runModel time each phase of a
+realisation with RealisationTelemetry.phase. Each phase gets its own wall
+and CPU seconds, not counting the phases inside it. Time numba spends
+compiling during any phase is moved to 'jitCompile' so the first
+realisation in a worker doesn't look like a slow kernel.
+
+startSimulation.py copies the times and the worker's peak RSS into each
+PheromoneResults, and analytics.getTelemetrySummary reports on them.
+"""
+
+import os
+import sys
+import time
+import copy
+import socket
+from contextlib import contextmanager
+# compile events need numba 0.52 or later
+try:
+    from numba.core import event as numbaEvent
+except ImportError:
+    numbaEvent = None
+# not on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# phases of a realisation in the order they happen
+PHASES = ['rasterLoad', 'decoyGrid', 'setup', 'jitCompile', 'kernel', 'resultWrite']
+
+
+class RealisationTelemetry(object):
+    """
+    Wall and CPU seconds of each of PHASES for one realisation
+    """
+    def __init__(self):
+        self.wall = dict.fromkeys(PHASES, 0.0)
+        self.cpu = dict.fromkeys(PHASES, 0.0)
+        # wall, CPU and compile seconds of the phases inside each open phase
+        self.openPhases = []
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Add the time taken by the with block to phase name
+        """
+        inner = [0.0, 0.0, 0.0]
+        self.openPhases.append(inner)
+        listener = None
+        startWall = time.perf_counter()
+        startCpu = time.process_time()
+        try:
+            if numbaEvent is None:
+                yield
+            else:
+                listener = numbaEvent.TimingListener()
+                with numbaEvent.install_listener('numba:compile', listener):
+                    yield
+        finally:
+            wall = time.perf_counter() - startWall
+            cpu = time.process_time() - startCpu
+            compileTime = 0.0
+            if listener is not None and listener.done:
+                compileTime = listener.duration
+            self.openPhases.pop()
+            innerWall, innerCpu, innerCompile = inner
+            ownCompile = compileTime - innerCompile
+            # compiling is single threaded so its CPU time is its wall time
+            self.wall['jitCompile'] += ownCompile
+            self.cpu['jitCompile'] += ownCompile
+            self.wall[name] += max(wall - innerWall - ownCompile, 0.0)
+            self.cpu[name] += max(cpu - innerCpu - ownCompile, 0.0)
+            if len(self.openPhases) > 0:
+                outer = self.openPhases[-1]
+                outer[0] += wall
+                outer[1] += cpu
+                outer[2] += compileTime
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+
+def getPeakRSS():
+    """
+    Peak resident memory (bytes) of this process so far, or None if
+    it can't be found
+    """
+    if resource is None:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        return maxRSS
+    return maxRSS * 1024
+
+def getWorker():
+    """
+    Identifies this process (host:pid) so the realisations run by each
+    worker can be grouped
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
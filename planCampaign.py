@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+Dry run of a simulation campaign. Works out the range of decoy counts, the
+memory of a realisation and of a worker and the time of a realisation (from
+calibration runs of the first season) for the parameters in PheromoneParams, then
+recommends the workers per node and realisations per job before
+submitting them (see pheromone/planner.py).
+"""
+
+import os
+import argparse
+import multiprocessing
+from pheromone import planner
+from pheromone import params
+
+def getNodeMemory():
+    """
+    Bytes of memory of this machine, or None if it can't be found
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def getCmdargs():
+    inputDataPath = os.path.join(os.getenv('PROJDIR', default='.'), 'pheromoneWork', 'Data')
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--mask', default=os.path.join(inputDataPath, 'ressy.img'),
+        help='Extent mask (default=%(default)s)')
+    p.add_argument('--traps', default=os.path.join(inputDataPath,
+        'ressyalldatatraploc5.csv'), help='Traps file (default=%(default)s)')
+    p.add_argument('--niterations', type=int, default=400,
+        help='Realisations in the campaign (default=%(default)s)')
+    p.add_argument('--save', default=False, action='store_true',
+        help='Plan for runs that record every hour (runModel(save=True))')
+    p.add_argument('--ncores', type=int, default=multiprocessing.cpu_count(),
+        help='Cores of each node (default=%(default)s)')
+    p.add_argument('--nodememory', type=float,
+        help='GB of memory of each node (default is this machine\'s)')
+    p.add_argument('--nnodes', type=int, default=1,
+        help='Nodes the campaign runs on (default=%(default)s)')
+    p.add_argument('--calibrationdays', type=int, default=planner.DEFAULT_CALIBRATION_DAYS,
+        help='Days each calibration run is simulated for (default=%(default)s)')
+    p.add_argument('--ncalibration', type=int, default=planner.DEFAULT_CALIBRATION_RUNS,
+        help='Calibration runs at each end of the spacing range (default=%(default)s)')
+    p.add_argument('--jobhours', type=float, default=planner.DEFAULT_JOB_HOURS,
+        help='Longest a job should take (default=%(default)s)')
+    p.add_argument('--compilefraction', type=float,
+        default=planner.DEFAULT_COMPILE_FRACTION,
+        help='Most of a job that should go on compiling (default=%(default)s)')
+    p.add_argument('--memoryfraction', type=float,
+        default=planner.DEFAULT_MEMORY_FRACTION,
+        help='Fraction of the memory of a node the workers can use (default=%(default)s)')
+    return p.parse_args()
+
+def main():
+    cmdargs = getCmdargs()
+    pars = params.PheromoneParams()
+    pars.setExtentMask(cmdargs.mask)
+    pars.setTrapsFile(cmdargs.traps)
+
+    if cmdargs.nodememory is None:
+        nodeBytes = getNodeMemory()
+    else:
+        nodeBytes = cmdargs.nodememory * planner.BYTES_PER_GB
+
+    plan = planner.makePlan(pars, nIterations=cmdargs.niterations, save=cmdargs.save,
+            nCores=cmdargs.ncores, nodeBytes=nodeBytes, nNodes=cmdargs.nnodes,
+            calibrationDays=cmdargs.calibrationdays, nCalibration=cmdargs.ncalibration,
+            jobHours=cmdargs.jobhours, compileFraction=cmdargs.compilefraction,
+            memoryFraction=cmdargs.memoryfraction)
+    print(planner.formatPlan(plan))
+
+if __name__ == '__main__':
+    main()
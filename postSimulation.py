@@ -1,12 +1,9 @@
 #!/usr/bin/env python
 
 import os
-import pickle
 from pheromone import calcresults
+from pheromone import analytics
 #from pheromone import params
-from scipy.stats.mstats import mquantiles
-import pylab
-import numpy as np
 
 
 def processResults():
@@ -18,12 +15,19 @@ def processResults():
 
     simResultsFile = os.path.join(outputDataPath, 'simulationResults.csv')    
 
+    # columns for pheromone.analytics
+    columnsFile = os.path.join(outputDataPath, 'resultsColumns.npz')
+
 
 
     results = calcresults.PheromoneResults.unpickleFromFile(resultsDataPath)
 
     calcresults.PheromoneResults.writeToFileFX(results, simResultsFile)
 
+    columns = analytics.resultsToColumns(results)
+    analytics.saveColumns(columns, columnsFile)
+    print(analytics.formatSurface(analytics.getEradicationSurface(columns, 'decoySpacing')))
+
 
 if __name__ == '__main__':
     processResults()
@@ -0,0 +1,138 @@
+"""
+Tests of the intervals, surfaces, sensitivity indices and paired
+differences of pheromone/analytics.py on small made up columns
+"""
+
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+from pheromone import analytics
+
+
+def makeColumns(eradicated, **parameters):
+    """
+    Columns with every parameter constant except those given
+    """
+    eradicated = np.asarray(eradicated, dtype=bool)
+    columns = {'eradicated': eradicated}
+    for name in analytics.PARAMETER_FIELDS:
+        columns[name] = np.asarray(parameters.get(name, np.ones(eradicated.shape[0])),
+                dtype=np.float64)
+    return columns
+
+def test_wilson_interval():
+    # 5 of 10 at 95%
+    lower, upper = analytics.getWilsonInterval(np.array([5, 0, 10]), np.array([10, 10, 10]))
+    assert_allclose(lower[0], 0.236593, atol=1e-6)
+    assert_allclose(upper[0], 0.763407, atol=1e-6)
+    # none or all eradicated are still intervals, not points
+    assert lower[1] == 0.0 and 0.0 < upper[1] < 0.35
+    assert_allclose(1.0 - upper[2], lower[1], atol=1e-12)
+    assert_allclose(1.0 - lower[2], upper[1], atol=1e-12)
+
+def test_wilson_interval_empty_bin():
+    lower, upper = analytics.getWilsonInterval(np.array([0, 3]), np.array([0, 4]))
+    assert np.isnan(lower[0]) and np.isnan(upper[0])
+    assert lower[1] < 0.75 < upper[1]
+
+def test_wilson_interval_narrows():
+    lower, upper = analytics.getWilsonInterval(np.array([50, 500]), np.array([100, 1000]),
+                confidence=0.9)
+    assert (upper - lower)[1] < (upper - lower)[0]
+
+def test_bootstrap_interval():
+    nEradicated = np.array([[3, 0], [20, 7]])
+    n = np.array([[10, 0], [20, 14]])
+    lower, upper = analytics.getBootstrapInterval(nEradicated, n, seed=1)
+    assert lower.shape == n.shape
+    assert np.isnan(lower[0, 1]) and np.isnan(upper[0, 1])
+    # all eradicated can only resample to all eradicated
+    assert lower[1, 0] == 1.0 and upper[1, 0] == 1.0
+    assert lower[0, 0] <= 0.3 <= upper[0, 0]
+    assert lower[1, 1] < 0.5 < upper[1, 1]
+    # the same seed gives the same interval
+    again = analytics.getBootstrapInterval(nEradicated, n, seed=1)
+    assert_array_equal(lower, again[0])
+    assert_array_equal(upper, again[1])
+
+def test_bootstrap_close_to_wilson():
+    nEradicated = np.array([40])
+    n = np.array([100])
+    lower, upper = analytics.getBootstrapInterval(nEradicated, n, nBootstraps=20000, seed=2)
+    wilsonLower, wilsonUpper = analytics.getWilsonInterval(nEradicated, n)
+    assert_allclose(lower, wilsonLower, atol=0.02)
+    assert_allclose(upper, wilsonUpper, atol=0.02)
+
+def test_bins_few_values():
+    values = np.array([19.0, 8.0, 19.0, 12.0, 8.0])
+    index, lower, upper = analytics.getBins(values, nBins=5)
+    assert_array_equal(lower, [8.0, 12.0, 19.0])
+    assert_array_equal(upper, lower)
+    assert_array_equal(lower[index], values)
+
+def test_bins_quantiles():
+    values = np.arange(100, dtype=np.float64)
+    index, lower, upper = analytics.getBins(values, nBins=4)
+    assert_array_equal(np.bincount(index), [25, 25, 25, 25])
+    # the last bin includes its upper edge
+    assert index[-1] == 3 and upper[-1] == 99.0
+
+def test_eradication_surface():
+    spacing = np.repeat([300.0, 600.0], 4)
+    habituation = np.tile([10.0, 10.0, 20.0, 20.0], 2)
+    eradicated = [1, 1, 1, 0, 1, 0, 0, 0]
+    columns = makeColumns(eradicated, decoySpacing=spacing, habituationDays=habituation)
+
+    surface = analytics.getEradicationSurface(columns, 'decoySpacing')
+    assert surface.names == ('decoySpacing',)
+    assert_array_equal(surface.binLower[0], [300.0, 600.0])
+    assert_array_equal(surface.n, [4, 4])
+    assert_array_equal(surface.nEradicated, [3, 1])
+    assert_allclose(surface.pEradication, [0.75, 0.25])
+    assert np.all(surface.lower < surface.pEradication)
+    assert np.all(surface.upper > surface.pEradication)
+
+    surface = analytics.getEradicationSurface(columns, 'decoySpacing', 'habituationDays',
+                method='bootstrap', seed=3)
+    assert_array_equal(surface.n, [[2, 2], [2, 2]])
+    assert_allclose(surface.pEradication, [[1.0, 0.5], [0.5, 0.0]])
+    assert surface.lower[0, 0] == 1.0 and surface.upper[1, 1] == 0.0
+
+def test_sensitivity_indices():
+    rng = np.random.RandomState(4)
+    n = 10000
+    spacing = rng.uniform(300, 1000, n)
+    alphaK = rng.uniform(0.01, 0.1, n)
+    columns = makeColumns(spacing < 650, decoySpacing=spacing, alphaK=alphaK)
+    indices = analytics.getSensitivityIndices(columns)
+    # only the parameters that vary
+    assert sorted(indices) == ['alphaK', 'decoySpacing']
+    # spacing decides everything (but for the bin straddling 650)
+    assert indices['decoySpacing'] > 0.9
+    assert indices['alphaK'] < 0.01
+
+def test_sensitivity_indices_no_variance():
+    columns = makeColumns(np.ones(100), decoySpacing=np.arange(100))
+    assert analytics.getSensitivityIndices(columns) == {'decoySpacing': 0.0}
+
+def test_paired_difference():
+    paired = analytics.getPairedDifference([1, 1, 0, 0], [1, 0, 0, 0])
+    assert paired.n == 4
+    assert_allclose([paired.pA, paired.pB, paired.difference], [0.5, 0.25, 0.25])
+    # the differences are 0, 1, 0, 0
+    assert_allclose(paired.standardError, 0.25)
+    z = analytics.getNormalQuantile(analytics.DEFAULT_CONFIDENCE)
+    assert_allclose([paired.lower, paired.upper], [0.25 - z * 0.25, 0.25 + z * 0.25])
+    assert_allclose(paired.unpairedStandardError, np.sqrt((1.0 / 3 + 0.25) / 4))
+    assert_allclose(paired.varianceRatio, (paired.unpairedStandardError / 0.25) ** 2)
+
+def test_paired_difference_identical():
+    paired = analytics.getPairedDifference([1, 0, 1], [1, 0, 1])
+    assert paired.difference == 0.0 and paired.standardError == 0.0
+    assert paired.varianceRatio == np.inf
+
+def test_paired_difference_too_few():
+    # no standard error from one pair
+    for a, b in (([1], [0]), ([], []), ([1, 0], [1])):
+        with pytest.raises(ValueError):
+            analytics.getPairedDifference(a, b)
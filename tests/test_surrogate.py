@@ -0,0 +1,112 @@
+"""
+Tests of the parameter box, the rounding of points and the fit and wave
+selection of pheromone/surrogate.py
+"""
+
+import types
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+from pheromone import surrogate
+
+
+def makePars(**ranges):
+    """
+    Something with the ranges of SURROGATE_PARAMETERS, all a single value
+    except those given
+    """
+    pars = types.SimpleNamespace(meanNAdd=[6, 7], decoySpacing=[300, 300],
+                alphaK=[0.02, 0.02], COA_decay_spatial=[0.01, 0.01],
+                COA_decay_temporal=[0.005, 0.005], habituationDays=[19, 20],
+                PAnnualSurv=[0.5, 0.5])
+    for name, values in ranges.items():
+        setattr(pars, name, values)
+    return pars
+
+def test_parameter_box():
+    box = surrogate.getParameterBox(makePars(meanNAdd=[6, 12], decoySpacing=[300, 1000]))
+    assert box.names == ['meanNAdd', 'decoySpacing']
+    # randint(6, 12) never gives 12
+    assert_array_equal(box.lower, [6, 300])
+    assert_array_equal(box.upper, [11, 1000])
+    assert_array_equal(box.integer, [True, False])
+
+def test_parameter_box_single_values():
+    # [6, 7] and [19, 20] can only draw 6 and 19
+    assert surrogate.getParameterBox(makePars()).names == []
+
+def test_from_unit_rounds():
+    box = surrogate.getParameterBox(makePars(meanNAdd=[6, 12], decoySpacing=[300, 1000],
+                alphaK=[0.01, 0.1]))
+    unit = np.array([[0.0, 0.0, 0.0], [0.55, 0.3333, 0.5], [1.0, 1.0, 1.0]])
+    values = surrogate.fromUnit(box, unit)
+    assert_allclose(values[:, 0], [6, 9, 11])
+    # decoySpacing to 10 metres, as getRandomVariates draws it
+    assert_allclose(values[:, 1], [300, 530, 1000])
+    assert_allclose(values[:, 2], [0.01, 0.055, 0.1])
+
+def test_snap_unit():
+    box = surrogate.getParameterBox(makePars(meanNAdd=[6, 12], decoySpacing=[300, 1000],
+                alphaK=[0.01, 0.1]))
+    unit = np.random.RandomState(5).uniform(size=(50, 3))
+    snapped = surrogate.snapUnit(box, unit)
+    # the points are run at the same values, and snapping again changes nothing
+    assert_allclose(surrogate.fromUnit(box, snapped), surrogate.fromUnit(box, unit))
+    assert_allclose(surrogate.snapUnit(box, snapped), snapped)
+    assert np.all(np.abs(snapped - unit)[:, 0] <= 0.5 / 5 + 1e-12)
+    assert np.all(np.abs(snapped - unit)[:, 1] <= 5.0 / 700 + 1e-12)
+    assert_allclose(snapped[:, 2], unit[:, 2])
+
+def test_latin_hypercube():
+    unit = surrogate.latinHypercube(20, 3, np.random.RandomState(6))
+    for i in range(3):
+        assert_array_equal(np.sort(np.floor(unit[:, i] * 20)), np.arange(20))
+
+def test_fit_surrogate():
+    rng = np.random.RandomState(7)
+    unit = rng.uniform(size=(400, 2))
+    # eradicated more often the higher the first parameter
+    eradicated = rng.uniform(size=400) < unit[:, 0]
+    fit = surrogate.fitSurrogate(unit, eradicated)
+
+    # Newton's method converged: the penalised score is 0
+    features = surrogate.getFeatures(unit)
+    ridge = np.full(features.shape[1], surrogate.DEFAULT_PENALTY)
+    ridge[0] *= surrogate.INTERCEPT_PENALTY_SCALE
+    p = 1.0 / (1.0 + np.exp(-features @ fit.coefficients))
+    gradient = features.T @ (eradicated - p) - ridge * fit.coefficients
+    assert np.abs(gradient).max() < 1e-6
+    assert_allclose(fit.covariance, fit.covariance.T)
+
+    mean, sd, probability = surrogate.predictSurrogate(fit, np.array([[0.1, 0.5],
+                [0.5, 0.5], [0.9, 0.5]]))
+    assert probability[0] < 0.3 < 0.7 < probability[2]
+    assert abs(probability[1] - 0.5) < 0.15
+    assert np.all(sd > 0)
+
+def test_fit_surrogate_one_outcome():
+    # the ridge keeps the fit finite when everything was eradicated
+    unit = np.random.RandomState(8).uniform(size=(30, 2))
+    fit = surrogate.fitSurrogate(unit, np.ones(30, dtype=bool))
+    assert np.all(np.isfinite(fit.coefficients))
+    probability = surrogate.predictSurrogate(fit, unit)[2]
+    assert np.all(probability > 0.5)
+
+def test_select_wave():
+    # logit 10 * (x - 0.5) and no uncertainty, so the score is highest at 0.5
+    fit = surrogate.Surrogate(coefficients=np.array([0.0, 10.0, 0.0]),
+                covariance=np.zeros((3, 3)))
+    candidates = np.array([[0.9], [0.52], [0.5], [0.3], [0.6]])
+    wave = surrogate.selectWave(fit, candidates, 2, minDistance=0.15)
+    # 0.52 and 0.6 are too close to 0.5
+    assert_array_equal(wave, [[0.5], [0.3]])
+    # only three are far enough apart
+    wave = surrogate.selectWave(fit, candidates, 5, minDistance=0.15)
+    assert_array_equal(wave, [[0.5], [0.3], [0.9]])
+
+def test_select_wave_uncertainty():
+    # with the same mean everywhere the least known point comes first
+    fit = surrogate.Surrogate(coefficients=np.array([2.0, 0.0, 0.0]),
+                covariance=np.diag([0.0, 0.0, 100.0]))
+    candidates = np.array([[0.5], [0.55], [0.0]])
+    wave = surrogate.selectWave(fit, candidates, 1)
+    assert_array_equal(wave, [[0.0]])
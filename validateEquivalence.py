@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+
+"""
+Statistical equivalence harness for changes to the kernel. A faster
+runRealisation draws its random numbers in a different order so its
+results can't be compared bit for bit, but they should come from the
+same distributions.
+
+The reference is the model at git revision --reference (extracted to a
+temporary directory) or, with --reference worktree, this tree with the
+--refset settings. The revision needs prepareRealisation, callRealisation
+and pheromone/synthetic.py, so it can't be older than the benchmark suite
+(14d18b8). The candidate is this tree with the --set settings.
+Each runs --nseeds realisations on a small synthetic island, a day at a
+time (--interval) so the number of live stoats and the deaths on trapping
+days can be recorded as it goes. For a couple of days during estrous every
+hour is recorded, for the lengths of the stoats' steps and the angles they
+turn through between them (home range and mate search movement).
+
+Not finding a difference doesn't show there isn't one (with few seeds
+nothing is significant), so each statistic has a tolerance on the size of
+the difference: --maxdp on the difference in the probability of
+eradication, --maxstepd on the Kolmogorov-Smirnov D of the steps and
+turning angles (of all the realisations together, so many more values)
+and --maxd on the D of the rest. As in two
+one-sided tests (TOST), a statistic is equivalent if the upper confidence
+bound of its difference at --alpha is within the tolerance. It differs if
+a two-sample test (Fisher's exact test or Kolmogorov-Smirnov) is
+significant at --alpha, Bonferroni corrected for the number of tests, and
+the difference is more than the tolerance. It exits 0 if every statistic
+is equivalent, 1 if any differ and 2 if it can't tell (more seeds make
+the bounds tighter, as 1 / sqrt(nseeds)).
+
+It also checks the modes that should give the same model faster or in
+less memory, with --reference worktree and the mode in --set:
+
+    --set fastForward=True --interval 60
+    --set absorbingTail=True --days 540 --interval 30
+    --set compactState=True
+
+Skipping days (fastForward, absorbingTail) only happens within an
+interval, so --interval needs to be longer than fastForwardMinDays or
+absorbingTailMinDays to check them, and the tail is only reached once the
+breeding of a season is over so --days needs to run into the next year.
+"""
+
+import os
+import ast
+import sys
+import time
+import shutil
+import tarfile
+import argparse
+import datetime
+import tempfile
+import subprocess
+import multiprocessing
+import numpy as np
+from scipy import stats
+
+# the 'small' island of benchmarkKernel.py: nCols, nRows, land fraction,
+# coastline complexity
+ISLAND = (300, 200, 0.6, 2)
+TRAP_SPACING = 200
+DECOY_SPACING = 500
+# from 1 August this covers estrous, both decoy releases, births and the
+# November trapping
+SEASON_DAYS = 180
+# fractions of the season the population is compared at
+CHECKPOINTS = [0.25, 0.5, 0.75, 1.0]
+# the hours recorded for the steps: two days from the end of September,
+# in estrous and after the first decoy release. Shorter than
+# fastForwardMinDays and absorbingTailMinDays so none of it is skipped
+MOVEMENT_START_DAY = 60
+MOVEMENT_DAYS = 2
+# tolerances of the difference in P(eradicated) and of the KS D. With the
+# default seeds the bounds at alpha 0.01 are about 0.08 and 0.12 above
+# the differences, so the same model is well within them. The steps of
+# all the realisations are pooled into tens of thousands of values, so
+# with the default seeds their bounds are about 0.01 to 0.015 above the
+# differences and a change of stepShape from 0.9 to 1.0 shows
+DEFAULT_MAX_DP = 0.15
+DEFAULT_MAX_D = 0.25
+DEFAULT_MAX_STEP_D = 0.025
+# exit codes
+EXIT_DIFFERENT = 1
+EXIT_INCONCLUSIVE = 2
+
+# the model for this process, set by importModel
+modelModules = None
+islandData = None
+
+
+def importModel(packageDir):
+    """
+    Import calculation, params and synthetic from the pheromone package in
+    packageDir (None for the one next to this script). Only done once
+    per process.
+    """
+    global modelModules
+    if modelModules is None:
+        if packageDir is not None:
+            sys.path.insert(0, packageDir)
+        from pheromone import calculation
+        from pheromone import params
+        from pheromone import synthetic
+        modelModules = (calculation, params, synthetic)
+    return modelModules
+
+def getIsland(synthetic):
+    global islandData
+    if islandData is None:
+        maskData = synthetic.makeIslandMask(*ISLAND)
+        islandData = (maskData, synthetic.makeTrapGrid(maskData, TRAP_SPACING))
+    return islandData
+
+def makePars(params, settings, nDays):
+    pars = params.PheromoneParams()
+    pars.endDate = pars.startDate + datetime.timedelta(days=nDays)
+    pars.decoySpacing = [DECOY_SPACING, DECOY_SPACING + 1]
+    for name, value in settings:
+        if not hasattr(pars, name):
+            raise ValueError('PheromoneParams has no {}'.format(name))
+        setattr(pars, name, value)
+    return pars
+
+def getLiveStoats(inputs):
+    """
+    Positions of the live stoats by id
+    """
+    nStoats = inputs.kernelState[0]['nStoats']
+    stoats = inputs.stoatArray[:nStoats]
+    stoats = stoats[~stoats['deleted']]
+    return {int(stoat['id']) : (float(stoat['x']), float(stoat['y'])) for stoat in stoats}
+
+def recordHours(pars, inputs, calculation, stopDay):
+    """
+    Run to stopDay recording the stoats every hour, as for a movie but only
+    for these days. Returns the frames (hours by stoats) up to the end or
+    eradication.
+    """
+    nHours = (stopDay - int(inputs.kernelState[0]['day'])) * pars.hoursPerDay
+    inputs.stoatDebugFrame = np.zeros((nHours, inputs.stoatArray.shape[0]),
+            dtype=inputs.stoatArray.dtype)
+    inputs.stoatDebugInEstrous = np.zeros(nHours, dtype=bool)
+    inputs.stoatDebugDaysSincePheromone = np.zeros(nHours, dtype=np.int32)
+    inputs.stoatDebugTrapping = np.zeros(inputs.nDays, dtype=np.int32)
+    # the frames start at the first hour of these days
+    debugIndex = int(inputs.kernelState[0]['debugIndex'])
+    inputs.kernelState[0]['debugIndex'] = 0
+    calculation.callRealisation(pars, inputs, stopDay)
+    nRecorded = int(inputs.kernelState[0]['debugIndex'])
+    inputs.kernelState[0]['debugIndex'] = debugIndex + nRecorded
+    frames = inputs.stoatDebugFrame[:nRecorded]
+    inputs.stoatDebugFrame = None
+    inputs.stoatDebugInEstrous = None
+    inputs.stoatDebugDaysSincePheromone = None
+    inputs.stoatDebugTrapping = None
+    return frames
+
+def getSteps(frames):
+    """
+    The lengths of the hourly steps of the stoats in frames (from 
+    recordHours) and the angles (in [-pi, pi)) they turned through between
+    one step and the next, those into a step of home range movement apart
+    from those searching for a mate. Kits in the nest don't move.
+    """
+    lengths = []
+    homeRangeTurns = []
+    searchTurns = []
+    # position and bearing of the last step by id
+    previous = {}
+    for frame in frames:
+        current = {}
+        for stoat in frame[~frame['deleted'] & (frame['parentid'] == -1)]:
+            stoatId = int(stoat['id'])
+            x = float(stoat['x'])
+            y = float(stoat['y'])
+            bearing = None
+            if stoatId in previous:
+                lastX, lastY, lastBearing = previous[stoatId]
+                lengths.append(np.hypot(x - lastX, y - lastY))
+                # as the kernel, clockwise from north
+                bearing = np.arctan2(x - lastX, y - lastY)
+                if lastBearing is not None:
+                    turn = (bearing - lastBearing + np.pi) % (2 * np.pi) - np.pi
+                    # the frame has the behaviour of the step into it
+                    if stoat['homerange']:
+                        homeRangeTurns.append(turn)
+                    else:
+                        searchTurns.append(turn)
+            current[stoatId] = (x, y, bearing)
+        previous = current
+    return lengths, homeRangeTurns, searchTurns
+
+def collectOne(job):
+    """
+    Run one realisation a step of interval days at a time. job is
+    (packageDir, settings, nDays, interval, seed). Returns whether it was
+    eradicated, the live stoats at the start of each step and at the end,
+    the deaths in steps with and without trapping days, the births and what
+    getSteps returns for the hourly steps over the MOVEMENT_DAYS from
+    MOVEMENT_START_DAY.
+    """
+    packageDir, settings, nDays, interval, seed = job
+    calculation, params, synthetic = importModel(packageDir)
+    maskData, trapsArray = getIsland(synthetic)
+    pars = makePars(params, settings, nDays)
+
+    np.random.seed(seed)
+    calculation.seedKernelRandom(seed)
+    inputs = calculation.prepareRealisation(pars, save=False, maskData=maskData,
+                trapsArray=trapsArray)
+    nDays = inputs.nDays
+    trappingDays = inputs.trappingDays if inputs.trappingDays is not None else []
+    firstId = int(inputs.kernelState[0]['Current_Id'])
+    movementEndDay = MOVEMENT_START_DAY + MOVEMENT_DAYS
+
+    population = []
+    trapDeaths = 0
+    otherDeaths = 0
+    steps = ([], [], [])
+    day = 0
+    before = getLiveStoats(inputs)
+    while day < nDays:
+        population.append(len(before))
+        stopDay = min(day + interval, nDays)
+        recording = day == MOVEMENT_START_DAY and movementEndDay <= nDays
+        if recording:
+            stopDay = movementEndDay
+        elif day < MOVEMENT_START_DAY < stopDay:
+            stopDay = MOVEMENT_START_DAY
+        if not inputs.kernelState[0]['finished']:
+            if recording:
+                steps = getSteps(recordHours(pars, inputs, calculation, stopDay))
+            else:
+                calculation.callRealisation(pars, inputs, stopDay)
+        after = getLiveStoats(inputs)
+        nDied = len([stoatId for stoatId in before if stoatId not in after])
+        if any([day <= trapDay < stopDay for trapDay in trappingDays]):
+            trapDeaths += nDied
+        else:
+            otherDeaths += nDied
+        before = after
+        day = stopDay
+    population.append(len(before))
+
+    births = int(inputs.kernelState[0]['Current_Id']) - firstId
+    return (bool(inputs.kernelState[0]['eradicated']), np.array(population),
+            trapDeaths, otherDeaths, births) + tuple(np.array(values) for values in steps)
+
+def collect(packageDir, settings, nDays, interval, seeds, nCpus, output):
+    """
+    Run a realisation for each of seeds and save what collectOne returns as
+    arrays to output (a .npz), with the steps of all of them together
+    """
+    jobs = [(packageDir, settings, nDays, interval, seed) for seed in seeds]
+    pool = multiprocessing.Pool(nCpus)
+    results = pool.map(collectOne, jobs)
+    pool.close()
+    pool.join()
+    np.savez(output, eradicated=np.array([result[0] for result in results]),
+            population=np.array([result[1] for result in results]),
+            trapDeaths=np.array([result[2] for result in results]),
+            otherDeaths=np.array([result[3] for result in results]),
+            births=np.array([result[4] for result in results]),
+            stepLengths=np.concatenate([result[5] for result in results]),
+            homeRangeTurns=np.concatenate([result[6] for result in results]),
+            searchTurns=np.concatenate([result[7] for result in results]))
+
+def runCollect(packageDir, settings, nDays, interval, seeds, nCpus, output):
+    """
+    collect in a new process, so the reference and candidate are each
+    imported from their own package
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--collect', output,
+            '--days', str(nDays), '--interval', str(interval), '--firstseed', str(seeds[0]),
+            '--nseeds', str(len(seeds)), '--ncpus', str(nCpus)]
+    if packageDir is not None:
+        command.extend(['--package', packageDir])
+    for name, value in settings:
+        command.extend(['--set', '{}={!r}'.format(name, value)])
+    start = time.time()
+    # getRandomVariates prints every realisation
+    subprocess.check_call(command, stdout=subprocess.DEVNULL)
+    data = np.load(output)
+    results = {name : data[name] for name in data.files}
+    data.close()
+    return results, time.time() - start
+
+def extractRevision(revision, directory):
+    """
+    Extract the pheromone package at git revision into directory
+    """
+    repoDir = os.path.dirname(os.path.abspath(__file__))
+    archive = os.path.join(directory, 'pheromone.tar')
+    with open(archive, 'wb') as fileobj:
+        subprocess.check_call(['git', 'archive', '--format=tar', revision, 'pheromone'],
+                cwd=repoDir, stdout=fileobj)
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+    os.remove(archive)
+    if not os.path.exists(os.path.join(directory, 'pheromone', 'synthetic.py')):
+        raise SystemExit('--reference {} is older than pheromone/synthetic.py '.format(
+                revision) + '(14d18b8), which the harness needs')
+
+def compareResults(reference, candidate, alpha, maxDP, maxD, maxStepD):
+    """
+    Two-sample tests of each statistic. Returns a list of (name, reference
+    mean, candidate mean, p value, size of the difference, its upper bound
+    at alpha, tolerance).
+    """
+    tests = [('P(eradicated)',) + getProportionTest(reference['eradicated'],
+                candidate['eradicated'], alpha) + (maxDP,)]
+
+    nSamples = reference['population'].shape[1]
+    for fraction in CHECKPOINTS:
+        i = min(int(round(fraction * (nSamples - 1))), nSamples - 1)
+        tests.append(('stoats at {:.0%}'.format(fraction),) +
+                getKSTest(reference['population'][:, i], candidate['population'][:, i],
+                alpha) + (maxD,))
+    tests.append(('mean stoats',) + getKSTest(reference['population'].mean(axis=1),
+                candidate['population'].mean(axis=1), alpha) + (maxD,))
+    for name in ('trapDeaths', 'otherDeaths', 'births'):
+        tests.append((name,) + getKSTest(reference[name], candidate[name], alpha) + (maxD,))
+    for name in ('stepLengths', 'homeRangeTurns', 'searchTurns'):
+        tests.append((name,) + getKSTest(reference[name], candidate[name], alpha) +
+                (maxStepD,))
+    return tests
+
+def getProportionTest(a, b, alpha):
+    """
+    Proportions of a and b (bools), the p value of Fisher's exact test and
+    the absolute difference of the proportions with its upper bound at
+    alpha (Agresti-Caffo, the one-sided bound of TOST)
+    """
+    table = [[a.sum(), (~a).sum()], [b.sum(), (~b).sum()]]
+    pValue = stats.fisher_exact(table)[1]
+    # adding a success and a failure to each keeps the bound sensible at 0 and 1
+    pa = (a.sum() + 1.0) / (a.shape[0] + 2)
+    pb = (b.sum() + 1.0) / (b.shape[0] + 2)
+    se = np.sqrt(pa * (1 - pa) / (a.shape[0] + 2) + pb * (1 - pb) / (b.shape[0] + 2))
+    bound = min(abs(pa - pb) + stats.norm.ppf(1 - alpha) * se, 1.0)
+    return a.mean(), b.mean(), pValue, abs(a.mean() - b.mean()), bound
+
+def getKSTest(a, b, alpha):
+    """
+    Means of a and b, the p value of the Kolmogorov-Smirnov test and its
+    D with an upper bound at alpha (from the Dvoretzky-Kiefer-Wolfowitz
+    inequality), without the realisations that have no value (nan)
+    """
+    a = a[np.isfinite(a)]
+    b = b[np.isfinite(b)]
+    if a.shape[0] == 0 and b.shape[0] == 0:
+        return np.nan, np.nan, 1.0, 0.0, 0.0
+    if a.shape[0] == 0 or b.shape[0] == 0:
+        return np.nan, np.nan, 1.0, np.nan, 1.0
+    n = a.shape[0]
+    m = b.shape[0]
+    margin = np.sqrt(np.log(2.0 / alpha) / 2.0 * (n + m) / (n * m))
+    if np.array_equal(np.sort(a), np.sort(b)):
+        return a.mean(), b.mean(), 1.0, 0.0, min(margin, 1.0)
+    result = stats.ks_2samp(a, b)
+    return (a.mean(), b.mean(), result.pvalue, result.statistic,
+            min(result.statistic + margin, 1.0))
+
+def parseSetting(text):
+    """
+    NAME=VALUE with VALUE a Python literal (or else a string)
+    """
+    if '=' not in text:
+        raise argparse.ArgumentTypeError('Expected NAME=VALUE, not {}'.format(text))
+    name, value = text.split('=', 1)
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return name, value
+
+def getCmdargs():
+    p = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--reference', default='HEAD',
+        help='Git revision of the reference model, or worktree for this ' +
+            'tree (default=%(default)s)')
+    p.add_argument('--refset', type=parseSetting, action='append', default=[],
+        metavar='NAME=VALUE', help='Parameter of the reference (can be repeated)')
+    p.add_argument('--set', type=parseSetting, action='append', default=[],
+        metavar='NAME=VALUE', help='Parameter of the candidate (can be repeated)')
+    p.add_argument('--nseeds', type=int, default=400,
+        help='Realisations of each (default=%(default)s)')
+    p.add_argument('--firstseed', type=int, default=0,
+        help='Seed of the first realisation (default=%(default)s)')
+    p.add_argument('--days', type=int, default=SEASON_DAYS,
+        help='Days simulated from 1 August (default=%(default)s)')
+    p.add_argument('--interval', type=int, default=1,
+        help='Days simulated between looks at the stoats (default=%(default)s)')
+    p.add_argument('--alpha', type=float, default=0.01,
+        help='Chance of calling them different if they are the same model, and ' +
+            'of calling them equivalent if they aren\'t (default=%(default)s)')
+    p.add_argument('--maxdp', type=float, default=DEFAULT_MAX_DP,
+        help='Tolerance of the difference in P(eradicated) (default=%(default)s)')
+    p.add_argument('--maxd', type=float, default=DEFAULT_MAX_D,
+        help='Tolerance of the Kolmogorov-Smirnov D of the other statistics ' +
+            '(default=%(default)s)')
+    p.add_argument('--maxstepd', type=float, default=DEFAULT_MAX_STEP_D,
+        help='Tolerance of the Kolmogorov-Smirnov D of the step lengths and ' +
+            'turning angles (default=%(default)s)')
+    p.add_argument('--ncpus', type=int, default=multiprocessing.cpu_count(),
+        help='Number of worker processes (default=%(default)s)')
+    p.add_argument('--collect', help=argparse.SUPPRESS)
+    p.add_argument('--package', help=argparse.SUPPRESS)
+    return p.parse_args()
+
+def main():
+    cmdargs = getCmdargs()
+    if cmdargs.collect is not None:
+        seeds = list(range(cmdargs.firstseed, cmdargs.firstseed + cmdargs.nseeds))
+        collect(cmdargs.package, cmdargs.set, cmdargs.days, cmdargs.interval, seeds,
+                cmdargs.ncpus, cmdargs.collect)
+        return
+
+    tempDir = tempfile.mkdtemp(prefix='equivalence')
+    try:
+        referenceDir = None
+        if cmdargs.reference != 'worktree':
+            referenceDir = os.path.join(tempDir, 'reference')
+            os.mkdir(referenceDir)
+            extractRevision(cmdargs.reference, referenceDir)
+        # different seeds for each so the tests see independent samples
+        referenceSeeds = list(range(cmdargs.firstseed, cmdargs.firstseed + cmdargs.nseeds))
+        candidateSeeds = [seed + cmdargs.nseeds for seed in referenceSeeds]
+        reference, referenceTime = runCollect(referenceDir, cmdargs.refset,
+                cmdargs.days, cmdargs.interval, referenceSeeds, cmdargs.ncpus,
+                os.path.join(tempDir, 'reference.npz'))
+        candidate, candidateTime = runCollect(None, cmdargs.set, cmdargs.days,
+                cmdargs.interval, candidateSeeds, cmdargs.ncpus, os.path.join(tempDir, 'candidate.npz'))
+    finally:
+        shutil.rmtree(tempDir)
+
+    tests = compareResults(reference, candidate, cmdargs.alpha, cmdargs.maxdp,
+                cmdargs.maxd, cmdargs.maxstepd)
+    limit = cmdargs.alpha / len(tests)
+    print('Reference {} ({:.1f}s), candidate this tree ({:.1f}s), {} realisations each'.format(
+            cmdargs.reference, referenceTime, candidateTime, cmdargs.nseeds))
+    print('{:>16s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}'.format('', 'reference',
+            'candidate', 'p', 'difference', 'bound', 'tolerance'))
+    different = []
+    inconclusive = []
+    for (name, referenceMean, candidateMean, pValue, difference, bound,
+            tolerance) in tests:
+        flag = ''
+        if pValue < limit and difference > tolerance:
+            flag = ' *'
+            different.append(name)
+        elif not bound <= tolerance:
+            flag = ' ?'
+            inconclusive.append(name)
+        print('{:>16s} {:10.4g} {:10.4g} {:10.4f} {:10.3f} {:10.3f} {:10.3f}{}'.format(name,
+                referenceMean, candidateMean, pValue, difference, bound, tolerance, flag))
+
+    if len(different) > 0:
+        print('FAILED: {} differ (p < {:.4f} and beyond the tolerance)'.format(
+                ', '.join(different), limit))
+        sys.exit(EXIT_DIFFERENT)
+    if len(inconclusive) > 0:
+        print('INCONCLUSIVE: {} not shown within the tolerance at alpha {} '.format(
+                ', '.join(inconclusive), cmdargs.alpha) + '(try more seeds)')
+        sys.exit(EXIT_INCONCLUSIVE)
+    print('OK: all {} within the tolerance at alpha {}'.format(len(tests), cmdargs.alpha))
+
+if __name__ == '__main__':
+    main()